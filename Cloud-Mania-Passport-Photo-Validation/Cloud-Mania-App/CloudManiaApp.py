@@ -5,28 +5,44 @@ This script creates the main GUI window and handles the following operations:
     - Upload the Passport Photo to the specified S3 bucket.
     - Validate the Passport Photo using the AWS API Gateway endpoint.
     - Destroy the infrastructure using AWS CloudFormation.
+The GUI is only created when the script is run, so its functions can be imported without opening a window.
+boto3, requests and PIL are only imported once they are needed, and the AWS clients are created on a worker
+thread after the window is shown, so the window appears as fast as possible (see benchmarks/bench_startup.py).
+To validate photos in bulk without the GUI, use cloudmania_cli.py.
 '''
 
 # Importing necessary modules for the GUI, file dialog, AWS connection, and other utilities.
 import tkinter as tk
 # Importing the file dialog module from tkinter.
 from tkinter import filedialog
-# Importing the boto3 library for interacting with AWS services.
-import boto3
-# Importing the NoCredentialsError and PartialCredentialsError exceptions from the botocore library.
-from botocore.exceptions import NoCredentialsError, PartialCredentialsError
+# Importing the themed widgets module from tkinter for the batch status table.
+from tkinter import ttk
 # Importing the os module to work with the operating system.
 import os
 # Importing the load_dotenv function from the dotenv library.
 from dotenv import load_dotenv
-# Importing the Image and ImageTk modules from the PIL library.
-from PIL import Image, ImageTk
-# Importing the requests library to make HTTP requests.
-import requests
+# Importing the AWS clients module to create the AWS clients on first use.
+import aws_clients_module as aws
 # Importing the API Gateway module from the apigatewayv2_module.py file.
 import apigatewayv2_module as apigw
-# Importing the time module to sleep for a few seconds.
-import time
+# Importing the image module to load the previews of the photos.
+import image_module as image
+# Importing the pipeline module to upload and validate the photos.
+import pipeline_module as pipeline
+# Importing the pre-screen module to read the pre-screen thresholds.
+import prescreen_module as prescreen
+# Importing the metrics module to show where the time of a validation went.
+import metrics_module as metrics
+# Importing the validation module to open the HTTP session ahead of the first validation.
+import validation_module as validation
+# Importing the CloudFormation module to deploy the stack.
+import cloudformation_module as cfn
+# Importing the stack monitor module to follow the progress of the stack operations.
+import stack_monitor_module as stack_monitor
+# Importing the result cache module to skip the photos that have already been validated.
+import result_cache_module as cache
+# Importing the worker module to run the AWS and HTTP calls off the Tk main thread.
+import worker_module as worker
 
 '''
 You will  need to create a .env file in the root directory of the project and add the following environment variables:
@@ -45,8 +61,34 @@ AWS_REGION="us-east-1"
 # Name of AWS API Gateway that you created.
 API_NAME="ExampleAPIGateway-Name"
 
+# (Optional) Seconds a resolved invoke URL stays cached, and full path to the invoke URL cache file.
+INVOKE_URL_TTL_SECONDS="3600"
+INVOKE_URL_CACHE_PATH="/full/path/to/invoke-url-cache.json"
+
+# (Optional) Full path to the result cache database, and maximum number of results it keeps.
+RESULT_CACHE_PATH="/full/path/to/result-cache.sqlite3"
+RESULT_CACHE_MAX_ENTRIES="50000"
+
+# (Optional) Store the photos in S3 under the SHA-256 of their contents instead of their file name.
+CONTENT_ADDRESSED_KEYS="false"
+
+# (Optional) Normalize the photos (downscale, strip metadata, re-encode as JPEG) before uploading them.
+NORMALIZE_IMAGES="false"
+
+# (Optional) Check the photos locally (resolution, aspect ratio, blur, exposure) and don't upload the unusable ones,
+# and full path to a JSON file overriding the default pre-screen thresholds.
+PRESCREEN_IMAGES="false"
+PRESCREEN_THRESHOLDS_PATH="/full/path/to/prescreen-thresholds.json"
+
 # Full path to CloudFormation templates.
 CF_TEMPLATE_PATH="/fill/path/to/cloudformation/templates"
+
+# (Optional) Deploy mode: "single-pass" (default) deploys the final template with one change set,
+# "step-by-step" creates the stack with the first template and updates it with each of the others.
+DEPLOY_MODE="single-pass"
+
+# (Optional) Full path to the JSON Lines file the deploy timing reports are appended to.
+DEPLOY_REPORT_PATH="/full/path/to/deploy-timings.jsonl"
 '''
 # Load the environment variables for AWS credentials from the specified path.
 load_dotenv(os.environ.get("AWS_ENV_PATH"))
@@ -60,73 +102,100 @@ API_NAME = os.environ.get("API_NAME")
 # Template path for the CloudFormation templates.
 CF_TEMPLATE_PATH = os.environ.get("CF_TEMPLATE_PATH")
 
-# List of allowed extensions for images.
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-
-# Initialize the S3 client with the provided credentials and region.
-s3 = boto3.client(
-    's3',
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_REGION,
-)
-
-# Initialize the CloudFormation client with the provided credentials and region.
-cf = boto3.client(
-    'cloudformation',
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_REGION,
-)
-
-# Global variable to track the completion status of the check_stack_status function
-stack_status_complete = False
-
-# Function to check the status of the stack.
-def check_stack_status(stack_name, desired_status):
-    # Using the global variable to track the completion status of the check_stack_status function
-    global stack_status_complete
-    # Check if the stack exists.
+# Whether the photos are stored in S3 under the SHA-256 of their contents instead of their file name.
+CONTENT_ADDRESSED_KEYS = os.environ.get("CONTENT_ADDRESSED_KEYS", "false").lower() == "true"
+# Maximum number of validation results kept in the result cache.
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", cache.DEFAULT_MAX_ENTRIES))
+
+# Whether the photos are normalized (downscaled, stripped and re-encoded as JPEG) before they are uploaded.
+NORMALIZE_IMAGES = os.environ.get("NORMALIZE_IMAGES", "false").lower() == "true"
+
+# Whether the photos are pre-screened locally before they are uploaded, and the thresholds of the pre-screen.
+PRESCREEN_IMAGES = os.environ.get("PRESCREEN_IMAGES", "false").lower() == "true"
+PRESCREEN_THRESHOLDS = prescreen.load_thresholds(os.environ.get("PRESCREEN_THRESHOLDS_PATH"))
+
+# Default deploy mode, either "single-pass" or "step-by-step".
+DEPLOY_MODE = os.environ.get("DEPLOY_MODE", cfn.DEPLOY_MODE_SINGLE_PASS)
+
+# Cache of the validation results, keyed by the SHA-256 of the photos, opened when the app starts.
+result_cache = None
+# Pipeline uploading and validating the single photos, created on first use.
+single_pipeline = None
+# Cache of the previews of the photos, so a photo selected again is previewed straight away.
+preview_cache = image.PreviewCache()
+
+# Function to set the credentials and region the AWS clients are created with, on first use.
+def configure_clients():
+    aws.configure(
+        aws_access_key_id=AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+        region_name=AWS_REGION,
+    )
+
+# Function to import the heavy libraries and create the AWS clients ahead of their first use. Runs on a worker thread.
+def warm_up():
+    aws.warm_up('s3', 'cloudformation', 'apigatewayv2')
+    # Importing the requests library and PIL now, so the first validation and preview don't wait for them.
+    validation.get_http_session()
+    import PIL.ImageTk
+
+# Function to show a message in the GUI. Must be called on the Tk main thread.
+def show_message(text, fg="black"):
+    message_label.config(text=text, fg=fg)
+
+# Function to show a message in the GUI from a worker thread.
+def post_message(text, fg="black"):
+    # Hand the message to the Tk main thread through the worker queue.
+    worker.post(show_message, text, fg)
+
+# Function to show the latest status of every stack resource in the GUI. Must be called on the Tk main thread.
+def show_resource_progress(resources):
+    resource_listbox.delete(0, tk.END)
+    for logical_id, status in resources.items():
+        resource_listbox.insert(tk.END, f"{logical_id}: {status}")
+        # Highlight the failed resources.
+        if status.endswith("_FAILED"):
+            resource_listbox.itemconfig(tk.END, fg="red")
+    # Keep the latest resources in view.
+    resource_listbox.see(tk.END)
+
+# Function to show the progress of the stack resources in the GUI from a worker thread.
+def post_resource_progress(event, monitor):
+    # Hand a copy of the resource statuses to the Tk main thread.
+    worker.post(show_resource_progress, dict(monitor.resources))
+
+# Function to wait until the stack reaches the desired status. Runs on a worker thread.
+def check_stack_status(stack_name, desired_status, started_after=None):
+    # Follow the stack events until the current stack operation ends, ignoring the ones older than started_after.
+    cloudformation = aws.get_client('cloudformation')
+    monitor = stack_monitor.StackEventMonitor(cloudformation, stack_name, started_after=started_after)
     try:
-        # Get the stack status.
-        response = cf.describe_stacks(StackName=stack_name)
-        current_status = response['Stacks'][0]['StackStatus']
-        # Check if the stack status is the desired status.
-        if current_status == desired_status:
-            message_label.config(text=f"Stack {stack_name} is {desired_status}", fg="green")
-            stack_status_complete = True
-            return True
-        # Check if the stack status is in progress.
-        elif current_status in ["ROLLBACK_COMPLETE", "UPDATE_ROLLBACK_COMPLETE", "DELETE_FAILED"]:
-            message_label.config(text="Stack update failed and was rolled back", fg="red")
-            stack_status_complete = True
-            return False
-        # Check if the stack status is in progress.
-        elif current_status == "DELETE_COMPLETE":
-            message_label.config(text=f"Stack {stack_name} has been deleted", fg="green")
-            stack_status_complete = True
-            return True
-        # Check if the stack status is in progress.
-        else:
-            message_label.config(text=f"Waiting for stack {stack_name} to reach status {desired_status}...", fg="blue")
-            root.after(5000, check_stack_status, stack_name, desired_status)
-    # If the stack does not exist, show a message in the GUI.
-    except cf.exceptions.ClientError as e:
-        message_label.config(text=f"Failed to get stack status: {e}", fg="red")
-        stack_status_complete = True
+        return monitor.wait(desired_status, on_event=post_resource_progress, on_progress=post_message)
+    # If the stack events can't be read, show a message in the GUI.
+    except cloudformation.exceptions.ClientError as e:
+        post_message(f"Failed to get stack status: {e}", "red")
         return False
 
+# Function to deploy the stack with the selected deploy mode. Runs on a worker thread.
+def deploy_infra(stack_name, mode):
+    # Deploy the stack and return its timing report.
+    report = cfn.deploy_stack(aws.get_client('cloudformation'), stack_name, CF_TEMPLATE_PATH, mode, check_stack_status, post_message)
+    # A new deployment may have created a new API, so forget the cached invoke URL.
+    if report['result'] == "SUCCESS":
+        apigw.invalidate_invoke_url_cache(API_NAME)
+    return report
+
 # Function to create the infrastructure.
 def create_infra():
     """
-    This function creates and updates the AWS CloudFormation stack with various templates.
+    This function creates or updates the AWS CloudFormation stack.
     It takes the stack name from the GUI entry and checks if the stack name is provided.
-    If the stack exists, it shows a message in the GUI.
-    If the stack creation fails, it shows a message in the GUI.
-    If the stack creation is successful, it shows a message in the GUI.
-    It updates the stack with each template and checks the status of the stack.
-    If the stack update fails, it shows a message in the GUI.
-    If the stack update is successful, it shows a message in the GUI.
+    By default the final template is deployed in a single pass with one change set. If the
+    'Step-by-step deploy' checkbox is checked, the stack is created with the first template and
+    updated with each of the other templates one after the other.
+    The deployment itself runs on a worker thread (see deploy_infra), so the GUI stays responsive.
+    If the deployment fails, it shows a message in the GUI.
+    Once the deployment has finished, its timing report is shown in the results label.
     After the infrastructure has been created and updated successfully, it:
         - disables the:
             - stack_name_entry
@@ -134,62 +203,53 @@ def create_infra():
         - enables the:
             - bucket_entry
             - upload_button
+            - batch_files_button
+            - batch_folder_button
             - destroy_checkbox
     """
-    global stack_status_complete
     stack_name = stack_name_entry.get()
     if not stack_name:
-        message_label.config(text="Please provide a stack name.", fg="red")
+        show_message("Please provide a stack name.", "red")
         return
-    try:
-        cf.create_stack(
-            StackName=stack_name,
-            TemplateBody=open(f"{CF_TEMPLATE_PATH}/01-cloud-mania-s3-template.yaml", 'r').read(),
-            Capabilities=["CAPABILITY_NAMED_IAM"]
-        )
-        stack_status_complete = False
-        check_stack_status(stack_name, "CREATE_COMPLETE")
-        while not stack_status_complete:
-            root.update_idletasks()
-            root.update()
-        if not stack_status_complete:
-            message_label.config(text="Failed to create stack")
-            return
-        else:
-            message_label.config(text="Successfully created stack with initial template.", fg="green")
-        templates = [
-            "02-cloud-mania-add-s3-notification.yaml",
-            "03-cloud-mania-add-sns-topic.yaml",
-            "04-cloud-mania-add-lambda-destination.yaml",
-            "05-cloud-mania-add-image-request-function.yaml",
-            "06-cloud-mania-add-api-gateway-endpoint.yaml",
-            "07-cloud-mania-add-s3-deletion-function.yaml"
-        ]
-        for template in templates:
-            template_path = f"{CF_TEMPLATE_PATH}/{template}"
-            cf.update_stack(
-                StackName=stack_name,
-                TemplateBody=open(template_path, 'r').read(),
-                Capabilities=["CAPABILITY_NAMED_IAM"]
-            )
-            stack_status_complete = False
-            check_stack_status(stack_name, "UPDATE_COMPLETE")
-            while not stack_status_complete:
-                root.update_idletasks()
-                root.update()
-            if not stack_status_complete:
-                message_label.config(text=f"Failed to update stack with template: {template}", fg="red")
-                return
-            else:
-                message_label.config(text=f"Successfully updated stack with template: {template}", fg="green")
-        message_label.config(text="Infrastructure created and updated successfully!\n Please, upload Passport Photo for validation.", fg="green")
-        stack_name_entry.config(state=tk.DISABLED)
-        create_button.config(state=tk.DISABLED)
-        bucket_entry.config(state=tk.NORMAL)
-        upload_button.config(state=tk.NORMAL)
-        destroy_checkbox.config(state=tk.NORMAL)
-    except cf.exceptions.ClientError as e:
-        message_label.config(text=f"Failed to create or update stack: {e}", fg="red")
+    # Disable the create_button so the deployment can't be started twice.
+    create_button.config(state=tk.DISABLED)
+    # Clear the resource progress of the previous stack operation.
+    resource_listbox.delete(0, tk.END)
+    # Get the deploy mode from the deploy mode checkbox.
+    mode = cfn.DEPLOY_MODE_STEP_BY_STEP if step_by_step_var.get() else cfn.DEPLOY_MODE_SINGLE_PASS
+    show_message(f"Deploying stack {stack_name} ({mode})...", "blue")
+    worker.submit(deploy_infra, stack_name, mode, on_success=on_infra_created, on_error=on_infra_error)
+
+# Callback function called on the Tk main thread with the timing report once the deployment has finished.
+def on_infra_created(report):
+    # Show how long the deployment took.
+    results_label.config(text=cfn.format_deploy_report(report), fg="black")
+    # If the deployment failed, let the user try again.
+    if report['result'] == "FAILED":
+        create_button.config(state=tk.NORMAL)
+        return
+    show_message("Infrastructure created and updated successfully!\n Please, upload Passport Photo for validation.", "green")
+    stack_name_entry.config(state=tk.DISABLED)
+    create_button.config(state=tk.DISABLED)
+    bucket_entry.config(state=tk.NORMAL)
+    upload_button.config(state=tk.NORMAL)
+    batch_files_button.config(state=tk.NORMAL)
+    batch_folder_button.config(state=tk.NORMAL)
+    destroy_checkbox.config(state=tk.NORMAL)
+
+# Callback function called on the Tk main thread when the deployment raised an error.
+def on_infra_error(error):
+    show_message(f"Failed to create or update stack: {error}", "red")
+    create_button.config(state=tk.NORMAL)
+
+# Function to delete the stack and wait for the deletion to complete. Runs on a worker thread.
+def delete_infra(stack_name):
+    aws.get_client('cloudformation').delete_stack(StackName=stack_name)
+    deleted = check_stack_status(stack_name, "DELETE_COMPLETE")
+    # The API is gone with the stack, so its cached invoke URL is no longer valid.
+    if deleted:
+        apigw.invalidate_invoke_url_cache(API_NAME)
+    return deleted
 
 # Function to destroy the infrastructure.
 def destroy_infra():
@@ -199,118 +259,151 @@ def destroy_infra():
     stack_name = stack_name_entry.get()  # Get the stack name from the GUI entry
     # Check if the stack name is provided.
     if not stack_name:
-        message_label.config(text="Please provide a stack name.", fg="red")
+        show_message("Please provide a stack name.", "red")
         return
-    # Check if the stack exists.
-    try:
-        cf.delete_stack(StackName=stack_name)
-        check_stack_status(stack_name, "DELETE_COMPLETE")
-    # If the stack does not exist, show a message in the GUI.
-    except cf.exceptions.ClientError as e:
-        message_label.config(text=f"Failed to initiate infrastructure destruction: {e}", fg="red")
-
-# Function to check if the file is an image.
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-# Function to show a preview of the selected image in the GUI.
-def show_preview(file_path):
+    # Clear the resource progress of the previous stack operation.
+    resource_listbox.delete(0, tk.END)
+    # Delete the stack on a worker thread and show a message in the GUI if it fails.
+    worker.submit(
+        delete_infra, stack_name,
+        on_error=lambda e: show_message(f"Failed to initiate infrastructure destruction: {e}", "red")
+    )
+
+# Function to show a preview of the selected image in the given label (the preview label by default).
+def show_preview(file_path, label=None):
+    label = label or preview_label
+    # Remember which photo the label should show, so a preview that arrives late is ignored.
+    label.file_path = file_path
     # Check if the file is an allowed image
-    if allowed_file(file_path):
-        image = Image.open(file_path)
-        image.thumbnail((100, 100))
-        photo = ImageTk.PhotoImage(image)
-        preview_label.config(image=photo)
-        preview_label.image = photo
+    if pipeline.allowed_file(file_path):
+        # Load the preview on the worker thread pool, so big photos don't freeze the GUI.
+        worker.submit(
+            preview_cache.get, file_path,
+            on_success=lambda preview: show_preview_image(label, file_path, preview),
+            on_error=lambda e: show_preview_text(label, file_path, f"Preview not available: {e}")
+        )
     # If the file is not an image, show a message in the GUI.
     else:
-        preview_label.config(text="Preview not available for non-image files.", fg="gray")
+        show_preview_text(label, file_path, "Preview not available for non-image files.")
+
+# Function to show a loaded preview in a label. Must be called on the Tk main thread.
+def show_preview_image(label, file_path, preview):
+    # Ignore the preview if another photo has been selected since, or if its window has been closed.
+    if not label.winfo_exists() or label.file_path != file_path:
+        return
+    # Importing ImageTk here, since PIL is only needed once there is a preview to show.
+    from PIL import ImageTk
+    # The Tk image must be created on the main thread, so only the conversion of the small preview happens here.
+    photo = ImageTk.PhotoImage(preview)
+    label.config(image=photo, text="")
+    # Keep a reference to the image, so it isn't garbage collected.
+    label.image = photo
+
+# Function to show a message instead of a preview in a label. Must be called on the Tk main thread.
+def show_preview_text(label, file_path, text):
+    if not label.winfo_exists() or label.file_path != file_path:
+        return
+    label.config(image="", text=text, fg="gray", wraplength=90)
+    label.image = None
+
+# Function to return the pipeline uploading and validating the single photos of the bucket.
+def get_single_pipeline(s3, bucket_name):
+    global single_pipeline
+    # Create a new pipeline the first time, or when the bucket name has changed.
+    if single_pipeline is None or single_pipeline.bucket_name != bucket_name:
+        if single_pipeline is not None:
+            single_pipeline.shutdown(wait=False)
+        single_pipeline = pipeline.ValidationPipeline(
+            s3, bucket_name,
+            get_invoke_url=lambda: get_invoke_url(API_NAME),
+            on_update=post_upload_status,
+            result_cache=result_cache,
+            content_addressed_keys=CONTENT_ADDRESSED_KEYS,
+            prescreen_thresholds=PRESCREEN_THRESHOLDS
+        )
+    return single_pipeline
 
 # Function to upload a file to the specified S3 bucket.
 def upload_file(file_path, bucket_name):
-    # Check if the bucket name is provided.
+    show_message(f'Uploading {os.path.basename(file_path)} to {bucket_name}...', "blue")
+    # Get the S3 client on a worker thread, since creating it the first time can take a while.
+    worker.submit(
+        aws.get_client, 's3',
+        on_success=lambda s3: submit_file(s3, file_path, bucket_name),
+        on_error=lambda e: show_message(f"Failed to create the S3 client: {e}", "red")
+    )
+
+# Function to hand a file to the single photo pipeline. Must be called on the Tk main thread.
+def submit_file(s3, file_path, bucket_name):
+    single = get_single_pipeline(s3, bucket_name)
+    # Normalize the photo before uploading it if the checkbox is checked.
+    single.normalize = bool(normalize_var.get())
+    # Pre-screen the photo before uploading it if the checkbox is checked.
+    single.prescreen = bool(prescreen_var.get())
+    # Upload and validate the file on the pipeline threads, and show the result once it is available.
+    single.submit(
+        file_path,
+        on_done=lambda result: worker.post(show_validation_result, result)
+    )
+
+# Function to show the progress of the single photo in the GUI. Called from the pipeline threads.
+def post_upload_status(file_path, status, detail):
     file_name = os.path.basename(file_path)
-    # Check if the file name is provided.
-    try:
-        # Upload the file to the specified bucket.
-        s3.upload_file(file_path, bucket_name, file_name)
-        # Show a message in the GUI.
-        upload_message = f'Successfully uploaded to {bucket_name}/{file_name}'
-        message_label.config(text=upload_message, fg="green")
-        # Check if the file is an allowed image
-        if allowed_file(file_name):
-            get_validation_result(file_name)
-    # If the bucket name is not provided, show a message in the GUI.
-    except (NoCredentialsError, PartialCredentialsError):
-        message_label.config(text='No credentials found.', fg="red")
-    # If the file name is not provided, show a message in the GUI.
-    except Exception as e:
-        message_label.config(text=f'An error occurred: {e}', fg="red")
-
-# Function to get API information and to return the 'invoke_url'.
-def get_invoke_url(api_name):
-    # Get all the HTTP APIs in the account
-    http_apis = apigw.list_http_apis()
-    for api in http_apis:
-        if api['Name'] == api_name:
-            api_id = api['ApiId']
-            break
-    # Check if the API exists
-    else:
-        message_label.config(text=f"No API found with name {api_name}", fg="red")
-        return None
+    if status == pipeline.STATUS_UPLOADING:
+        post_message(f'Uploading {file_name}...', "blue")
+    elif status == pipeline.STATUS_VALIDATING:
+        post_message(f'Successfully uploaded {file_name}. Waiting for the validation result...\n{detail}', "green")
 
-    # Get all the stages for the API
-    api_stages = apigw.get_api_stages(api_id)
-    if not api_stages:
-        message_label.config(text=f"No stages found for API ID: {api_id}", fg="red")
+# Function to get API information and to return the 'invoke_url'. Runs on a worker thread.
+def get_invoke_url(api_name):
+    # Resolve the invoke URL from the invoke URL cache, or from API Gateway if it isn't cached.
+    try:
+        return apigw.resolve_invoke_url(api_name, AWS_REGION)
+    # If the API or its stage doesn't exist, show a message in the GUI.
+    except LookupError as e:
+        post_message(str(e), "red")
         return None
 
-    # Assuming you're interested in the first stage of the API
-    stage_name = api_stages[0]['StageName']
-    # Get the current region
-    region = boto3.session.Session().region_name  # Get current region
-    # Construct the invoke URL
-    invoke_url = apigw.construct_invoke_url(api_id, region, stage_name)
-
-    return invoke_url
-
-# Function to get validation result for the uploaded image.
-def get_validation_result(image_name):
-    invoke_url = get_invoke_url(API_NAME)  # Get the invoke URL dynamically 
-    # Sleep for 5 seconds to allow the API to be deployed.
-    time.sleep(5)
-    # Check if the invoke URL is available.
-    if not invoke_url:
-        message_label.config(text='Failed to get the invoke URL.', fg="red")
+# Callback function called on the Tk main thread with the result of the uploaded photo.
+def show_validation_result(result):
+    file_name = os.path.basename(result['file'])
+    # If the photo couldn't be uploaded or validated, show the error in the GUI.
+    if result['status'] == pipeline.STATUS_ERROR:
+        show_message(f"An error occurred with {file_name}: {result['error']}", "red")
         return
-    # Construct the URL to make a GET request to the API endpoint.
-    url = f'{invoke_url}/images?imageName={image_name}'
-    # Make a GET request to the API endpoint.
-    response = requests.get(url)
-    # Check if the response is successful.
-    if response.status_code == 200:
-        # Get the response JSON.
-        response_json = response.json()
-        # Get the validation result from the response.
-        validation_result = response_json.get("ValidationResult")
-        # Check if the validation result is FAIL.
-        if validation_result == "FAIL":
-            failure_reasons = response_json.get("FailureReasons")
-            message = f'Validation Result: {validation_result}\nFailure Reasons: {failure_reasons}'
-            results_label.config(text=message, fg="red")
-        # Check if the validation result is PASS.
-        else:
-            validation_message = f'Validation Result: {validation_result}'
-            results_label.config(text=validation_message, fg="blue")
+    # Show where the result comes from and how long it took.
+    if result.get('prescreened'):
+        stats = result['prescreen']
+        show_message(f"{file_name} rejected locally by the pre-screen in {stats['seconds'] * 1000:.0f} ms, "
+                     f"without uploading it ({stats['width']}x{stats['height']}, blur score {stats['blur_score']:.0f}, "
+                     f"mean luminance {stats['mean_luminance']:.0f})", "red")
+    elif result['cached']:
+        stats = result_cache.stats()
+        show_message(f"Validation result of {file_name} found in the result cache "
+                     f"({stats['hits']} hits / {stats['misses']} misses)", "green")
+    else:
+        # Break the time down by phase (upload, invoke URL lookup, wait for the Lambda, result GET).
+        show_message(f"Validation result of {file_name} received in {result['seconds']:.1f}s\n"
+                     f"{metrics.format_breakdown(result['timings'])}", "green")
+    # Check if the validation result is FAIL.
+    if result['status'] == pipeline.STATUS_FAIL:
+        message = f"Validation Result: {result['status']}\nFailure Reasons: {result['failure_reasons']}"
+        results_label.config(text=message, fg="red")
+    # Only show PASS for a photo that passed.
+    elif result['status'] == pipeline.STATUS_PASS:
+        results_label.config(text=f"Validation Result: {result['status']}", fg="blue")
+    # Any other status is shown as an error, never as a PASS.
+    else:
+        results_label.config(text=f"Unexpected validation status: {result['status']}", fg="red")
 
 # Function to refresh the GUI.
 def refresh_gui():
     # Resetting the preview label.
-    preview_label.config(image=None)
+    preview_label.config(image="", text="")
     # Resetting the image in the preview label.
     preview_label.image=None
+    # Forgetting the photo of the preview label, so a preview still loading isn't shown.
+    preview_label.file_path = None
     # Resetting the message label.
     message_label.config(text="")
     # Resetting the results label.
@@ -323,7 +416,7 @@ def open_file_dialog():
     file_path = filedialog.askopenfilename()
     bucket_name = bucket_entry.get()
     # Check if the file is an allowed image
-    if file_path and bucket_name and allowed_file(file_path):
+    if file_path and bucket_name and pipeline.allowed_file(file_path):
         # Disable the bucket_entry after the file dialog has been used
         bucket_entry.config(state=tk.DISABLED)
         # Show a preview of the selected image in the GUI.
@@ -331,6 +424,126 @@ def open_file_dialog():
         # Upload the file to the specified bucket.
         upload_file(file_path, bucket_name)
         
+# Function to upload and validate a batch of files.
+def start_batch(file_paths):
+    bucket_name = bucket_entry.get()
+    # Keep only the allowed images.
+    file_paths = [file_path for file_path in file_paths if pipeline.allowed_file(file_path)]
+    if not file_paths or not bucket_name:
+        show_message("Please provide a bucket name and select at least one image.", "red")
+        return
+    # Disable the bucket_entry after the file dialog has been used
+    bucket_entry.config(state=tk.DISABLED)
+    show_message(f"Uploading {len(file_paths)} files to {bucket_name}...", "blue")
+    # Get the S3 client on a worker thread, since creating it the first time can take a while.
+    worker.submit(
+        aws.get_client, 's3',
+        on_success=lambda s3: open_batch_window(s3, bucket_name, file_paths),
+        on_error=lambda e: show_message(f"Failed to create the S3 client: {e}", "red")
+    )
+
+# Function to open the batch window and upload and validate the files. Must be called on the Tk main thread.
+def open_batch_window(s3, bucket_name, file_paths):
+    # Creating the batch window with a status table of the files.
+    batch_window = tk.Toplevel(root)
+    batch_window.title(f"Batch Validation ({len(file_paths)} files)")
+    batch_window.geometry("700x450")
+    # Creating the label showing the throughput and the PASS/FAIL counts.
+    stats_label = tk.Label(batch_window, text="", justify="left")
+    stats_label.pack(pady=5, padx=10, anchor="w")
+    # Creating the preview of the file selected in the status table.
+    batch_preview_frame = tk.Frame(batch_window, bd=2, relief="ridge", width=100, height=100)
+    batch_preview_frame.pack(side="right", anchor="n", pady=5, padx=10)
+    batch_preview_frame.pack_propagate(False)
+    batch_preview_label = tk.Label(batch_preview_frame)
+    batch_preview_label.pack(pady=10)
+    # Creating the status table with one row per file.
+    table = ttk.Treeview(batch_window, columns=("file", "status", "detail"), show="headings")
+    table.heading("file", text="File")
+    table.heading("status", text="Status")
+    table.heading("detail", text="Details")
+    table.column("file", width=200)
+    table.column("status", width=90)
+    table.column("detail", width=380)
+    # Creating the scrollbar of the status table.
+    table_scrollbar = tk.Scrollbar(batch_window, command=table.yview)
+    table.config(yscrollcommand=table_scrollbar.set)
+    table_scrollbar.pack(side="right", fill="y")
+    table.pack(fill="both", expand=True, padx=10, pady=5)
+    # Row of the status table of each file.
+    rows = {file_path: table.insert("", tk.END, values=(os.path.basename(file_path), "", "")) for file_path in file_paths}
+    # File of each row of the status table.
+    row_files = {row: file_path for file_path, row in rows.items()}
+    # Show the preview of the file selected in the status table.
+    table.bind("<<TreeviewSelect>>", lambda event: [show_preview(row_files[row], batch_preview_label) for row in table.selection()[:1]])
+    # Colors of the final statuses in the status table.
+    table.tag_configure(pipeline.STATUS_PASS, foreground="blue")
+    table.tag_configure(pipeline.STATUS_FAIL, foreground="red")
+    table.tag_configure(pipeline.STATUS_ERROR, foreground="red")
+
+    # Function to update the row of a file and the statistics. Must be called on the Tk main thread.
+    def show_file_status(file_path, status, detail):
+        stats = uploader.stats()
+        # Release the threads of the pipeline once every file of the batch has finished.
+        if stats['finished'] == stats['total']:
+            uploader.shutdown(wait=False)
+        # The batch window may have been closed while the batch was running.
+        if not batch_window.winfo_exists():
+            return
+        table.item(rows[file_path], values=(os.path.basename(file_path), status, detail), tags=(status,))
+        stats_label.config(text=(
+            f"Finished {stats['finished']}/{stats['total']} in {stats['elapsed_seconds']:.1f}s  |  "
+            f"{stats['files_per_second']:.2f} files/s  |  {stats['megabytes_per_second']:.2f} MB/s\n"
+            f"PASS: {stats['passed']}  |  FAIL: {stats['failed']}  |  ERROR: {stats['errors']}  |  "
+            f"Saved by normalization: {stats['bytes_saved'] / (1024 * 1024):.1f} MB"
+            f"{format_prescreen(stats)}"
+            f"{format_latency(uploader.latency_summary())}"
+        ))
+
+    # Upload and validate the files on the batch thread pools, and update the table on the Tk main thread.
+    uploader = pipeline.ValidationPipeline(
+        s3, bucket_name,
+        get_invoke_url=lambda: get_invoke_url(API_NAME),
+        on_update=lambda file_path, status, detail: worker.post(show_file_status, file_path, status, detail),
+        result_cache=result_cache,
+        content_addressed_keys=CONTENT_ADDRESSED_KEYS,
+        normalize=bool(normalize_var.get()),
+        prescreen=bool(prescreen_var.get()),
+        prescreen_thresholds=PRESCREEN_THRESHOLDS
+    )
+    uploader.start(file_paths)
+
+# Function to format the number of photos rejected by the pre-screen and the cloud calls it avoided.
+def format_prescreen(stats):
+    if not stats['prescreen_rejected']:
+        return ""
+    return (f"  |  Rejected locally: {stats['prescreen_rejected']} "
+            f"({stats['cloud_calls_avoided']} cloud calls avoided)")
+
+# Function to format the p50/p95 of the total time and of the slowest phases of a batch.
+def format_latency(summary):
+    if "total" not in summary:
+        return ""
+    phases = [phase for phase in ("upload", "result_wait", "result_get") if phase in summary]
+    return "\nLatency p50/p95: " + "  |  ".join(
+        f"{metrics.PHASES[phase]} {summary[phase]['p50']:.2f}s/{summary[phase]['p95']:.2f}s"
+        for phase in ["total"] + phases
+    )
+
+# Function to select several files and upload and validate them as a batch.
+def open_batch_files_dialog():
+    refresh_gui()
+    file_paths = filedialog.askopenfilenames()
+    if file_paths:
+        start_batch(list(file_paths))
+
+# Function to select a folder and upload and validate all of its images as a batch.
+def open_batch_folder_dialog():
+    refresh_gui()
+    folder = filedialog.askdirectory()
+    if folder:
+        start_batch(pipeline.list_image_files(folder))
+
 # Callback function to enable or disable the create_button based on the stack_name_entry content.
 def on_entry_change(*args):
     # Check if the stack_name_entry is empty.
@@ -351,98 +564,184 @@ def toggle_destroy_button():
         stack_name_entry.config(state=tk.DISABLED)
         bucket_entry.config(state=tk.DISABLED)
         upload_button.config(state=tk.DISABLED)
+        batch_files_button.config(state=tk.DISABLED)
+        batch_folder_button.config(state=tk.DISABLED)
     # If the destroy_check_var is not checked, disable the destroy_button.
     else:
         # Disable the destroy_button if the destroy_check_var is not checked.
         destroy_button.config(state=tk.DISABLED)
         # Enable the create_button and bucket_entry if the destroy_check_var is not checked.
         upload_button.config(state=tk.NORMAL)
+        batch_files_button.config(state=tk.NORMAL)
+        batch_folder_button.config(state=tk.NORMAL)
         bucket_entry.config(state=tk.NORMAL)
     
-# Creating the main GUI window.
-root = tk.Tk()
-# Setting the title of the GUI window.
-root.title("Cloud Mania Passport Photo Validation App")
-# Setting the size of the GUI window.
-root.geometry("500x650")
-
-# Creating and placing the 'Stack Name' label and entry field on the GUI.
-stack_name_label = tk.Label(root, text="Stack Name (Required for Infra operations):")
-# Placing the Stack Name Label on the GUI.
-stack_name_label.pack(pady=5)
-
-# Using a StringVar to monitor changes in the entry widget
-stack_name_var = tk.StringVar()
-# Setting the initial value of the StringVar to an empty string
-stack_name_var.trace_add("write", on_entry_change)
-
-# Creating the Stack Name Entry field on the GUI.
-stack_name_entry = tk.Entry(root, textvariable=stack_name_var)
-# Placing the Stack Name Entry field on the GUI.
-stack_name_entry.pack(pady=5)
-
-# Creating and placing the 'Create Infra' button on the GUI.
-create_button = tk.Button(root, text="Create Infra", command=create_infra, state=tk.DISABLED)  # Initially disabled
-# Placing the Create Infra Button on the GUI.
-create_button.pack(pady=10)
-
-# Creating and placing the 'Destroy Infra' button on the GUI.
-destroy_check_var = tk.IntVar()
-# Setting the initial value of the IntVar to 0
-destroy_checkbox = tk.Checkbutton(root, text="Confirm Destruction", variable=destroy_check_var, command=toggle_destroy_button, state=tk.DISABLED)
-# Placing the Destroy Infra Button on the GUI.
-destroy_checkbox.pack(pady=5)
-
-# Creating and placing the 'Destroy Infra' button on the GUI.
-destroy_button = tk.Button(root, text="Destroy Infra", command=destroy_infra, state=tk.DISABLED)  # Initially disabled
-# Placing the Destroy Infra Button on the GUI.
-destroy_button.pack(pady=10)
-
-# Creating and placing the 'Bucket Name' label and entry field on the GUI.
-bucket_label = tk.Label(root, text="Bucket Name (Required):")
-# Placing the Bucket Name Label on the GUI.
-bucket_label.pack(pady=5)
-# Creating the Bucket Name Entry field on the GUI.
-bucket_entry = tk.Entry(root)
-# Placing the Bucket Name Entry field on the GUI.
-bucket_entry.pack(pady=5)
-# Initially disable the bucket_entry
-bucket_entry.config(state=tk.DISABLED)
-
-# Creating a frame for the message label within the main GUI window
-message_frame = tk.Frame(root, bd=2, relief="ridge")
-# Placing the message frame in the GUI.
-message_frame.pack(pady=10, padx=10, fill="x")
-# Creating and placing the message label to display messages on the GUI.
-message_label = tk.Label(message_frame, text="", wraplength=350)
-# Placing the message label in the frame.
-message_label.pack(pady=5)
-
-# Creating a frame for the image preview within the main GUI window
-# Setting the width and height to match the thumbnail size
-preview_frame = tk.Frame(root, bd=2, relief="ridge", width=100, height=100)
-# Placing the preview frame in the GUI.
-preview_frame.pack(pady=10, padx=10)
-# Ensure the frame doesn't shrink. If you want it to expand to fit the image, you can omit this.
-preview_frame.pack_propagate(False)
-# Creating and placing the label to display the image preview on the GUI.
-preview_label = tk.Label(preview_frame)
-# Placing the image preview label in the frame.
-preview_label.pack(pady=10)
-
-# Creating a frame for the results label within the main GUI window
-results_frame = tk.Frame(root, bd=2, relief="ridge")
-# Placing the results frame in the GUI.
-results_frame.pack(pady=10, padx=10, fill="x")
-# Creating and placing the results label to display validation results on the GUI.
-results_label = tk.Label(results_frame, text="", wraplength=350)
-# Placing the results label in the frame.
-results_label.pack(pady=5)
-
-# Creating and placing the 'Upload File' button on the GUI.
-upload_button = tk.Button(root, text="Upload File", command=open_file_dialog,  state=tk.DISABLED)  # Initially disabled
-# Placing the Upload File Button on the GUI.
-upload_button.pack(pady=10)
-
-# Start the Tkinter event loop to run the GUI.
-root.mainloop()
+# Function to create the main GUI window and its widgets.
+def build_gui():
+    global root, stack_name_var, stack_name_entry, create_button, step_by_step_var
+    global destroy_check_var, destroy_checkbox, destroy_button, bucket_entry, message_label
+    global resource_listbox, preview_label, results_label, upload_button, batch_files_button, batch_folder_button
+    global normalize_var, prescreen_var
+    # Creating the main GUI window.
+    root = tk.Tk()
+    # Setting the title of the GUI window.
+    root.title("Cloud Mania Passport Photo Validation App")
+    # Setting the size of the GUI window.
+    root.geometry("500x900")
+
+    # Creating and placing the 'Stack Name' label and entry field on the GUI.
+    stack_name_label = tk.Label(root, text="Stack Name (Required for Infra operations):")
+    # Placing the Stack Name Label on the GUI.
+    stack_name_label.pack(pady=5)
+
+    # Using a StringVar to monitor changes in the entry widget
+    stack_name_var = tk.StringVar()
+    # Setting the initial value of the StringVar to an empty string
+    stack_name_var.trace_add("write", on_entry_change)
+
+    # Creating the Stack Name Entry field on the GUI.
+    stack_name_entry = tk.Entry(root, textvariable=stack_name_var)
+    # Placing the Stack Name Entry field on the GUI.
+    stack_name_entry.pack(pady=5)
+
+    # Creating and placing the 'Create Infra' button on the GUI.
+    create_button = tk.Button(root, text="Create Infra", command=create_infra, state=tk.DISABLED)  # Initially disabled
+    # Placing the Create Infra Button on the GUI.
+    create_button.pack(pady=10)
+
+    # Creating and placing the 'Step-by-step deploy' checkbox on the GUI.
+    step_by_step_var = tk.IntVar(value=int(DEPLOY_MODE == cfn.DEPLOY_MODE_STEP_BY_STEP))
+    # Checking the checkbox deploys the templates one after the other instead of in a single pass.
+    step_by_step_checkbox = tk.Checkbutton(root, text="Step-by-step deploy (one update per template)", variable=step_by_step_var)
+    # Placing the Step-by-step deploy checkbox on the GUI.
+    step_by_step_checkbox.pack(pady=5)
+
+    # Creating and placing the 'Destroy Infra' button on the GUI.
+    destroy_check_var = tk.IntVar()
+    # Setting the initial value of the IntVar to 0
+    destroy_checkbox = tk.Checkbutton(root, text="Confirm Destruction", variable=destroy_check_var, command=toggle_destroy_button, state=tk.DISABLED)
+    # Placing the Destroy Infra Button on the GUI.
+    destroy_checkbox.pack(pady=5)
+
+    # Creating and placing the 'Destroy Infra' button on the GUI.
+    destroy_button = tk.Button(root, text="Destroy Infra", command=destroy_infra, state=tk.DISABLED)  # Initially disabled
+    # Placing the Destroy Infra Button on the GUI.
+    destroy_button.pack(pady=10)
+
+    # Creating and placing the 'Bucket Name' label and entry field on the GUI.
+    bucket_label = tk.Label(root, text="Bucket Name (Required):")
+    # Placing the Bucket Name Label on the GUI.
+    bucket_label.pack(pady=5)
+    # Creating the Bucket Name Entry field on the GUI.
+    bucket_entry = tk.Entry(root)
+    # Placing the Bucket Name Entry field on the GUI.
+    bucket_entry.pack(pady=5)
+    # Initially disable the bucket_entry
+    bucket_entry.config(state=tk.DISABLED)
+
+    # Creating a frame for the message label within the main GUI window
+    message_frame = tk.Frame(root, bd=2, relief="ridge")
+    # Placing the message frame in the GUI.
+    message_frame.pack(pady=10, padx=10, fill="x")
+    # Creating and placing the message label to display messages on the GUI.
+    message_label = tk.Label(message_frame, text="", wraplength=350)
+    # Placing the message label in the frame.
+    message_label.pack(pady=5)
+
+    # Creating a frame for the stack resource progress within the main GUI window
+    resource_frame = tk.Frame(root, bd=2, relief="ridge")
+    # Placing the resource frame in the GUI.
+    resource_frame.pack(pady=5, padx=10, fill="x")
+    # Creating the scrollbar of the resource list.
+    resource_scrollbar = tk.Scrollbar(resource_frame)
+    # Placing the scrollbar on the right of the resource frame.
+    resource_scrollbar.pack(side="right", fill="y")
+    # Creating the list showing the latest status of every stack resource.
+    resource_listbox = tk.Listbox(resource_frame, height=5, yscrollcommand=resource_scrollbar.set)
+    # Placing the resource list in the frame.
+    resource_listbox.pack(side="left", fill="x", expand=True)
+    # Scrolling the resource list with the scrollbar.
+    resource_scrollbar.config(command=resource_listbox.yview)
+
+    # Creating a frame for the image preview within the main GUI window
+    # Setting the width and height to match the thumbnail size
+    preview_frame = tk.Frame(root, bd=2, relief="ridge", width=100, height=100)
+    # Placing the preview frame in the GUI.
+    preview_frame.pack(pady=10, padx=10)
+    # Ensure the frame doesn't shrink. If you want it to expand to fit the image, you can omit this.
+    preview_frame.pack_propagate(False)
+    # Creating and placing the label to display the image preview on the GUI.
+    preview_label = tk.Label(preview_frame)
+    # Placing the image preview label in the frame.
+    preview_label.pack(pady=10)
+
+    # Creating a frame for the results label within the main GUI window
+    results_frame = tk.Frame(root, bd=2, relief="ridge")
+    # Placing the results frame in the GUI.
+    results_frame.pack(pady=10, padx=10, fill="x")
+    # Creating and placing the results label to display validation results on the GUI.
+    results_label = tk.Label(results_frame, text="", wraplength=350)
+    # Placing the results label in the frame.
+    results_label.pack(pady=5)
+
+    # Creating and placing the 'Upload File' button on the GUI.
+    upload_button = tk.Button(root, text="Upload File", command=open_file_dialog,  state=tk.DISABLED)  # Initially disabled
+    # Placing the Upload File Button on the GUI.
+    upload_button.pack(pady=10)
+
+    # Creating and placing the 'Normalize photos' checkbox on the GUI.
+    normalize_var = tk.IntVar(value=int(NORMALIZE_IMAGES))
+    # Checking the checkbox downscales, strips and re-encodes the photos as JPEG before they are uploaded.
+    normalize_checkbox = tk.Checkbutton(root, text="Normalize photos before upload (smaller, faster)", variable=normalize_var)
+    # Placing the Normalize photos checkbox on the GUI.
+    normalize_checkbox.pack(pady=5)
+
+    # Creating and placing the 'Pre-screen photos' checkbox on the GUI.
+    prescreen_var = tk.IntVar(value=int(PRESCREEN_IMAGES))
+    # Checking the checkbox checks the photos locally and doesn't upload the ones that can't pass.
+    prescreen_checkbox = tk.Checkbutton(root, text="Pre-screen photos locally (skip unusable photos)", variable=prescreen_var)
+    # Placing the Pre-screen photos checkbox on the GUI.
+    prescreen_checkbox.pack(pady=5)
+
+    # Creating a frame for the batch upload buttons within the main GUI window
+    batch_frame = tk.Frame(root)
+    # Placing the batch frame in the GUI.
+    batch_frame.pack(pady=5)
+    # Creating and placing the 'Batch Upload Files' button on the GUI.
+    batch_files_button = tk.Button(batch_frame, text="Batch Upload Files", command=open_batch_files_dialog, state=tk.DISABLED)  # Initially disabled
+    # Placing the Batch Upload Files Button in the batch frame.
+    batch_files_button.pack(side="left", padx=5)
+    # Creating and placing the 'Batch Upload Folder' button on the GUI.
+    batch_folder_button = tk.Button(batch_frame, text="Batch Upload Folder", command=open_batch_folder_dialog, state=tk.DISABLED)  # Initially disabled
+    # Placing the Batch Upload Folder Button in the batch frame.
+    batch_folder_button.pack(side="left", padx=5)
+    # Stop the worker threads when the GUI window is closed.
+    root.protocol("WM_DELETE_WINDOW", on_close)
+    return root
+
+# Function to stop the worker threads and close the GUI window.
+def on_close():
+    worker.shutdown()
+    if single_pipeline is not None:
+        single_pipeline.shutdown(wait=False)
+    root.destroy()
+
+# Function to start the app.
+def main():
+    global result_cache
+    configure_clients()
+    result_cache = cache.ResultCache(max_entries=RESULT_CACHE_MAX_ENTRIES)
+    build_gui()
+    # Start draining the worker results from the Tkinter event loop.
+    worker.start(root)
+    # Once the window is shown, create the AWS clients in the background, and show why if that fails.
+    root.after_idle(lambda: worker.submit(
+        warm_up,
+        on_error=lambda e: show_message(f"Failed to prepare the AWS clients: {e}", "red")
+    ))
+    # Start the Tkinter event loop to run the GUI.
+    root.mainloop()
+
+# Start the app when the script is run, but not when it is imported.
+if __name__ == "__main__":
+    main()
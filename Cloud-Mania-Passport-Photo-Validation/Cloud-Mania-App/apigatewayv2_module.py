@@ -2,39 +2,70 @@
 I created this module to store the functions that interact with the AWS API Gateway service.
 
 Functions in this module:
-- list_http_apis: Returns a list of all HTTP APIs in the AWS API Gateway service.
+- list_http_apis: Returns a list of all HTTP APIs in the AWS API Gateway service, following every page of results.
 - get_api_details: Returns the details of a specific API in the AWS API Gateway service.
 - get_api_stages: Returns a list of stages for a specific API in the AWS API Gateway service.
 - construct_invoke_url: Constructs the invoke URL for a specific API, region, and stage.
 - datetime_serializer: Serializes datetime objects to ISO 8601 format strings.
 - display_apis_and_get_user_choice: Displays a list of APIs and prompts the user to choose one.
+- build_api_index: Returns a dictionary mapping the name of every HTTP API to its ID.
+- resolve_invoke_url: Returns the invoke URL of an API from its name, using the invoke URL cache when possible.
+- invalidate_invoke_url_cache: Removes an API (or every API) from the invoke URL cache.
+
+Resolved invoke URLs are cached in memory and on disk for INVOKE_URL_TTL_SECONDS (read from the environment
+when a URL is cached, so the .env file loaded by the app applies), so after the first lookup resolving the
+invoke URL doesn't make any request, even after the app restarts. The API Gateway client comes from
+aws_clients_module, so it uses the credentials and region the app was configured with.
 '''
 
-# Import the boto3 library for interacting with AWS services.
-import boto3
 # Import the datetime module to work with dates and times.
 from datetime import datetime
+# Import the json module to read and write the invoke URL cache file.
+import json
+# Import the os module to build the path to the invoke URL cache file.
+import os
+# Import the threading module to protect the invoke URL cache from concurrent lookups.
+import threading
+# Import the time module to expire the cached invoke URLs.
+import time
+# Import the AWS clients module to get the API Gateway client, created on first use.
+import aws_clients_module as aws
+
+# Default seconds a resolved invoke URL stays in the invoke URL cache.
+DEFAULT_INVOKE_URL_TTL_SECONDS = 3600
 
-# Initialize the AWS API Gateway client using boto3.
-client = boto3.client('apigatewayv2')
+# Default path of the file the invoke URL cache is saved to.
+DEFAULT_INVOKE_URL_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cloudmania", "invoke-url-cache.json")
+
+# In-memory invoke URL cache, mapping "region:api_name" to the cached entry. None until loaded from disk.
+invoke_url_cache = None
+# Lock protecting the invoke URL cache.
+invoke_url_cache_lock = threading.Lock()
 
 def list_http_apis():
-    # Make a request to AWS API Gateway to list all APIs.
-    response = client.get_apis()
-    # Filter out only the HTTP APIs from the response.
-    http_apis = [api for api in response['Items'] if api['ProtocolType'] == 'HTTP']
+    http_apis = []
+    kwargs = {}
+    while True:
+        # Make a request to AWS API Gateway to list one page of APIs.
+        response = aws.get_client('apigatewayv2').get_apis(**kwargs)
+        # Filter out only the HTTP APIs from the response.
+        http_apis.extend(api for api in response['Items'] if api['ProtocolType'] == 'HTTP')
+        # Stop once there are no more pages.
+        if not response.get('NextToken'):
+            break
+        kwargs['NextToken'] = response['NextToken']
     # Return the list of HTTP APIs.
     return http_apis
 
 def get_api_details(api_id):
     # Make a request to AWS API Gateway to get the details of a specific API using its ID.
-    response = client.get_api(ApiId=api_id)
+    response = aws.get_client('apigatewayv2').get_api(ApiId=api_id)
     # Return the details of the specified API.
     return response
 
 def get_api_stages(api_id):
     # Make a request to AWS API Gateway to get the stages of a specific API using its ID.
-    response = client.get_stages(ApiId=api_id)
+    response = aws.get_client('apigatewayv2').get_stages(ApiId=api_id)
     # Return the list of stages for the specified API.
     return response['Items']
 
@@ -60,3 +91,76 @@ def display_apis_and_get_user_choice(apis):
     user_choice = input("Enter the number of the API you want to use: ")
     # Convert the user's choice to a zero-indexed integer and return it.
     return int(user_choice) - 1  # Convert to 0-indexed
+
+def build_api_index():
+    # Map the name of every HTTP API in the account to its ID.
+    return {api['Name']: api['ApiId'] for api in list_http_apis()}
+
+def get_invoke_url_cache_path():
+    # Get the path of the invoke URL cache file from the environment, or use the default path.
+    return os.environ.get("INVOKE_URL_CACHE_PATH", DEFAULT_INVOKE_URL_CACHE_PATH)
+
+def get_invoke_url_ttl():
+    # Get the seconds a resolved invoke URL stays cached from the environment, or use the default.
+    # Read when an invoke URL is cached rather than on import, so the setting of the .env file loaded later applies.
+    return int(os.environ.get("INVOKE_URL_TTL_SECONDS", DEFAULT_INVOKE_URL_TTL_SECONDS))
+
+def load_invoke_url_cache():
+    # Load the invoke URL cache from disk the first time it is needed. Must be called with the lock held.
+    global invoke_url_cache
+    if invoke_url_cache is None:
+        try:
+            with open(get_invoke_url_cache_path(), 'r') as cache_file:
+                invoke_url_cache = json.load(cache_file)
+        # Start with an empty cache if the file doesn't exist yet or can't be read.
+        except (OSError, ValueError):
+            invoke_url_cache = {}
+    return invoke_url_cache
+
+def save_invoke_url_cache():
+    # Save the invoke URL cache to disk. Must be called with the lock held.
+    cache_path = get_invoke_url_cache_path()
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    # Write to a temporary file first, so a crash never leaves a half-written cache behind.
+    with open(f"{cache_path}.tmp", 'w') as cache_file:
+        json.dump(invoke_url_cache, cache_file)
+    os.replace(f"{cache_path}.tmp", cache_path)
+
+def resolve_invoke_url(api_name, region=None):
+    # Use the configured region unless another region is given.
+    region = region or aws.get_region()
+    cache_key = f"{region}:{api_name}"
+    # Return the cached invoke URL if it hasn't expired.
+    with invoke_url_cache_lock:
+        entry = load_invoke_url_cache().get(cache_key)
+        if entry and entry['expires_at'] > time.time():
+            return entry['invoke_url']
+
+    # Find the ID of the API from its name.
+    api_id = build_api_index().get(api_name)
+    if api_id is None:
+        raise LookupError(f"No API found with name {api_name}")
+    # Get all the stages for the API
+    api_stages = get_api_stages(api_id)
+    if not api_stages:
+        raise LookupError(f"No stages found for API ID: {api_id}")
+    # Assuming you're interested in the first stage of the API
+    invoke_url = construct_invoke_url(api_id, region, api_stages[0]['StageName'])
+
+    # Cache the invoke URL in memory and on disk.
+    with invoke_url_cache_lock:
+        load_invoke_url_cache()[cache_key] = {
+            'invoke_url': invoke_url,
+            'expires_at': time.time() + get_invoke_url_ttl()
+        }
+        save_invoke_url_cache()
+    return invoke_url
+
+def invalidate_invoke_url_cache(api_name=None):
+    # Remove the API from the cache in every region, or clear the whole cache if no API name is given.
+    with invoke_url_cache_lock:
+        cache = load_invoke_url_cache()
+        for cache_key in list(cache):
+            if api_name is None or cache_key.split(":", 1)[1] == api_name:
+                del cache[cache_key]
+        save_invoke_url_cache()
@@ -0,0 +1,71 @@
+'''
+I created this module to create the AWS clients of the app only when they are first needed.
+
+Importing boto3 and creating a client take a noticeable part of a second each, so doing it while the app
+imports its modules delays the first paint of the window. Instead, configure() records the credentials and
+region, and get_client() creates the clients on first use, all from one shared boto3 Session, and returns
+the same client every time after that. boto3 clients are thread-safe, so the worker threads share them.
+
+Functions in this module:
+- configure: Sets the credentials and region the clients are created with, and drops the existing clients.
+- get_session: Returns the boto3 Session shared by every client, created on first use.
+- get_client: Returns the client of an AWS service, created on first use.
+- get_region: Returns the region of the shared Session.
+- warm_up: Creates the clients of the given services ahead of their first use.
+'''
+
+# Import the threading module to create the Session and every client only once, even from several threads.
+import threading
+
+# Keyword arguments of the boto3 Session (credentials and region), set by configure().
+session_settings = {}
+# boto3 Session shared by every client, created on first use.
+session = None
+# Clients created so far, keyed by service name.
+clients = {}
+# Lock protecting the Session and the clients. Reentrant, since get_client() calls get_session().
+clients_lock = threading.RLock()
+
+def configure(aws_access_key_id=None, aws_secret_access_key=None, region_name=None):
+    # Record the settings of the Session. Settings left as None fall back to the usual boto3 configuration
+    # (environment variables, ~/.aws/config, instance profile).
+    global session, session_settings
+    with clients_lock:
+        session_settings = {
+            name: value for name, value in (
+                ("aws_access_key_id", aws_access_key_id),
+                ("aws_secret_access_key", aws_secret_access_key),
+                ("region_name", region_name)
+            ) if value
+        }
+        # The next client is created with the new settings.
+        session = None
+        clients.clear()
+
+def get_session():
+    # Create the shared Session the first time it is needed.
+    global session
+    with clients_lock:
+        if session is None:
+            # Import boto3 only now, so importing this module stays cheap.
+            import boto3
+            session = boto3.session.Session(**session_settings)
+        return session
+
+def get_client(service_name):
+    # Return the client of the service, creating it from the shared Session the first time.
+    with clients_lock:
+        client = clients.get(service_name)
+        if client is None:
+            client = get_session().client(service_name)
+            clients[service_name] = client
+        return client
+
+def get_region():
+    # Return the configured region, or the one boto3 found in its own configuration.
+    return get_session().region_name
+
+def warm_up(*service_names):
+    # Create the clients of the services now, e.g. on a worker thread once the window is shown.
+    for service_name in service_names:
+        get_client(service_name)
@@ -0,0 +1,267 @@
+'''
+I created this module to store the functions that deploy the Cloud Mania stack with AWS CloudFormation.
+
+There are two deploy modes:
+- single-pass: Deploys the final template (07) straight away with one change set. If the stack already exists,
+  the change set is a diff against the deployed stack, and nothing is executed when there are no changes.
+- step-by-step: The original deployment. Creates the stack with the first template (01) and then runs one
+  update per template (02 to 07), waiting for each update to complete.
+
+Every deployment is timed, and the timing report is appended to a JSON Lines file so the wall-clock deploy time
+of the two modes can be compared.
+
+Functions in this module:
+- read_template: Returns the body of a CloudFormation template.
+- get_stack_status: Returns the status of a stack, or None if the stack does not exist.
+- deploy_single_pass: Deploys the final template with a single change set.
+- deploy_step_by_step: Deploys the templates one after the other with one stack operation per template.
+- deploy_stack: Deploys the stack with the given mode and records a timing report.
+- format_deploy_report: Formats a timing report for display.
+- save_deploy_report: Appends a timing report to the timing report file.
+- load_deploy_reports: Loads all the timing reports from the timing report file.
+- compare_deploy_reports: Summarizes the wall-clock deploy time of each mode.
+'''
+
+# Import the json module to read and write the timing reports.
+import json
+# Import the os module to build the path to the timing report file.
+import os
+# Import the time module to time the deployment and wait for change sets.
+import time
+# Import the datetime module to timestamp the timing reports.
+from datetime import datetime, timezone
+
+# Names of the deploy modes.
+DEPLOY_MODE_SINGLE_PASS = "single-pass"
+DEPLOY_MODE_STEP_BY_STEP = "step-by-step"
+DEPLOY_MODES = (DEPLOY_MODE_SINGLE_PASS, DEPLOY_MODE_STEP_BY_STEP)
+
+# Templates in the order the step-by-step mode deploys them. The last one describes the whole application.
+TEMPLATES = [
+    "01-cloud-mania-s3-template.yaml",
+    "02-cloud-mania-add-s3-notification.yaml",
+    "03-cloud-mania-add-sns-topic.yaml",
+    "04-cloud-mania-add-lambda-destination.yaml",
+    "05-cloud-mania-add-image-request-function.yaml",
+    "06-cloud-mania-add-api-gateway-endpoint.yaml",
+    "07-cloud-mania-add-s3-deletion-function.yaml"
+]
+FINAL_TEMPLATE = TEMPLATES[-1]
+
+# Capabilities required by the templates, since they create named IAM roles.
+CAPABILITIES = ["CAPABILITY_NAMED_IAM"]
+
+# Seconds to wait between two checks of a change set that is being created.
+CHANGE_SET_POLL_SECONDS = 2
+
+# Status reasons CloudFormation gives for a change set that would not change anything.
+NO_CHANGES_REASONS = ("didn't contain changes", "No updates are to be performed")
+
+# Stack statuses from which a stack has to be created instead of updated.
+CREATE_FROM_STATUSES = (None, "REVIEW_IN_PROGRESS")
+
+# Default path of the file the timing reports are appended to.
+DEFAULT_DEPLOY_REPORT_PATH = os.path.join(os.path.expanduser("~"), ".cloudmania", "deploy-timings.jsonl")
+
+def read_template(template_path, template_name):
+    # Read the body of the template from the template directory.
+    with open(os.path.join(template_path, template_name), 'r') as template_file:
+        return template_file.read()
+
+def get_stack_status(cf, stack_name):
+    # Get the stack status, or None if the stack does not exist.
+    try:
+        response = cf.describe_stacks(StackName=stack_name)
+    except cf.exceptions.ClientError as e:
+        if "does not exist" in str(e):
+            return None
+        raise
+    return response['Stacks'][0]['StackStatus']
+
+def wait_for_change_set(cf, stack_name, change_set_name):
+    # Wait until CloudFormation has finished computing the change set, and return its description.
+    while True:
+        response = cf.describe_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+        if response['Status'] in ("CREATE_COMPLETE", "FAILED", "DELETE_COMPLETE"):
+            return response
+        time.sleep(CHANGE_SET_POLL_SECONDS)
+
+def deploy_single_pass(cf, stack_name, template_path, wait_for_status, on_progress, timer):
+    '''
+    Deploys the final template with a single change set.
+    The stack is created if it does not exist, otherwise the change set is a diff against the deployed stack.
+    Returns "NO_CHANGES" if the deployed stack already matches the template, otherwise True or False depending
+    on whether the stack reached its complete status.
+    '''
+    current_status = get_stack_status(cf, stack_name)
+    # A stack that was rolled back during its creation can't be updated, it has to be destroyed first.
+    if current_status == "ROLLBACK_COMPLETE":
+        on_progress(f"Stack {stack_name} is {current_status}. Destroy it before deploying again.", "red")
+        return False
+    change_set_type = "CREATE" if current_status in CREATE_FROM_STATUSES else "UPDATE"
+    change_set_name = f"cloudmania-{change_set_type.lower()}-{int(time.time())}"
+
+    # Create the change set against the final template and wait for CloudFormation to compute it.
+    with timer.step("create change set"):
+        on_progress(f"Computing {change_set_type.lower()} change set for stack {stack_name}...", "blue")
+        cf.create_change_set(
+            StackName=stack_name,
+            ChangeSetName=change_set_name,
+            ChangeSetType=change_set_type,
+            TemplateBody=read_template(template_path, FINAL_TEMPLATE),
+            Capabilities=CAPABILITIES
+        )
+        change_set = wait_for_change_set(cf, stack_name, change_set_name)
+
+    # Fast path: the deployed stack already matches the final template.
+    if change_set['Status'] == "FAILED":
+        reason = change_set.get('StatusReason', "")
+        if any(no_changes in reason for no_changes in NO_CHANGES_REASONS):
+            cf.delete_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+            on_progress(f"Stack {stack_name} is already up to date.", "green")
+            return "NO_CHANGES"
+        on_progress(f"Failed to create change set: {reason}", "red")
+        return False
+
+    # Execute the change set and wait for the stack to reach its complete status. The stack is updated after
+    # execute_change_set returns, so only the stack events newer than the change set belong to this operation.
+    with timer.step(f"execute change set ({len(change_set.get('Changes', []))} changes)"):
+        cf.execute_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+        return wait_for_status(stack_name, f"{change_set_type}_COMPLETE", change_set.get('CreationTime'))
+
+def deploy_step_by_step(cf, stack_name, template_path, wait_for_status, on_progress, timer):
+    '''
+    Deploys the templates one after the other: creates the stack with the first template,
+    then updates it once per remaining template and waits for each update to complete.
+    Returns True if every template was deployed, otherwise False.
+    '''
+    # Create the stack with the initial template.
+    with timer.step(TEMPLATES[0]):
+        cf.create_stack(
+            StackName=stack_name,
+            TemplateBody=read_template(template_path, TEMPLATES[0]),
+            Capabilities=CAPABILITIES
+        )
+        if not wait_for_status(stack_name, "CREATE_COMPLETE"):
+            return False
+    on_progress("Successfully created stack with initial template.", "green")
+    # Update the stack with each template and wait for each update to complete.
+    for template in TEMPLATES[1:]:
+        with timer.step(template):
+            cf.update_stack(
+                StackName=stack_name,
+                TemplateBody=read_template(template_path, template),
+                Capabilities=CAPABILITIES
+            )
+            if not wait_for_status(stack_name, "UPDATE_COMPLETE"):
+                on_progress(f"Failed to update stack with template: {template}", "red")
+                return False
+        on_progress(f"Successfully updated stack with template: {template}", "green")
+    return True
+
+class DeployTimer:
+    '''
+    Records the wall-clock time of a deployment and of each of its steps.
+    '''
+
+    def __init__(self, mode, stack_name):
+        self.mode = mode
+        self.stack_name = stack_name
+        self.steps = []
+        self.started_at = datetime.now(timezone.utc)
+        self.start_time = time.perf_counter()
+
+    def step(self, name):
+        # Return a context manager that times one step of the deployment.
+        return _TimedStep(self, name)
+
+    def report(self, result):
+        # Build the timing report of the deployment.
+        return {
+            "mode": self.mode,
+            "stack_name": self.stack_name,
+            "started_at": self.started_at.replace(microsecond=0).isoformat(),
+            "result": result,
+            "total_seconds": round(time.perf_counter() - self.start_time, 3),
+            "steps": self.steps
+        }
+
+class _TimedStep:
+    # Context manager adding the duration of one step to a DeployTimer, even if the step raises.
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = round(time.perf_counter() - self.start_time, 3)
+        self.timer.steps.append({"name": self.name, "seconds": seconds})
+        return False
+
+def deploy_stack(cf, stack_name, template_path, mode, wait_for_status, on_progress, report_path=None):
+    '''
+    Deploys the stack with the given mode, and appends the timing report of the deployment to the report file.
+    wait_for_status(stack_name, desired_status, started_after=None) must block until the stack reaches the desired
+    status and return True or False, ignoring the stack events older than started_after (a CloudFormation
+    timestamp) when it is given. on_progress(text, color) is called with progress messages.
+    Returns the timing report, whose "result" is "SUCCESS", "NO_CHANGES" or "FAILED".
+    '''
+    if mode not in DEPLOY_MODES:
+        raise ValueError(f"Unknown deploy mode {mode!r}, expected one of {DEPLOY_MODES}")
+    deploy = deploy_single_pass if mode == DEPLOY_MODE_SINGLE_PASS else deploy_step_by_step
+    timer = DeployTimer(mode, stack_name)
+    result = "FAILED"
+    try:
+        outcome = deploy(cf, stack_name, template_path, wait_for_status, on_progress, timer)
+        if outcome == "NO_CHANGES":
+            result = "NO_CHANGES"
+        elif outcome:
+            result = "SUCCESS"
+    finally:
+        # Record the timing report even if the deployment raised an error.
+        report = timer.report(result)
+        save_deploy_report(report, report_path)
+    return report
+
+def format_deploy_report(report):
+    # Format the timing report as one line per step followed by the total.
+    lines = [f"{step['name']}: {step['seconds']:.1f}s" for step in report['steps']]
+    lines.append(f"Total ({report['mode']}, {report['result']}): {report['total_seconds']:.1f}s")
+    return "\n".join(lines)
+
+def save_deploy_report(report, report_path=None):
+    # Append the timing report to the report file as one JSON line.
+    report_path = report_path or os.environ.get("DEPLOY_REPORT_PATH", DEFAULT_DEPLOY_REPORT_PATH)
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    with open(report_path, 'a') as report_file:
+        report_file.write(json.dumps(report) + "\n")
+
+def load_deploy_reports(report_path=None):
+    # Load all the timing reports from the report file.
+    report_path = report_path or os.environ.get("DEPLOY_REPORT_PATH", DEFAULT_DEPLOY_REPORT_PATH)
+    if not os.path.exists(report_path):
+        return []
+    with open(report_path, 'r') as report_file:
+        return [json.loads(line) for line in report_file if line.strip()]
+
+def compare_deploy_reports(reports):
+    # Summarize the wall-clock time of the successful deployments of each mode.
+    summary = {}
+    for mode in DEPLOY_MODES:
+        totals = [r['total_seconds'] for r in reports if r['mode'] == mode and r['result'] == "SUCCESS"]
+        if totals:
+            summary[mode] = {
+                "deployments": len(totals),
+                "mean_seconds": round(sum(totals) / len(totals), 3),
+                "min_seconds": min(totals),
+                "max_seconds": max(totals)
+            }
+    return summary
+
+if __name__ == "__main__":
+    # Print the comparison of the two deploy modes from the recorded timing reports.
+    print(json.dumps(compare_deploy_reports(load_deploy_reports()), indent=2))
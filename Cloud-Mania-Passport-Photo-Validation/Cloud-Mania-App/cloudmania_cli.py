@@ -0,0 +1,150 @@
+'''
+This is the command line interface of the Cloud Mania Passport Photo Validation App.
+It validates Passport Photos in bulk without the GUI:
+    - Reads the photos from a CSV or JSON Lines manifest, or from a directory.
+    - Uploads them to the specified S3 bucket and waits for their validation results, many at a time.
+    - Streams one JSON line per photo to the output file (or stdout) as soon as the photo has finished.
+    - Skips the photos whose contents have already been validated, using the local result cache.
+    - With --prescreen, rejects the unusable photos locally, without uploading them.
+    - Reports the p50/p95 latency of every phase of the photos, and exports it with --metrics-output.
+
+Example:
+    python cloudmania_cli.py --bucket cloudmania-passportimages --directory ./photos --output results.jsonl
+
+It reads the same .env file as the GUI (see CloudManiaApp.py): AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY,
+AWS_REGION and API_NAME.
+'''
+
+# Importing the argparse module to parse the command line arguments.
+import argparse
+# Importing the json module to write the results as JSON lines.
+import json
+# Importing the os module to read the environment variables.
+import os
+# Importing the sys module to write to stdout and stderr.
+import sys
+# Importing the load_dotenv function from the dotenv library.
+from dotenv import load_dotenv
+# Importing the API Gateway module to resolve the invoke URL of the API.
+import apigatewayv2_module as apigw
+# Importing the AWS clients module to create the AWS clients from one shared session.
+import aws_clients_module as aws
+# Importing the image module for the default normalization settings.
+import image_module as image
+# Importing the pipeline module to upload and validate the photos.
+import pipeline_module as pipeline
+# Importing the pre-screen module to read the pre-screen thresholds.
+import prescreen_module as prescreen
+# Importing the result cache module to skip the photos that have already been validated.
+import result_cache_module as cache
+
+def parse_args(argv=None):
+    # Define the command line arguments.
+    parser = argparse.ArgumentParser(description="Validate Passport Photos in bulk with the Cloud Mania API.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--manifest", help="CSV (with a 'path' column) or JSON Lines (with a 'path' key) manifest of photos.")
+    source.add_argument("--directory", help="Directory to validate the images of, including its subdirectories.")
+    parser.add_argument("--bucket", required=True, help="S3 bucket the photos are uploaded to.")
+    parser.add_argument("--api-name", default=None, help="Name of the API Gateway API (defaults to API_NAME).")
+    parser.add_argument("--invoke-url", default=None, help="Invoke URL of the API, to skip looking it up.")
+    parser.add_argument("--output", default="-", help="JSON Lines file the results are written to ('-' for stdout).")
+    parser.add_argument("--parallelism", type=int, default=pipeline.MAX_VALIDATION_WORKERS,
+                        help="Number of validation results waited for at the same time.")
+    parser.add_argument("--upload-workers", type=int, default=pipeline.MAX_UPLOAD_WORKERS,
+                        help="Number of photos uploaded at the same time.")
+    parser.add_argument("--cache-path", default=None, help="Result cache database (defaults to RESULT_CACHE_PATH).")
+    parser.add_argument("--cache-max-entries", type=int, default=cache.DEFAULT_MAX_ENTRIES,
+                        help="Maximum number of results kept in the result cache.")
+    parser.add_argument("--no-cache", action="store_true", help="Upload and validate every photo, even if its result is cached.")
+    parser.add_argument("--content-addressed-keys", action="store_true",
+                        help="Store the photos in S3 under the SHA-256 of their contents instead of their file name.")
+    parser.add_argument("--normalize", action="store_true",
+                        help="Downscale, strip and re-encode the photos as JPEG in memory before uploading them.")
+    parser.add_argument("--max-dimension", type=int, default=image.DEFAULT_MAX_DIMENSION,
+                        help="Maximum width and height of the normalized photos.")
+    parser.add_argument("--jpeg-quality", type=int, default=image.DEFAULT_JPEG_QUALITY,
+                        help="JPEG quality of the normalized photos.")
+    parser.add_argument("--prescreen", action="store_true",
+                        help="Check the photos locally (resolution, aspect ratio, blur, exposure) and don't upload the unusable ones.")
+    parser.add_argument("--prescreen-thresholds", default=None,
+                        help="JSON file overriding the default pre-screen thresholds (see prescreen_module).")
+    parser.add_argument("--metrics-output", default=None,
+                        help="JSON file the p50/p95 latency of every phase (upload, wait, result GET...) is written to.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Load the environment variables for AWS credentials from the specified path.
+    load_dotenv(os.environ.get("AWS_ENV_PATH"))
+    region = os.environ.get("AWS_REGION")
+    api_name = args.api_name or os.environ.get("API_NAME")
+
+    # Set the credentials and region of the AWS clients (API Gateway and S3), which share one session.
+    aws.configure(
+        aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY"),
+        region_name=region,
+    )
+    s3 = aws.get_client('s3')
+    # Resolve the invoke URL once, before any photo is uploaded.
+    invoke_url = args.invoke_url or apigw.resolve_invoke_url(api_name, region)
+
+    # Read the photos lazily, so the manifest or the directory is never loaded in memory all at once.
+    if args.manifest:
+        file_paths = pipeline.iter_manifest(args.manifest)
+    else:
+        file_paths = pipeline.iter_image_files(args.directory)
+
+    # Open the result cache, so the photos that have already been validated are skipped.
+    result_cache = None if args.no_cache else cache.ResultCache(args.cache_path, args.cache_max_entries)
+
+    validation_pipeline = pipeline.ValidationPipeline(
+        s3, args.bucket, get_invoke_url=lambda: invoke_url,
+        upload_workers=args.upload_workers, validation_workers=args.parallelism,
+        result_cache=result_cache, content_addressed_keys=args.content_addressed_keys,
+        normalize=args.normalize, max_dimension=args.max_dimension, jpeg_quality=args.jpeg_quality,
+        prescreen=args.prescreen, prescreen_thresholds=prescreen.load_thresholds(args.prescreen_thresholds)
+    )
+    output = sys.stdout if args.output == "-" else open(args.output, 'w')
+    try:
+        # Write every result as soon as its photo has finished.
+        for result in validation_pipeline.run(file_paths):
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    finally:
+        validation_pipeline.shutdown()
+        if output is not sys.stdout:
+            output.close()
+
+    # Print a summary of the run to stderr, so it doesn't mix with the results on stdout.
+    stats = validation_pipeline.stats()
+    print(
+        f"Validated {stats['finished']} photos in {stats['elapsed_seconds']:.1f}s "
+        f"({stats['files_per_second']:.2f} files/s, {stats['megabytes_per_second']:.2f} MB/s): "
+        f"{stats['passed']} PASS, {stats['failed']} FAIL, {stats['errors']} ERROR",
+        file=sys.stderr
+    )
+    if args.normalize:
+        print(f"Normalization saved {stats['bytes_saved'] / (1024 * 1024):.1f} MB "
+              f"({stats['uploaded_bytes'] / (1024 * 1024):.1f} MB uploaded)", file=sys.stderr)
+    if args.prescreen:
+        print(f"Pre-screen rejected {stats['prescreen_rejected']} photos locally "
+              f"({stats['cloud_calls_avoided']} cloud calls avoided)", file=sys.stderr)
+    # Print the p50/p95 of the phases, and export them if asked to.
+    latency = validation_pipeline.latency_summary()
+    if "total" in latency:
+        print("Latency p50/p95: " + ", ".join(
+            f"{phase} {summary['p50']:.2f}s/{summary['p95']:.2f}s" for phase, summary in latency.items()
+        ), file=sys.stderr)
+    if args.metrics_output:
+        validation_pipeline.latency.export(args.metrics_output, {"run": stats})
+    if result_cache is not None:
+        cache_stats = result_cache.stats()
+        print(f"Result cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+              f"{cache_stats['entries']} entries", file=sys.stderr)
+        result_cache.close()
+    # Exit with an error code if any photo couldn't be validated.
+    return 1 if stats['errors'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+'''
+This is the offline replay tool of the Cloud Mania Passport Photo Validation App.
+It re-evaluates the validation rules over face details that have already been recorded, without any AWS call:
+    - Reads the records from DynamoDB exports (.json.gz files of an export to S3, or "aws dynamodb scan"
+      output) or JSON Lines files (e.g. the detail mode of the API).
+    - Evaluates the current thresholds of the validation Lambda and every given threshold configuration
+      over all the records at once (see replay_module).
+    - Reports how many records go from PASS to FAIL and from FAIL to PASS, by reason, with examples.
+
+Example:
+    python cloudmania_replay.py --input export/*.json.gz --config relaxed-smile.json --output replay.json
+
+A configuration is a JSON file like FACE_DETAILS_THRESHOLDS, optionally wrapped with its face policy:
+    {"thresholds": {"Smile": {"desiredValue": false, "minConfidence": 80}}, "face_policy": "all", "max_faces": 1}
+'''
+
+# Importing the argparse module to parse the command line arguments.
+import argparse
+# Importing the json module to write the report.
+import json
+# Importing the sys module to write the summary to stderr.
+import sys
+# Importing the time module to time the loading and the evaluation.
+import time
+# Importing the replay module to load the records and evaluate the configurations.
+import replay_module as replay
+
+def parse_args(argv=None):
+    # Define the command line arguments.
+    parser = argparse.ArgumentParser(description="Replay threshold configurations over recorded Rekognition face details.")
+    parser.add_argument("--input", nargs="+", required=True,
+                        help="JSON Lines, JSON or gzipped DynamoDB export files holding the validation results.")
+    parser.add_argument("--config", nargs="*", default=[],
+                        help="Threshold configurations (JSON files) to compare with the current rules.")
+    parser.add_argument("--baseline", default=None,
+                        help="Configuration to compare with instead of the current rules of the validation Lambda.")
+    parser.add_argument("--examples", type=int, default=replay.MAX_EXAMPLES,
+                        help="Number of changed records listed for every configuration.")
+    parser.add_argument("--output", default="-", help="JSON file the report is written to ('-' for stdout).")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    start_time = time.perf_counter()
+    table = replay.load_face_table(args.input)
+    load_seconds = time.perf_counter() - start_time
+    baseline = replay.load_config(args.baseline) if args.baseline else replay.CURRENT_CONFIG
+
+    # Compare the baseline with itself too, so the report always has its PASS/FAIL counts.
+    configs = {"baseline": baseline}
+    configs.update((path, replay.load_config(path)) for path in args.config)
+    start_time = time.perf_counter()
+    comparisons = {name: replay.compare(table, config, baseline, args.examples) for name, config in configs.items()}
+    evaluate_seconds = time.perf_counter() - start_time
+
+    report = {
+        "inputs": args.input,
+        "records": len(table),
+        "faces": len(table.record_index),
+        "load_seconds": round(load_seconds, 3),
+        "evaluate_seconds": round(evaluate_seconds, 3),
+        "comparisons": comparisons
+    }
+    output = sys.stdout if args.output == "-" else open(args.output, 'w')
+    try:
+        json.dump(report, output, indent=2, default=str)
+        output.write("\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    # Print a summary to stderr, so it doesn't mix with the report on stdout.
+    print(f"Loaded {len(table)} records ({len(table.record_index)} faces, {table.skipped} skipped without face details) "
+          f"in {load_seconds:.2f}s, evaluated {len(configs)} configurations in {evaluate_seconds:.3f}s", file=sys.stderr)
+    for name, comparison in comparisons.items():
+        print(f"{name}: {comparison['candidate']['passed']} PASS, {comparison['candidate']['failed']} FAIL  |  "
+              f"PASS->FAIL {comparison['pass_to_fail']}, FAIL->PASS {comparison['fail_to_pass']}  |  "
+              f"stored results reproduced by the baseline: {comparison['stored_results_reproduced']}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+'''
+I created this module to store the functions that process the Passport Photos on the client.
+
+Camera photos are often several MB, and PNG/GIF photos are even bigger, while Rekognition only needs a few
+hundred pixels per face. normalize_image prepares a photo for upload in memory, with no temporary file:
+    - Applies the EXIF orientation, so the face is upright.
+    - Downscales the photo to a maximum dimension.
+    - Drops the metadata (EXIF, ICC profile, comments).
+    - Re-encodes it as a JPEG with a tuned quality.
+A JPEG that is already within the maximum dimension, or that the re-encoding wouldn't make smaller, is
+uploaded as it is (read_original): Rekognition reads it directly, applying its EXIF orientation itself, and
+re-encoding it would only cost time, bytes and quality.
+
+The previews shown in the GUI are made by load_preview, which asks the JPEG decoder for a reduced resolution
+(draft mode) instead of decoding the full photo, and are kept in a PreviewCache so selecting a photo again
+shows its preview straight away. PIL is only imported by the functions that open a photo, so importing this
+module is cheap.
+
+Functions in this module:
+- normalize_image: Returns a normalized JPEG copy of a photo in a memory buffer, with its statistics.
+- read_original: Returns the original bytes of a photo in a memory buffer, with the statistics of normalize_image.
+- normalized_key: Returns the S3 object key of a normalized photo.
+- load_preview: Returns a small preview of a photo, decoding as little of it as possible.
+
+Classes in this module:
+- PreviewCache: LRU cache of previews keyed by path and modification time, with a memory cap.
+'''
+
+# Import the io module to encode the normalized photos in memory.
+import io
+# Import the os module to get the size and the name of the photos.
+import os
+# Import the threading module to share the preview cache between the worker threads.
+import threading
+# Import the time module to time the normalization.
+import time
+# Import the OrderedDict class to keep the previews in least recently used order.
+from collections import OrderedDict
+
+# Default maximum width and height (in pixels) of the normalized photos.
+DEFAULT_MAX_DIMENSION = 1600
+# Default JPEG quality of the normalized photos.
+DEFAULT_JPEG_QUALITY = 88
+# Extensions of the photos whose key needs no .jpg extension once normalized.
+JPEG_EXTENSIONS = {'.jpg', '.jpeg'}
+
+# Default size of the previews, matching the preview frame of the GUI.
+PREVIEW_SIZE = (100, 100)
+# Default memory cap (in bytes of decoded pixels) of the preview cache.
+DEFAULT_PREVIEW_CACHE_BYTES = 32 * 1024 * 1024
+
+def normalize_image(file_path, max_dimension=DEFAULT_MAX_DIMENSION, quality=DEFAULT_JPEG_QUALITY):
+    '''
+    Returns a (buffer, stats) tuple, where buffer is a BytesIO holding the normalized JPEG, positioned at
+    its start, and stats has the original and normalized sizes (bytes and pixels) and the time spent.
+    stats["kept_original"] is True when the buffer holds the original photo instead (see read_original).
+    '''
+    # Import PIL only when a photo is processed, so importing this module doesn't slow down the GUI start.
+    from PIL import Image, ImageOps
+    start_time = time.perf_counter()
+    original_bytes = os.path.getsize(file_path)
+    with Image.open(file_path) as image:
+        original_size = image.size
+        # Rekognition reads a JPEG as it is, so a JPEG is only re-encoded if it needs downscaling.
+        can_keep_original = image.format == "JPEG"
+        if can_keep_original and max(original_size) <= max_dimension:
+            return read_original(file_path, original_size, start_time)
+        # Let the JPEG decoder skip the resolution that would be thrown away by the downscale.
+        image.draft("RGB", (max_dimension, max_dimension))
+        # Rotate the photo according to its EXIF orientation, since the EXIF data is dropped below.
+        image = ImageOps.exif_transpose(image)
+        # JPEG has no alpha channel, so put transparent photos on a white background.
+        if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        # JPEG has no palette either, so convert the other photos to plain RGB.
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        # Downscale the photo, keeping its aspect ratio.
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        # Re-encode the photo without any metadata.
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+        normalized_size = image.size
+    buffer.seek(0)
+    normalized_bytes = buffer.getbuffer().nbytes
+    # A JPEG that was already well compressed can get bigger once re-encoded, so upload the original instead.
+    if can_keep_original and normalized_bytes >= original_bytes:
+        return read_original(file_path, original_size, start_time)
+    stats = {
+        "original_bytes": original_bytes,
+        "normalized_bytes": normalized_bytes,
+        "bytes_saved": original_bytes - normalized_bytes,
+        "original_size": original_size,
+        "normalized_size": normalized_size,
+        "kept_original": False,
+        "seconds": round(time.perf_counter() - start_time, 4)
+    }
+    return buffer, stats
+
+def read_original(file_path, original_size, start_time):
+    # Return the photo as it is in a buffer, with the statistics normalize_image returns (nothing saved).
+    with open(file_path, 'rb') as photo_file:
+        buffer = io.BytesIO(photo_file.read())
+    original_bytes = buffer.getbuffer().nbytes
+    stats = {
+        "original_bytes": original_bytes,
+        "normalized_bytes": original_bytes,
+        "bytes_saved": 0,
+        "original_size": original_size,
+        "normalized_size": original_size,
+        "kept_original": True,
+        "seconds": round(time.perf_counter() - start_time, 4)
+    }
+    return buffer, stats
+
+def normalized_key(key):
+    # The normalized photo is always a JPEG, so give its key a .jpg extension. The original extension of the other
+    # photos is kept in the key (photo.png -> photo.png.jpg), so photo.png and photo.jpg don't get the same key.
+    if os.path.splitext(key)[1].lower() in JPEG_EXTENSIONS:
+        return key
+    return f"{key}.jpg"
+
+def load_preview(file_path, size=PREVIEW_SIZE):
+    # Return a preview of the photo that fits in the given size.
+    from PIL import Image, ImageOps
+    with Image.open(file_path) as image:
+        # Let the JPEG decoder decode at 1/2, 1/4 or 1/8 of the resolution, staying above the preview size.
+        image.draft("RGB", size)
+        # Rotate the preview according to the EXIF orientation of the photo. This also makes a copy that
+        # doesn't depend on the open file.
+        preview = ImageOps.exif_transpose(image)
+    preview.thumbnail(size)
+    return preview
+
+class PreviewCache:
+    '''
+    LRU cache of previews keyed by the path, modification time and size of the photos, so an edited photo
+    gets a new preview. The least recently used previews are evicted once the decoded pixels of all the
+    previews take more than max_bytes. Safe to use from several threads at once.
+    '''
+
+    def __init__(self, max_bytes=DEFAULT_PREVIEW_CACHE_BYTES, size=PREVIEW_SIZE):
+        self.max_bytes = max_bytes
+        self.size = size
+        self.previews = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, file_path):
+        # Return the preview of the photo, loading it only if it isn't cached yet.
+        file_stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), file_stat.st_mtime_ns, file_stat.st_size)
+        with self.lock:
+            preview = self.previews.get(key)
+            if preview is not None:
+                self.hits += 1
+                self.previews.move_to_end(key)
+                return preview
+            self.misses += 1
+        # Load the preview outside the lock, so several previews can be loaded at once.
+        preview = load_preview(file_path, self.size)
+        preview_bytes = preview.width * preview.height * len(preview.getbands())
+        with self.lock:
+            if key not in self.previews:
+                self.previews[key] = preview
+                self.total_bytes += preview_bytes
+            # Evict the least recently used previews above the memory cap.
+            while self.total_bytes > self.max_bytes and len(self.previews) > 1:
+                _, evicted = self.previews.popitem(last=False)
+                self.total_bytes -= evicted.width * evicted.height * len(evicted.getbands())
+        return preview
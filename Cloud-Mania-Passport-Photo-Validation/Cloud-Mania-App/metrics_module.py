@@ -0,0 +1,140 @@
+'''
+I created this module to time the phases of the validation of a photo on the client.
+
+The time between picking a photo and seeing its result is spent in several places: hashing the photo,
+pre-screening it, normalizing it, uploading it to S3, waiting for a free validation thread, looking up the
+invoke URL, waiting for the validation Lambda to write the result (Rekognition and DynamoDB, seen from the
+client as polls answered with 404), and the GET request that finally returns the result. Every photo gets a timings dictionary with the
+seconds spent in each of these phases (see PHASES), filled with span(), and a LatencyRecorder gathers the
+timings of many photos to report their p50/p95. A long batch of photos would make the LatencyRecorder keep
+every timing it gets, so it keeps the count, sum and maximum of each phase, and the percentiles come from a
+random sample of at most LATENCY_SAMPLE_SIZE timings per phase (reservoir sampling), taken evenly across the batch.
+The Lambda Functions report their own steps (detect_faces, evaluate_face, write_results_to_dynamo) as EMF log
+lines in CloudWatch, so the "result_wait" phase can be broken down further there.
+
+Functions in this module:
+- span: Context manager adding the seconds spent in its block to a phase of a timings dictionary.
+- percentile: Returns a percentile of a list of values, interpolating between the closest ranks.
+- format_breakdown: Returns the timings of a photo as a short human-readable line.
+
+Classes in this module:
+- LatencyRecorder: Gathers the timings of many photos and summarizes or exports their percentiles.
+'''
+
+# Import the json module to export the latency summaries.
+import json
+# Import the os module to create the directory of the exported summaries.
+import os
+# Import the random module to pick the timings kept in the samples.
+import random
+# Import the threading module to record the timings from the worker threads.
+import threading
+# Import the time module to time the phases.
+import time
+# Import the contextmanager decorator to write span as a generator.
+from contextlib import contextmanager
+
+# Phases of the validation of a photo, in the order they happen, with their labels.
+PHASES = {
+    "hash": "hash",
+    "cache_lookup": "cache",
+    "prescreen": "pre-screen",
+    "normalize": "normalize",
+    "upload": "upload",
+    "queue": "queue",
+    "invoke_url": "invoke URL",
+    "result_wait": "wait",
+    "result_get": "result GET",
+    "total": "total"
+}
+
+# Percentiles of the summaries.
+SUMMARY_PERCENTILES = {"p50": 0.50, "p95": 0.95}
+
+# Timings kept per phase to compute the percentiles, so the memory stays bounded however many photos are timed.
+LATENCY_SAMPLE_SIZE = 10000
+
+@contextmanager
+def span(timings, phase):
+    # Add the seconds spent in the block to the phase, even if the block raises.
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - start_time
+
+def percentile(values, fraction):
+    # Return the value below which the given fraction of the values fall, or None without values.
+    if not values:
+        return None
+    values = sorted(values)
+    rank = fraction * (len(values) - 1)
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+def format_breakdown(timings):
+    # Format the phases that took at least a millisecond, e.g. "upload 1.20s | wait 3.41s | result GET 0.08s".
+    parts = [
+        f"{label} {timings[phase]:.2f}s" for phase, label in PHASES.items()
+        if phase != "total" and timings.get(phase) is not None and timings[phase] >= 0.001
+    ]
+    return " | ".join(parts)
+
+class LatencyRecorder:
+    '''
+    Gathers the timings of many photos, phase by phase. Safe to use from several threads at once.
+    The count, mean and maximum are exact; the percentiles come from a sample of at most sample_size timings.
+    '''
+
+    def __init__(self, sample_size=LATENCY_SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self.counts = {}
+        self.totals = {}
+        self.maxima = {}
+        self.samples = {}
+        self.random = random.Random()
+        self.lock = threading.Lock()
+
+    def record(self, timings):
+        # Add the seconds of every phase of one photo.
+        with self.lock:
+            for phase, seconds in timings.items():
+                if seconds is None:
+                    continue
+                count = self.counts.get(phase, 0) + 1
+                self.counts[phase] = count
+                self.totals[phase] = self.totals.get(phase, 0.0) + seconds
+                self.maxima[phase] = max(self.maxima.get(phase, seconds), seconds)
+                sample = self.samples.setdefault(phase, [])
+                # Once the sample is full, the n-th timing replaces a random one with a probability of size/n.
+                if len(sample) < self.sample_size:
+                    sample.append(seconds)
+                else:
+                    index = self.random.randrange(count)
+                    if index < self.sample_size:
+                        sample[index] = seconds
+
+    def summary(self):
+        # Return {phase: {"count", "mean", "p50", "p95", "max"}} in seconds, for the phases recorded so far.
+        with self.lock:
+            samples = {phase: list(sample) for phase, sample in self.samples.items()}
+            counts, totals, maxima = dict(self.counts), dict(self.totals), dict(self.maxima)
+        summary = {}
+        for phase in sorted(samples, key=lambda phase: list(PHASES).index(phase) if phase in PHASES else len(PHASES)):
+            summary[phase] = {
+                "count": counts[phase],
+                "mean": round(totals[phase] / counts[phase], 4),
+                **{name: round(percentile(samples[phase], fraction), 4) for name, fraction in SUMMARY_PERCENTILES.items()},
+                "max": round(maxima[phase], 4)
+            }
+        return summary
+
+    def export(self, path, extra=None):
+        # Write the summary (and any extra information, such as the run statistics) to a JSON file.
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        report = {"generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "unit": "seconds", "phases": self.summary()}
+        report.update(extra or {})
+        with open(path, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+        return report
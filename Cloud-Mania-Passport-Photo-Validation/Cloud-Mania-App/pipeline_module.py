@@ -0,0 +1,430 @@
+'''
+I created this module to run the upload -> wait -> fetch result flow of the app without the GUI.
+
+The ValidationPipeline uploads photos on a bounded thread pool with a boto3 TransferConfig tuned for photos.
+As soon as a photo is uploaded, waiting for its validation result starts on a second thread pool, so the
+validation of the first photos overlaps with the upload of the next ones. The results of the photos waiting
+at the same time are fetched together with the batch form of the API (see validation_module.ResultPoller).
+Every result carries the seconds spent in each phase of its photo (see metrics_module), and the pipeline
+keeps a LatencyRecorder of them, so their p50/p95 can be shown or exported.
+With prescreen=True, the photos failing the local pre-screen (see prescreen_module) fail straight away with
+local failure reasons, and are never uploaded nor validated in the cloud.
+It is used in two ways:
+- start() queues a batch of photos and reports the progress of every photo through a callback (the GUI batch window).
+- run() streams the results of any number of photos as they finish, while keeping a bounded number of
+  photos in flight, so memory stays flat no matter how many photos there are (the command line interface).
+
+Functions in this module:
+- allowed_file: Checks if a file name has an allowed image extension.
+- iter_image_files: Yields the paths of the image files in a folder and its subfolders.
+- list_image_files: Returns the paths of the image files in a folder and its subfolders.
+- iter_manifest: Yields the photo paths listed in a CSV or JSON Lines manifest.
+- get_transfer_config: Returns the boto3 TransferConfig of the uploads, created on first use.
+- upload_photo: Uploads one photo to an S3 bucket and returns its S3 object key.
+- upload_normalized_photo: Normalizes one photo in memory, uploads it to an S3 bucket and returns its key and statistics.
+- get_object_etag: Returns the ETag of an S3 object.
+
+Classes in this module:
+- ValidationPipeline: Uploads photos and waits for their validation results.
+'''
+
+# Import the csv module to read CSV manifests.
+import csv
+# Import the json module to read JSON Lines manifests.
+import json
+# Import the os module to walk folders and get the size of the files.
+import os
+# Import the queue module to hand the finished results to run().
+import queue
+# Import the threading module to protect the statistics.
+import threading
+# Import the time module to measure the duration and throughput of the pipeline.
+import time
+# Import the ThreadPoolExecutor class to run the uploads and the validations concurrently.
+from concurrent.futures import ThreadPoolExecutor
+# Import the image module to normalize the photos before they are uploaded.
+import image_module as image
+# Import the metrics module to time the phases of every photo.
+import metrics_module as metrics
+# Import the pre-screen module to reject the unusable photos before uploading them.
+import prescreen_module as screen
+# Import the result cache module to skip the photos that have already been validated.
+import result_cache_module as cache
+# Import the validation module to wait for the validation results.
+import validation_module as validation
+
+# List of allowed extensions for images.
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
+# Number of photos uploaded at the same time, and number of validation results waited for at the same time.
+MAX_UPLOAD_WORKERS = 8
+MAX_VALIDATION_WORKERS = 16
+
+# S3 transfer settings. Photos are usually a few MB, so they are uploaded in a single request, while the
+# rare big file is split into 8 MB parts uploaded on a few threads.
+TRANSFER_SETTINGS = {
+    "multipart_threshold": 16 * 1024 * 1024,
+    "multipart_chunksize": 8 * 1024 * 1024,
+    "max_concurrency": 4,
+    "use_threads": True
+}
+
+# TransferConfig built from TRANSFER_SETTINGS, created on first use so importing this module doesn't load boto3.
+transfer_config_default = None
+
+# Statuses a photo goes through.
+STATUS_QUEUED = "QUEUED"
+STATUS_UPLOADING = "UPLOADING"
+STATUS_VALIDATING = "VALIDATING"
+STATUS_PASS = "PASS"
+STATUS_FAIL = "FAIL"
+STATUS_ERROR = "ERROR"
+
+# Cloud calls a photo rejected by the pre-screen doesn't make: the S3 PUT, the DetectFaces call, the DynamoDB
+# write and (at least) one API request.
+CLOUD_CALLS_PER_PHOTO = 4
+
+def allowed_file(filename):
+    # Check if the file name has one of the allowed image extensions.
+    return '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def iter_image_files(folder):
+    # Walk the folder and its subfolders, one folder at a time, and yield the allowed images.
+    for dir_path, dir_names, file_names in os.walk(folder):
+        dir_names.sort()
+        for name in sorted(file_names):
+            if allowed_file(name):
+                yield os.path.join(dir_path, name)
+
+def list_image_files(folder):
+    # Return the allowed images of the folder and its subfolders as a list.
+    return list(iter_image_files(folder))
+
+def iter_manifest(manifest_path):
+    '''
+    Yields the photo paths listed in a manifest, one line at a time.
+    A JSON Lines manifest (.jsonl) has one object with a "path" key per line.
+    A CSV manifest has a "path" column, or the paths in its first column if there is no header.
+    Relative paths are relative to the folder of the manifest.
+    '''
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, 'r', newline='') as manifest_file:
+        if manifest_path.lower().endswith(".jsonl"):
+            paths = (json.loads(line)["path"] for line in manifest_file if line.strip())
+        else:
+            rows = csv.reader(manifest_file)
+            first_row = next(rows, None)
+            if first_row is None:
+                return
+            # Use the "path" column if the manifest has a header, otherwise the first column.
+            column = first_row.index("path") if "path" in first_row else 0
+            if "path" not in first_row:
+                rows = _prepend(first_row, rows)
+            paths = (row[column] for row in rows if row)
+        for path in paths:
+            yield os.path.join(base_dir, path)
+
+def _prepend(first_row, rows):
+    # Yield the first row again before the remaining rows.
+    yield first_row
+    yield from rows
+
+def get_transfer_config():
+    # Create the default TransferConfig the first time an upload needs it.
+    global transfer_config_default
+    if transfer_config_default is None:
+        from boto3.s3.transfer import TransferConfig
+        transfer_config_default = TransferConfig(**TRANSFER_SETTINGS)
+    return transfer_config_default
+
+def upload_photo(s3, file_path, bucket_name, transfer_config=None, key=None):
+    # Upload the photo to the bucket, using its name as the S3 object key unless another key is given.
+    key = key or os.path.basename(file_path)
+    s3.upload_file(file_path, bucket_name, key, Config=transfer_config or get_transfer_config())
+    # Return the key, since the validation result is stored under it.
+    return key
+
+def upload_normalized_photo(s3, file_path, bucket_name, transfer_config=None, key=None,
+                            max_dimension=image.DEFAULT_MAX_DIMENSION, quality=image.DEFAULT_JPEG_QUALITY):
+    # Downscale, strip and re-encode the photo in memory, and upload it straight from the buffer. The buffer holds
+    # the original photo when re-encoding it wouldn't help (see image_module.normalize_image).
+    buffer, stats = image.normalize_image(file_path, max_dimension, quality)
+    key = image.normalized_key(key or os.path.basename(file_path))
+    s3.upload_fileobj(buffer, bucket_name, key, Config=transfer_config or get_transfer_config())
+    # Return the key, since the validation result is stored under it, and the normalization statistics.
+    return key, stats
+
+def get_object_etag(s3, bucket_name, key):
+    # S3 quotes the ETags it returns, but not the ones of its event notifications, which the Lambda stores.
+    return s3.head_object(Bucket=bucket_name, Key=key)["ETag"].strip('"')
+
+class ValidationPipeline:
+    '''
+    Uploads photos to an S3 bucket and waits for their validation results.
+
+    get_invoke_url() is called to get the invoke URL of the API, and on_update(file_path, status, detail),
+    if given, is called from the worker threads every time a photo changes status.
+    If a result_cache is given, photos whose contents have already been validated are not uploaded again. A
+    result is only cached once it is known to be the one of the uploaded photo, never one of an older photo
+    that had the same key.
+    If content_addressed_keys is True, the S3 object key of a photo is the SHA-256 of its contents instead of
+    its file name, so two different photos with the same name don't overwrite each other's result.
+    If normalize is True, every photo is downscaled to max_dimension, stripped of its metadata and re-encoded
+    as a JPEG in memory before it is uploaded, unless it is a JPEG that is already small enough or wouldn't get
+    smaller (see image_module).
+    If prescreen is True, every photo is checked locally before it is uploaded, and the photos failing the
+    prescreen_thresholds (see prescreen_module) fail without being uploaded.
+    '''
+
+    def __init__(self, s3, bucket_name, get_invoke_url, on_update=None, upload_workers=MAX_UPLOAD_WORKERS,
+                 validation_workers=MAX_VALIDATION_WORKERS, transfer_config=None,
+                 result_cache=None, content_addressed_keys=False, normalize=False,
+                 max_dimension=image.DEFAULT_MAX_DIMENSION, jpeg_quality=image.DEFAULT_JPEG_QUALITY,
+                 prescreen=False, prescreen_thresholds=None):
+        self.s3 = s3
+        self.bucket_name = bucket_name
+        self.get_invoke_url = get_invoke_url
+        self.on_update = on_update or (lambda file_path, status, detail: None)
+        self.transfer_config = transfer_config
+        self.result_cache = result_cache
+        self.content_addressed_keys = content_addressed_keys
+        self.normalize = normalize
+        self.max_dimension = max_dimension
+        self.jpeg_quality = jpeg_quality
+        self.prescreen = prescreen
+        self.prescreen_thresholds = prescreen_thresholds or screen.DEFAULT_THRESHOLDS
+        self.upload_workers = upload_workers
+        self.validation_workers = validation_workers
+        self.upload_executor = ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix="cloudmania-upload")
+        self.validation_executor = ThreadPoolExecutor(max_workers=validation_workers, thread_name_prefix="cloudmania-validate")
+        # Poll for the results of the photos from one thread, so the photos waiting together share requests.
+        self.result_poller = validation.ResultPoller()
+        # Timings of the photos uploaded and validated by the pipeline (the cached photos aren't recorded).
+        self.latency = metrics.LatencyRecorder()
+        self.lock = threading.Lock()
+        self.total_files = 0
+        self.uploaded_bytes = 0
+        self.bytes_saved = 0
+        self.prescreen_rejected = 0
+        self.finished_files = 0
+        self.counts = {STATUS_PASS: 0, STATUS_FAIL: 0, STATUS_ERROR: 0}
+        self.start_time = None
+        self.end_time = None
+
+    def submit(self, file_path, on_done=None):
+        # Queue one photo for upload. on_done(result) is called from a worker thread once the photo has finished.
+        with self.lock:
+            if self.start_time is None:
+                self.start_time = time.perf_counter()
+            self.total_files += 1
+            self.end_time = None
+        self.on_update(file_path, STATUS_QUEUED, "")
+        self.upload_executor.submit(self.upload, file_path, on_done or (lambda result: None))
+
+    def start(self, file_paths):
+        # Queue every photo for upload and return straight away.
+        for file_path in file_paths:
+            self.submit(file_path)
+
+    def run(self, file_paths, max_in_flight=None):
+        '''
+        Uploads and validates every photo of the iterable and yields their results as they finish.
+        At most max_in_flight photos are queued or running at any time, and file_paths is only read as
+        photos finish, so it can be a generator over any number of photos.
+        '''
+        max_in_flight = max_in_flight or (self.upload_workers + self.validation_workers)
+        finished = queue.Queue()
+        in_flight = 0
+        for file_path in file_paths:
+            # Wait for a photo to finish if the pipeline is full.
+            if in_flight >= max_in_flight:
+                in_flight -= 1
+                yield finished.get()
+            # Yield the other finished results without waiting.
+            while True:
+                try:
+                    result = finished.get_nowait()
+                except queue.Empty:
+                    break
+                in_flight -= 1
+                yield result
+            self.submit(file_path, on_done=finished.put)
+            in_flight += 1
+        # Yield the remaining results.
+        while in_flight > 0:
+            in_flight -= 1
+            yield finished.get()
+
+    def upload(self, file_path, on_done):
+        # Upload the photo to the bucket, unless its result is already in the result cache.
+        result = {"file": file_path, "key": None, "status": None, "failure_reasons": None, "error": None, "cached": False,
+                  "timings": {}}
+        timings = result["timings"]
+        start_time = time.perf_counter()
+        try:
+            key = None
+            # Hash the photo if its result may be cached or if the S3 key is its hash.
+            if self.result_cache is not None or self.content_addressed_keys:
+                with metrics.span(timings, "hash"):
+                    result["sha256"] = cache.hash_file(file_path)
+            # Return the cached result straight away if the same photo has already been validated.
+            if self.result_cache is not None:
+                with metrics.span(timings, "cache_lookup"):
+                    cached = self.result_cache.get(result["sha256"])
+                if cached is not None:
+                    result["key"] = cached["Key"]
+                    result["cached"] = True
+                    self.report(result, start_time, cached, on_done)
+                    return
+            # Fail the unusable photos locally, without uploading them.
+            if self.prescreen:
+                with metrics.span(timings, "prescreen"):
+                    reasons, result["prescreen"] = screen.prescreen(file_path, self.prescreen_thresholds)
+                if reasons:
+                    result["prescreened"] = True
+                    result["failure_reasons"] = reasons
+                    with self.lock:
+                        self.prescreen_rejected += 1
+                    self.finish(result, start_time, STATUS_FAIL,
+                                f"Rejected locally by the pre-screen, not uploaded: {reasons}", on_done)
+                    return
+            if self.content_addressed_keys:
+                key = cache.content_key(result["sha256"], file_path)
+            self.on_update(file_path, STATUS_UPLOADING, "")
+            with metrics.span(timings, "upload"):
+                if self.normalize:
+                    result["key"], result["normalize"] = upload_normalized_photo(
+                        self.s3, file_path, self.bucket_name, self.transfer_config, key,
+                        self.max_dimension, self.jpeg_quality
+                    )
+                    size = result["normalize"]["normalized_bytes"]
+                else:
+                    size = os.path.getsize(file_path)
+                    result["key"] = upload_photo(self.s3, file_path, self.bucket_name, self.transfer_config, key)
+                # Read the ETag S3 gave the photo, so the result of an older photo of the same key isn't taken for
+                # its result. A content-addressed key only ever holds the same photo, so it needs no check.
+                if not self.content_addressed_keys:
+                    result["etag"] = get_object_etag(self.s3, self.bucket_name, result["key"])
+            # The normalization happens before the upload, so take it out of the upload time.
+            if self.normalize:
+                timings["normalize"] = result["normalize"]["seconds"]
+                timings["upload"] -= timings["normalize"]
+        except Exception as e:
+            self.finish(result, start_time, STATUS_ERROR, f"Upload failed: {e}", on_done)
+            return
+        upload_seconds = time.perf_counter() - start_time
+        result["upload_seconds"] = round(upload_seconds, 3)
+        with self.lock:
+            self.uploaded_bytes += size
+            if self.normalize:
+                self.bytes_saved += result["normalize"]["bytes_saved"]
+        # Wait for the validation result on the validation pool, so the next upload can start.
+        detail = f"Uploaded {size / 1024:.0f} KB in {upload_seconds:.1f}s"
+        if self.normalize and result["normalize"]["kept_original"]:
+            detail += " (original kept, re-encoding wouldn't make it smaller)"
+        elif self.normalize:
+            detail += (f" (normalized from {result['normalize']['original_bytes'] / 1024:.0f} KB "
+                       f"in {result['normalize']['seconds']:.2f}s)")
+        self.on_update(file_path, STATUS_VALIDATING, detail)
+        self.validation_executor.submit(self.validate, result, start_time, on_done, time.perf_counter())
+
+    def validate(self, result, start_time, on_done, queued_at):
+        # Wait for the validation result of the uploaded photo.
+        timings = result["timings"]
+        # Time spent waiting for a free validation thread.
+        timings["queue"] = time.perf_counter() - queued_at
+        poll_stats = {}
+        try:
+            with metrics.span(timings, "invoke_url"):
+                invoke_url = self.get_invoke_url()
+            if not invoke_url:
+                raise LookupError("Failed to get the invoke URL.")
+            with metrics.span(timings, "result_wait"):
+                response_json = self.result_poller.wait(invoke_url, result["key"], poll_stats, result.get("etag"))
+            # Split the wait between the time the result wasn't available yet, and the request that returned it.
+            timings["result_get"] = poll_stats["request_seconds"]
+            timings["result_wait"] -= poll_stats["request_seconds"]
+            result["polls"] = poll_stats["polls"]
+        except Exception as e:
+            self.finish(result, start_time, STATUS_ERROR, f"Validation failed: {e}", on_done)
+            return
+        # Remember the result, so the same photo is never uploaded and validated again. Only cache a result known to
+        # belong to this photo: its key is the hash of the photo, or the poller checked its ETag against the upload.
+        verified = self.content_addressed_keys or response_json.get("ETag") is not None
+        if (self.result_cache is not None and verified
+                and response_json.get("ValidationResult") in (STATUS_PASS, STATUS_FAIL)):
+            self.result_cache.put(result["sha256"], response_json["ValidationResult"],
+                                  validation.get_failure_reasons(response_json), result["key"])
+        self.report(result, start_time, response_json, on_done)
+
+    def report(self, result, start_time, response_json, on_done):
+        # Finish the photo with the validation result returned by the API or the result cache.
+        validation_result = response_json.get("ValidationResult")
+        if validation_result == STATUS_FAIL:
+            result["failure_reasons"] = validation.get_failure_reasons(response_json)
+            self.finish(result, start_time, STATUS_FAIL, f"Failure Reasons: {result['failure_reasons']}", on_done)
+        elif validation_result == STATUS_PASS:
+            self.finish(result, start_time, STATUS_PASS, "", on_done)
+        # The Lambda writes an ERROR result, with the reason, for a photo it couldn't validate.
+        elif validation_result == STATUS_ERROR:
+            reasons = "; ".join(validation.get_failure_reasons(response_json) or [])
+            self.finish(result, start_time, STATUS_ERROR, f"Validation failed in the cloud: {reasons}", on_done)
+        # Anything else (no result, an error payload) is an error, never a PASS.
+        else:
+            self.finish(result, start_time, STATUS_ERROR, f"Unexpected validation result: {validation_result!r}", on_done)
+
+    def finish(self, result, start_time, status, detail, on_done):
+        # Count the photo as finished and report its final status.
+        result["status"] = status
+        if status == STATUS_ERROR:
+            result["error"] = detail
+        result["seconds"] = round(time.perf_counter() - start_time, 3)
+        result["timings"]["total"] = time.perf_counter() - start_time
+        result["timings"] = {phase: round(seconds, 4) for phase, seconds in result["timings"].items()}
+        # The cached and pre-screened photos never reach the cloud, so they would skew the latencies.
+        if not result["cached"] and not result.get("prescreened"):
+            self.latency.record(result["timings"])
+            # Show where the time of the photo went.
+            if status != STATUS_ERROR:
+                detail = " - ".join(part for part in (detail, metrics.format_breakdown(result["timings"])) if part)
+        with self.lock:
+            self.finished_files += 1
+            self.counts[status] += 1
+            # Stop the clock once every queued photo has finished.
+            if self.finished_files == self.total_files:
+                self.end_time = time.perf_counter()
+        self.on_update(result["file"], status, detail)
+        on_done(result)
+
+    def stats(self):
+        # Return the progress and throughput of the pipeline.
+        with self.lock:
+            end_time = self.end_time or time.perf_counter()
+            elapsed = end_time - self.start_time if self.start_time else 0.0
+            return {
+                "total": self.total_files,
+                "finished": self.finished_files,
+                "passed": self.counts[STATUS_PASS],
+                "failed": self.counts[STATUS_FAIL],
+                "errors": self.counts[STATUS_ERROR],
+                "elapsed_seconds": elapsed,
+                "files_per_second": self.finished_files / elapsed if elapsed else 0.0,
+                "megabytes_per_second": self.uploaded_bytes / (1024 * 1024) / elapsed if elapsed else 0.0,
+                "uploaded_bytes": self.uploaded_bytes,
+                "bytes_saved": self.bytes_saved,
+                "prescreen_rejected": self.prescreen_rejected,
+                "cloud_calls_avoided": self.prescreen_rejected * CLOUD_CALLS_PER_PHOTO
+            }
+
+    def latency_summary(self):
+        # Return the p50/p95 of every phase of the photos finished so far (see metrics_module.LatencyRecorder).
+        return self.latency.summary()
+
+    def shutdown(self, wait=True):
+        # Stop the thread pools, waiting for the running uploads and validations unless told otherwise.
+        if not wait:
+            self.result_poller.close()
+        self.upload_executor.shutdown(wait=wait, cancel_futures=not wait)
+        self.validation_executor.shutdown(wait=wait, cancel_futures=not wait)
+        self.result_poller.close()
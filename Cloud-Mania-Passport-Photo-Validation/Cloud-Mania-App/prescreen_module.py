@@ -0,0 +1,130 @@
+'''
+I created this module to reject the obviously unusable photos on the client, before they are uploaded.
+
+Validating a photo in the cloud costs an S3 PUT, a Rekognition DetectFaces call, a DynamoDB write and at least
+one API request, and takes several seconds, even for a photo that could never pass. prescreen checks a photo
+locally in a few milliseconds, on a small grayscale copy decoded in JPEG draft mode:
+    - Resolution: the width and height of the photo (read from its header, so the photo isn't decoded for it).
+    - Aspect ratio: width / height, after the EXIF orientation.
+    - Blur: the variance of the Laplacian of the copy. Sharp photos have strong edges, so a high variance.
+    - Exposure: the mean luminance, and the fractions of nearly black and nearly white pixels of the histogram,
+      of the centre of the copy, where the face is. Passport photos have a plain white or light background,
+      so nearly white pixels are normal there: a photo is overexposed when the mean luminance of its centre is
+      too high, and the clipping check only counts the nearly black pixels.
+A photo failing any check gets local failure reasons and is never uploaded. The thresholds (see
+DEFAULT_THRESHOLDS) can be overridden with a JSON file.
+
+Functions in this module:
+- load_thresholds: Returns the default thresholds, updated with the ones of a JSON file.
+- analyze: Returns the resolution, aspect ratio, blur score and exposure statistics of a photo.
+- prescreen: Returns the local failure reasons of a photo (empty if it may pass) and its statistics.
+'''
+
+# Import the json module to read the threshold files.
+import json
+# Import the time module to time the pre-screen.
+import time
+
+# Default thresholds of the pre-screen. A photo fails a check when its statistic is outside its bounds.
+DEFAULT_THRESHOLDS = {
+    # Smallest width and height (in pixels) of the original photo.
+    "min_width": 400,
+    "min_height": 400,
+    # Range of the aspect ratio (width / height). Passport photos are square (1:1) or portrait (35x45 mm).
+    "min_aspect_ratio": 0.6,
+    "max_aspect_ratio": 1.25,
+    # Smallest variance of the Laplacian of the analysis copy, below which the photo is considered blurred.
+    "min_blur_score": 15.0,
+    # Range of the mean luminance (0-255) of the centre of the photo.
+    "min_mean_luminance": 40.0,
+    "max_mean_luminance": 220.0,
+    # Largest fraction of nearly black (<= 10) pixels of the centre of the photo.
+    "max_clipped_fraction": 0.4
+}
+
+# Largest width and height (in pixels) of the grayscale copy the blur and exposure are measured on.
+ANALYSIS_SIZE = 256
+# Fraction of the width and height of the copy, around its centre, the exposure is measured on. It covers the
+# face of a passport photo and leaves out most of the background around it.
+EXPOSURE_CENTER_FRACTION = 0.5
+
+# EXIF orientations turning the photo by 90 degrees, so its width and height are swapped.
+ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+# EXIF tag of the orientation.
+EXIF_ORIENTATION_TAG = 0x0112
+
+# Local failure reasons.
+REASON_RESOLUTION = "LowResolution"
+REASON_ASPECT_RATIO = "AspectRatio"
+REASON_BLUR = "Blurry"
+REASON_UNDEREXPOSED = "Underexposed"
+REASON_OVEREXPOSED = "Overexposed"
+
+def load_thresholds(path=None):
+    # Return the default thresholds, updated with the ones of the JSON file if one is given.
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    if path:
+        with open(path, 'r') as thresholds_file:
+            overrides = json.load(thresholds_file)
+        unknown = set(overrides) - set(DEFAULT_THRESHOLDS)
+        if unknown:
+            raise ValueError(f"Unknown pre-screen thresholds: {', '.join(sorted(unknown))}")
+        thresholds.update(overrides)
+    return thresholds
+
+def analyze(file_path, analysis_size=ANALYSIS_SIZE, center_fraction=EXPOSURE_CENTER_FRACTION):
+    # Import PIL and NumPy only when a photo is pre-screened, so importing this module doesn't slow down the GUI start.
+    import numpy as np
+    from PIL import Image
+    with Image.open(file_path) as image:
+        width, height = image.size
+        # Swap the width and height of the photos the camera stored on their side.
+        if image.getexif().get(EXIF_ORIENTATION_TAG) in ROTATED_ORIENTATIONS:
+            width, height = height, width
+        # Let the JPEG decoder decode a grayscale copy at 1/2, 1/4 or 1/8 of the resolution.
+        image.draft("L", (analysis_size, analysis_size))
+        gray = image.convert("L")
+    gray.thumbnail((analysis_size, analysis_size))
+    pixels = np.asarray(gray, dtype=np.float32)
+    # Variance of the 4-neighbour Laplacian, computed on the inner pixels.
+    laplacian = (pixels[:-2, 1:-1] + pixels[2:, 1:-1] + pixels[1:-1, :-2] + pixels[1:-1, 2:]
+                 - 4 * pixels[1:-1, 1:-1])
+    # Histogram of the centre of the copy, leaving out the background around the face.
+    margin_x = round(gray.width * (1 - center_fraction) / 2)
+    margin_y = round(gray.height * (1 - center_fraction) / 2)
+    center = gray.crop((margin_x, margin_y, gray.width - margin_x, gray.height - margin_y))
+    histogram = np.asarray(center.histogram(), dtype=np.float64)
+    pixel_count = histogram.sum()
+    return {
+        "width": width,
+        "height": height,
+        "aspect_ratio": round(width / height, 4),
+        "blur_score": round(float(laplacian.var()), 2) if laplacian.size else 0.0,
+        "mean_luminance": round(float(histogram @ np.arange(256) / pixel_count), 2),
+        "dark_fraction": round(float(histogram[:11].sum() / pixel_count), 4),
+        "bright_fraction": round(float(histogram[245:].sum() / pixel_count), 4)
+    }
+
+def prescreen(file_path, thresholds=None):
+    '''
+    Returns (reasons, stats), where reasons lists the checks the photo fails (empty if the photo may pass,
+    in which case it still has to be validated in the cloud), and stats holds the statistics of analyze()
+    and the seconds taken.
+    '''
+    thresholds = thresholds or DEFAULT_THRESHOLDS
+    start_time = time.perf_counter()
+    stats = analyze(file_path)
+    reasons = []
+    if stats["width"] < thresholds["min_width"] or stats["height"] < thresholds["min_height"]:
+        reasons.append(REASON_RESOLUTION)
+    if not thresholds["min_aspect_ratio"] <= stats["aspect_ratio"] <= thresholds["max_aspect_ratio"]:
+        reasons.append(REASON_ASPECT_RATIO)
+    if stats["blur_score"] < thresholds["min_blur_score"]:
+        reasons.append(REASON_BLUR)
+    if stats["mean_luminance"] < thresholds["min_mean_luminance"] or stats["dark_fraction"] > thresholds["max_clipped_fraction"]:
+        reasons.append(REASON_UNDEREXPOSED)
+    # The white background around a small face can fill much of the centre, so nearly white pixels aren't counted.
+    if stats["mean_luminance"] > thresholds["max_mean_luminance"]:
+        reasons.append(REASON_OVEREXPOSED)
+    stats["seconds"] = round(time.perf_counter() - start_time, 4)
+    return reasons, stats
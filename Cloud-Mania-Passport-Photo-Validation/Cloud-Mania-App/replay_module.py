@@ -0,0 +1,378 @@
+'''
+I created this module to replay the validation rules over Rekognition responses that have already been
+recorded, without calling AWS.
+
+The validation Lambda stores the face details of every photo in DynamoDB, so thresholds can be tuned
+against the photos already validated instead of sending them to Rekognition again:
+    - load_face_table reads the records (DynamoDB exports, scan output or JSON Lines of items or API
+      responses) into a FaceTable: NumPy arrays with one row per face, across all the records.
+    - evaluate applies a threshold configuration to every face and every record at once, with array
+      operations instead of one attribute and one image at a time.
+    - compare evaluates a candidate configuration against the current rules and reports how PASS/FAIL
+      changes, with the reasons and examples of the records that changed.
+
+Every format the Lambda has written is read: the compressed FaceDetailsZ of every face, the FaceAttributes
+map of the first face, and the FaceDetails JSON string of the older items (only the evaluated attributes of
+the first face). The current rules take FaceDetails[0] only, like extract_face_details; a configuration can
+instead require every face, or the largest face, to pass, and limit the number of faces.
+
+Functions in this module:
+- from_dynamodb_json: Converts a value in DynamoDB JSON ({"S": ...}, {"N": ...}, ...) to plain Python.
+- iter_records: Yields the items of JSON Lines, JSON and gzipped export files.
+- get_faces: Returns the face details of an item, whatever the format it was written in.
+- load_face_table: Loads the faces of the items of many files into a FaceTable.
+- load_config: Reads a threshold configuration from a JSON file.
+- evaluate: Evaluates a threshold configuration over a FaceTable.
+- compare: Reports the PASS/FAIL changes between two threshold configurations.
+
+Classes in this module:
+- FaceTable: NumPy arrays of the attributes of every face of many records.
+'''
+
+# Import the base64 module to decode the binary attributes of the exports.
+import base64
+# Import the gzip module to read the compressed DynamoDB exports.
+import gzip
+# Import the json module to read the records and the configurations.
+import json
+# Import the zlib module to decompress the FaceDetailsZ attribute.
+import zlib
+# Import the Decimal class to convert the numbers read from DynamoDB.
+from decimal import Decimal
+# Import the NumPy library to evaluate the thresholds over every face at once.
+import numpy as np
+
+# Thresholds of the validation Lambda (FACE_DETAILS_THRESHOLDS in the CloudFormation templates).
+CURRENT_THRESHOLDS = {
+    "Smile": {"desiredValue": False, "minConfidence": 90},
+    "Sunglasses": {"desiredValue": False, "minConfidence": 90},
+    "EyesOpen": {"desiredValue": True, "minConfidence": 90},
+    "MouthOpen": {"desiredValue": False, "minConfidence": 90}
+}
+
+# Faces evaluated in every record: the first one (like the validation Lambda), all of them, or the largest one.
+FACE_POLICIES = ("first", "all", "largest")
+
+# Rules of the validation Lambda.
+CURRENT_CONFIG = {"thresholds": CURRENT_THRESHOLDS, "face_policy": "first", "min_faces": 1, "max_faces": None}
+
+# Boolean attributes of a face ({"Value": bool, "Confidence": number}) returned by DetectFaces.
+BOOLEAN_ATTRIBUTES = ("Smile", "Eyeglasses", "Sunglasses", "Beard", "Mustache", "EyesOpen", "MouthOpen", "FaceOccluded")
+
+# Attributes of the items read by the replay. The other attributes aren't converted.
+ITEM_ATTRIBUTES = ("FileName", "ImageName", "ValidationResult", "FaceDetailsZ", "FaceDetails", "FaceAttributes")
+
+# Numeric features of a face that thresholds can use with "min", "max" and "maxAbs".
+NUMERIC_FEATURES = {
+    "Confidence": ("Confidence",),
+    "Brightness": ("Quality", "Brightness"),
+    "Sharpness": ("Quality", "Sharpness"),
+    "Yaw": ("Pose", "Yaw"),
+    "Pitch": ("Pose", "Pitch"),
+    "Roll": ("Pose", "Roll")
+}
+
+# Reasons of the records failing on their faces rather than on an attribute.
+REASON_NO_FACE = "NoFace"
+REASON_FACE_COUNT = "FaceCount"
+
+# Number of changed records reported as examples.
+MAX_EXAMPLES = 20
+
+def from_dynamodb_json(value):
+    # Convert a typed DynamoDB value, e.g. {"M": {"Smile": {"M": {"Value": {"BOOL": false}}}}}.
+    (value_type, data), = value.items()
+    if value_type == "S":
+        return data
+    if value_type == "N":
+        return Decimal(data)
+    if value_type == "B":
+        return base64.b64decode(data)
+    if value_type == "BOOL":
+        return data
+    if value_type == "NULL":
+        return None
+    if value_type == "M":
+        return {name: from_dynamodb_json(nested) for name, nested in data.items()}
+    if value_type == "L":
+        return [from_dynamodb_json(nested) for nested in data]
+    if value_type == "SS":
+        return set(data)
+    if value_type == "NS":
+        return {Decimal(number) for number in data}
+    if value_type == "BS":
+        return {base64.b64decode(binary) for binary in data}
+    raise ValueError(f"Unknown DynamoDB type {value_type}")
+
+def to_item(record):
+    # Return the item of a record, which may be typed ({"Item": {...}} in the DynamoDB exports) or plain.
+    if "Item" in record and isinstance(record["Item"], dict):
+        record = record["Item"]
+    # A typed item has {"S": ...} as its file name, so only convert the attributes the replay reads.
+    if isinstance(record.get("FileName"), dict):
+        return {name: from_dynamodb_json(record[name]) for name in ITEM_ATTRIBUTES if name in record}
+    return record
+
+def open_file(path):
+    # Open gzipped files (the DynamoDB exports to S3) transparently.
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+def iter_records(path):
+    '''
+    Yields the items of a file, as plain dictionaries:
+    - JSON Lines (.jsonl, and the .json.gz files of a DynamoDB export to S3), with one item per line, typed
+      or not, e.g. the output of the detail mode of the API or of the command line interface.
+    - JSON (.json), with a list of items or the {"Items": [...]} output of "aws dynamodb scan".
+    '''
+    with open_file(path) as records_file:
+        first_char = records_file.read(1)
+        records_file.seek(0)
+        # A JSON document starting with "[" or holding "Items" is read at once, anything else line by line.
+        if first_char == "[" or (path.endswith(".json") and first_char == "{"):
+            try:
+                document = json.load(records_file)
+            except ValueError:
+                records_file.seek(0)
+            else:
+                for record in document if isinstance(document, list) else document.get("Items", [document]):
+                    yield to_item(record)
+                return
+        for line in records_file:
+            if line.strip():
+                yield to_item(json.loads(line))
+
+def get_faces(item):
+    '''
+    Returns (faces, complete), where faces is the list of the face details of the item, and complete is False
+    when only the first face was stored (the older items), so the number of faces isn't known.
+    '''
+    # The compressed FaceDetails of every face (base64 text when the item was read from plain JSON).
+    if item.get("FaceDetailsZ") is not None:
+        compressed = item["FaceDetailsZ"]
+        if isinstance(compressed, str):
+            compressed = base64.b64decode(compressed)
+        return json.loads(zlib.decompress(bytes(compressed))), True
+    face_details = item.get("FaceDetails")
+    # The older items store the evaluated attributes of the first face as a JSON string.
+    if isinstance(face_details, str):
+        face_details = json.loads(face_details)
+    # The detail mode of the API returns the FaceDetails of every face, and DetectFaces responses too.
+    if isinstance(face_details, list):
+        return face_details, True
+    if isinstance(face_details, dict):
+        return [face_details], False
+    # The typed attributes of the first face.
+    if isinstance(item.get("FaceAttributes"), dict):
+        return [item["FaceAttributes"]], False
+    return None, False
+
+class FaceTable:
+    '''
+    The faces of many records as NumPy arrays, one row per face:
+    - record_index: index of the record of the face, and face_index: index of the face in its record.
+    - values and confidences: {attribute: array} of the boolean attributes (see BOOLEAN_ATTRIBUTES),
+      with present telling which faces have the attribute.
+    - features: {feature: array} of the numeric features (see NUMERIC_FEATURES), NaN when missing.
+    - area: area of the bounding box of the face (NaN when missing).
+    and one entry per record: file_names, stored_results (the ValidationResult stored with the record),
+    face_counts and complete (False when only the first face was stored).
+    '''
+
+    def __init__(self, file_names, stored_results, face_counts, complete, record_index, face_index,
+                 values, confidences, present, features, area, skipped=0):
+        self.file_names = file_names
+        self.stored_results = stored_results
+        self.face_counts = face_counts
+        self.complete = complete
+        self.record_index = record_index
+        self.face_index = face_index
+        self.values = values
+        self.confidences = confidences
+        self.present = present
+        self.features = features
+        self.area = area
+        self.skipped = skipped
+
+    def __len__(self):
+        return len(self.file_names)
+
+    @property
+    def attributes(self):
+        return sorted(self.values)
+
+def load_face_table(paths):
+    # Read the faces of the items of every file into columns, then turn the columns into arrays.
+    file_names, stored_results, face_counts, complete = [], [], [], []
+    record_index, face_index, area = [], [], []
+    # {attribute: (rows, values, confidences)} of the faces having the attribute.
+    attribute_columns = {}
+    feature_columns = {feature: [] for feature in NUMERIC_FEATURES}
+    skipped = 0
+    face_total = 0
+    for path in paths:
+        for item in iter_records(path):
+            faces, faces_complete = get_faces(item)
+            if faces is None:
+                skipped += 1
+                continue
+            record = len(file_names)
+            file_names.append(item.get("FileName") or item.get("ImageName") or f"{path}#{record}")
+            stored_results.append(item.get("ValidationResult"))
+            face_counts.append(len(faces))
+            complete.append(faces_complete)
+            for position, face in enumerate(faces):
+                record_index.append(record)
+                face_index.append(position)
+                box = face.get("BoundingBox") or {}
+                area.append(float(box["Width"]) * float(box["Height"]) if "Width" in box and "Height" in box else np.nan)
+                for feature, path_keys in NUMERIC_FEATURES.items():
+                    value = face.get(path_keys[0])
+                    if len(path_keys) > 1:
+                        value = value.get(path_keys[1]) if isinstance(value, dict) else None
+                    feature_columns[feature].append(float(value) if value is not None else np.nan)
+                for attribute in BOOLEAN_ATTRIBUTES:
+                    detail = face.get(attribute)
+                    if detail is not None:
+                        rows, attribute_values, attribute_confidences = attribute_columns.setdefault(attribute, ([], [], []))
+                        rows.append(face_total)
+                        attribute_values.append(detail["Value"])
+                        attribute_confidences.append(float(detail["Confidence"]))
+                face_total += 1
+
+    values, confidences, present = {}, {}, {}
+    for attribute, (rows, attribute_values, attribute_confidences) in attribute_columns.items():
+        values[attribute] = np.zeros(face_total, dtype=bool)
+        confidences[attribute] = np.zeros(face_total, dtype=np.float32)
+        present[attribute] = np.zeros(face_total, dtype=bool)
+        values[attribute][rows] = attribute_values
+        confidences[attribute][rows] = attribute_confidences
+        present[attribute][rows] = True
+    return FaceTable(
+        file_names=np.array(file_names, dtype=object),
+        stored_results=np.array(stored_results, dtype=object),
+        face_counts=np.array(face_counts, dtype=np.int64),
+        complete=np.array(complete, dtype=bool),
+        record_index=np.array(record_index, dtype=np.int64),
+        face_index=np.array(face_index, dtype=np.int64),
+        values=values,
+        confidences=confidences,
+        present=present,
+        features={feature: np.array(column, dtype=np.float32) for feature, column in feature_columns.items()},
+        area=np.array(area, dtype=np.float32),
+        skipped=skipped
+    )
+
+def load_config(path):
+    '''
+    Reads a threshold configuration from a JSON file, either a FACE_DETAILS_THRESHOLDS-like dictionary, or
+    {"thresholds": {...}, "face_policy": "first" | "all" | "largest", "min_faces": 1, "max_faces": null}.
+    A threshold is {"desiredValue": bool, "minConfidence": number} for a boolean attribute (see
+    BOOLEAN_ATTRIBUTES), or {"min": number, "max": number, "maxAbs": number} for a numeric feature (Sharpness, Yaw...).
+    '''
+    with open(path, 'r') as config_file:
+        config = json.load(config_file)
+    if "thresholds" not in config:
+        config = {"thresholds": config}
+    config = {**CURRENT_CONFIG, **config}
+    if config["face_policy"] not in FACE_POLICIES:
+        raise ValueError(f"face_policy must be one of {', '.join(FACE_POLICIES)}")
+    return config
+
+def select_faces(table, face_policy):
+    # Return the mask of the faces evaluated in every record.
+    if face_policy == "first":
+        return table.face_index == 0
+    if face_policy == "all":
+        return np.ones(len(table.face_index), dtype=bool)
+    # The largest face of every record: sort by record, then by decreasing area, and keep the first of each record.
+    area = np.nan_to_num(table.area, nan=-1.0)
+    order = np.lexsort((-area, table.record_index))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = table.record_index[order][1:] != table.record_index[order][:-1]
+    mask = np.zeros(len(order), dtype=bool)
+    mask[order[first]] = True
+    return mask
+
+def evaluate(table, config=CURRENT_CONFIG):
+    '''
+    Evaluates the configuration over every record of the table and returns (passed, reasons), where passed
+    is a boolean array with one entry per record, and reasons maps every failure reason to the boolean array
+    of the records failing for it. A record fails an attribute if any of its evaluated faces fails it.
+    '''
+    record_count = len(table)
+    selected = select_faces(table, config["face_policy"])
+    selected_records = table.record_index[selected]
+    reasons = {}
+    for name, threshold in config["thresholds"].items():
+        if name in NUMERIC_FEATURES:
+            feature = table.features[name]
+            # A missing feature fails, since it can't be checked.
+            failing = np.isnan(feature)
+            if threshold.get("min") is not None:
+                failing |= feature < threshold["min"]
+            if threshold.get("max") is not None:
+                failing |= feature > threshold["max"]
+            if threshold.get("maxAbs") is not None:
+                failing |= np.abs(feature) > threshold["maxAbs"]
+        elif name in table.values:
+            # The same checks as evaluate_face: the wrong value, or a confidence below the minimum.
+            failing = ~table.present[name] | (table.values[name] != bool(threshold["desiredValue"]))
+            if threshold.get("minConfidence") is not None:
+                failing |= table.confidences[name] < threshold["minConfidence"]
+        else:
+            # No face has the attribute, so every record with a face fails it.
+            failing = np.ones(len(table.record_index), dtype=bool)
+        # A record fails if any of its evaluated faces fails.
+        reasons[name] = np.bincount(selected_records, weights=failing[selected], minlength=record_count) > 0
+    # The records without faces, and (if limited) with too many faces.
+    if config.get("min_faces"):
+        reasons[REASON_NO_FACE] = table.face_counts < config["min_faces"]
+    if config.get("max_faces") is not None:
+        reasons[REASON_FACE_COUNT] = table.complete & (table.face_counts > config["max_faces"])
+    failed = np.zeros(record_count, dtype=bool)
+    for failing_records in reasons.values():
+        failed |= failing_records
+    return ~failed, reasons
+
+def compare(table, candidate, baseline=CURRENT_CONFIG, max_examples=MAX_EXAMPLES):
+    # Evaluate both configurations and report the records whose result changes.
+    baseline_passed, baseline_reasons = evaluate(table, baseline)
+    candidate_passed, candidate_reasons = evaluate(table, candidate)
+    newly_failed = baseline_passed & ~candidate_passed
+    newly_passed = ~baseline_passed & candidate_passed
+    # How many of the stored results the baseline reproduces, as a check of the replay.
+    stored = np.isin(table.stored_results, ["PASS", "FAIL"])
+    reproduced = stored & ((table.stored_results == "PASS") == baseline_passed)
+    return {
+        "records": len(table),
+        "skipped_records": table.skipped,
+        "faces": len(table.record_index),
+        "multi_face_records": int(np.count_nonzero(table.face_counts > 1)),
+        "stored_results_reproduced": f"{int(np.count_nonzero(reproduced))}/{int(np.count_nonzero(stored))}",
+        "baseline": {
+            "passed": int(np.count_nonzero(baseline_passed)),
+            "failed": int(np.count_nonzero(~baseline_passed)),
+            "reasons": {name: int(np.count_nonzero(records)) for name, records in baseline_reasons.items()}
+        },
+        "candidate": {
+            "passed": int(np.count_nonzero(candidate_passed)),
+            "failed": int(np.count_nonzero(~candidate_passed)),
+            "reasons": {name: int(np.count_nonzero(records)) for name, records in candidate_reasons.items()}
+        },
+        "pass_to_fail": int(np.count_nonzero(newly_failed)),
+        "fail_to_pass": int(np.count_nonzero(newly_passed)),
+        "examples": {
+            "pass_to_fail": [
+                {"FileName": table.file_names[record],
+                 "Reasons": [name for name, records in candidate_reasons.items() if records[record]]}
+                for record in np.flatnonzero(newly_failed)[:max_examples]
+            ],
+            "fail_to_pass": [
+                {"FileName": table.file_names[record],
+                 "Reasons": [name for name, records in baseline_reasons.items() if records[record]]}
+                for record in np.flatnonzero(newly_passed)[:max_examples]
+            ]
+        }
+    }
@@ -0,0 +1,119 @@
+'''
+I created this module to remember the validation results of the photos that have already been validated.
+
+The results are stored in a local SQLite database, keyed by the SHA-256 of the contents of the photo.
+When the same photo is submitted again (even under another name), its stored ValidationResult and
+FailureReasons are returned straight away, without uploading it or calling the API.
+The database keeps at most max_entries results and evicts the least recently used ones first.
+
+Functions in this module:
+- hash_file: Returns the SHA-256 of the contents of a file, reading it in chunks.
+- content_key: Returns the content-addressed S3 object key of a file.
+
+Classes in this module:
+- ResultCache: SQLite-backed cache of validation results with hit/miss counters.
+'''
+
+# Import the hashlib module to hash the contents of the photos.
+import hashlib
+# Import the json module to store the failure reasons.
+import json
+# Import the os module to build the path to the cache database.
+import os
+# Import the sqlite3 module to store the results in a local database.
+import sqlite3
+# Import the threading module to share the database connection between the worker threads.
+import threading
+# Import the time module to track when each result was last used.
+import time
+
+# Default path of the cache database.
+DEFAULT_RESULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cloudmania", "result-cache.sqlite3")
+# Default maximum number of results kept in the cache.
+DEFAULT_MAX_ENTRIES = 50000
+# Size of the chunks the photos are read in while they are hashed.
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def hash_file(file_path, chunk_size=HASH_CHUNK_SIZE):
+    # Hash the file one chunk at a time, so big files are never loaded in memory all at once.
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as photo_file:
+        for chunk in iter(lambda: photo_file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def content_key(sha256, file_path):
+    # Name the S3 object after the hash of its contents, keeping the extension of the file.
+    extension = os.path.splitext(file_path)[1].lower()
+    return f"{sha256}{extension}"
+
+class ResultCache:
+    '''
+    Local cache of validation results keyed by the SHA-256 of the photos.
+    Safe to use from several threads at once.
+    '''
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path or os.environ.get("RESULT_CACHE_PATH", DEFAULT_RESULT_CACHE_PATH)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "sha256 TEXT PRIMARY KEY, "
+                "validation_result TEXT NOT NULL, "
+                "failure_reasons TEXT, "
+                "s3_key TEXT, "
+                "created_at REAL NOT NULL, "
+                "last_used REAL NOT NULL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+
+    def get(self, sha256):
+        # Return the stored result of the photo, or None if it has never been validated.
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT validation_result, failure_reasons, s3_key FROM results WHERE sha256 = ?", (sha256,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Mark the result as recently used, so it is evicted last.
+            self.connection.execute("UPDATE results SET last_used = ? WHERE sha256 = ?", (time.time(), sha256))
+        return {
+            "ValidationResult": row[0],
+            "FailureReasons": json.loads(row[1]) if row[1] is not None else None,
+            "Key": row[2]
+        }
+
+    def put(self, sha256, validation_result, failure_reasons, s3_key):
+        # Store the result of the photo and evict the least recently used results above max_entries.
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (sha256, validation_result, json.dumps(failure_reasons) if failure_reasons is not None else None,
+                 s3_key, now, now)
+            )
+            self.connection.execute(
+                "DELETE FROM results WHERE sha256 IN ("
+                "SELECT sha256 FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def stats(self):
+        # Return the hit/miss counters and the number of stored results.
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self):
+        # Close the database connection.
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,165 @@
+'''
+I created this module to follow the progress of a CloudFormation stack operation through its stack events.
+
+Instead of calling describe_stacks at a fixed interval, the StackEventMonitor reads describe_stack_events
+incrementally: it remembers the last event it has seen and only reads the pages with newer events.
+The poll interval adapts to the activity of the stack. It stays short while resources are changing and
+backs off while nothing happens. Every resource event is reported as it arrives, so failures are shown
+as soon as CloudFormation records them.
+execute_change_set returns before the stack is updated, so right after it the stack times can still be the
+ones of the previous operation. The caller can then give the CreationTime of the change set as started_after,
+and the events older than it (the ones of the previous operation) are never taken for the current operation.
+
+Classes in this module:
+- StackEventMonitor: Waits for a stack operation to finish and reports the progress of each resource.
+'''
+
+# Import the time module to wait between two polls.
+import time
+# Import the timedelta class to allow for a small difference between the stack and event timestamps.
+from datetime import timedelta
+
+# Fastest and slowest poll interval (in seconds), and the factor the interval grows by while nothing changes.
+MIN_POLL_SECONDS = 1.0
+MAX_POLL_SECONDS = 15.0
+BACKOFF_FACTOR = 1.5
+
+# Stack statuses that start a stack operation.
+START_STATUSES = {"CREATE_IN_PROGRESS", "UPDATE_IN_PROGRESS", "DELETE_IN_PROGRESS", "IMPORT_IN_PROGRESS"}
+
+# Stack statuses that end a stack operation.
+TERMINAL_STATUSES = {
+    "CREATE_COMPLETE", "CREATE_FAILED",
+    "ROLLBACK_COMPLETE", "ROLLBACK_FAILED",
+    "UPDATE_COMPLETE", "UPDATE_FAILED", "UPDATE_ROLLBACK_COMPLETE", "UPDATE_ROLLBACK_FAILED",
+    "DELETE_COMPLETE", "DELETE_FAILED",
+    "IMPORT_COMPLETE", "IMPORT_ROLLBACK_COMPLETE", "IMPORT_ROLLBACK_FAILED"
+}
+
+# Allowed difference between the start time of the operation and the timestamp of its first event.
+EVENT_TIME_MARGIN = timedelta(seconds=1)
+
+class StackEventMonitor:
+    '''
+    Waits for the current operation of a stack to finish by reading its stack events incrementally.
+
+    The resources attribute maps the logical ID of every resource seen during the operation to its latest
+    status, and api_calls counts the CloudFormation calls made by the monitor.
+    If started_after is given (a CloudFormation timestamp the operation started after, such as the CreationTime
+    of the change set it executes), the events older than it are ignored.
+    '''
+
+    def __init__(self, cf, stack_name, min_interval=MIN_POLL_SECONDS, max_interval=MAX_POLL_SECONDS,
+                 backoff=BACKOFF_FACTOR, sleep=time.sleep, started_after=None):
+        self.cf = cf
+        self.stack_name = stack_name
+        self.started_after = started_after
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.sleep = sleep
+        self.stack_id = None
+        self.operation_start = None
+        self.last_event_id = None
+        self.operation_started = False
+        self.resources = {}
+        self.api_calls = 0
+
+    def describe_stack(self):
+        # Get the ID of the stack and the start time of its current operation.
+        # Returns False if the stack does not exist.
+        try:
+            self.api_calls += 1
+            stack = self.cf.describe_stacks(StackName=self.stack_name)['Stacks'][0]
+        except self.cf.exceptions.ClientError as e:
+            if "does not exist" in str(e):
+                return False
+            raise
+        # Keep the stack ID, since the events of a deleted stack can only be read with its ID.
+        self.stack_id = stack['StackId']
+        # The current operation started at the most recent of the creation, update and deletion times, allowing
+        # for the first event to be a little older. These can still be the times of the previous operation when
+        # the current one hasn't been started yet, so the operation can't have started before started_after.
+        times = [stack.get(key) for key in ("CreationTime", "LastUpdatedTime", "DeletionTime")]
+        self.operation_start = max(t for t in times if t is not None) - EVENT_TIME_MARGIN
+        if self.started_after is not None:
+            self.operation_start = max(self.operation_start, self.started_after)
+        return True
+
+    def poll(self):
+        # Return the events recorded since the last poll, oldest first.
+        new_events = []
+        kwargs = {"StackName": self.stack_id}
+        while True:
+            self.api_calls += 1
+            response = self.cf.describe_stack_events(**kwargs)
+            for event in response['StackEvents']:
+                # The events are returned newest first, so stop at the last event already seen
+                # or at the first event that belongs to a previous operation.
+                if event['EventId'] == self.last_event_id or event['Timestamp'] < self.operation_start:
+                    return self.remember(new_events)
+                new_events.append(event)
+            # Read the next page of older events, if there is one.
+            if 'NextToken' not in response:
+                return self.remember(new_events)
+            kwargs["NextToken"] = response['NextToken']
+
+    def remember(self, new_events):
+        # Move the cursor to the newest event and return the events in chronological order.
+        if new_events:
+            self.last_event_id = new_events[0]['EventId']
+        return list(reversed(new_events))
+
+    def is_stack_event(self, event):
+        # Check if the event is about the stack itself rather than one of its resources.
+        return event.get('ResourceType') == "AWS::CloudFormation::Stack" and \
+               event.get('PhysicalResourceId') == self.stack_id
+
+    def progress(self):
+        # Return the number of resources that have finished and the number of resources seen.
+        finished = sum(1 for status in self.resources.values() if status.endswith("_COMPLETE"))
+        return finished, len(self.resources)
+
+    def wait(self, desired_status, on_event=None, on_progress=None):
+        '''
+        Waits until the current stack operation ends and returns True if the stack reached the desired status.
+        on_event(event, monitor) is called for every resource event, and on_progress(text, color) with
+        a summary of the progress of the operation.
+        '''
+        on_event = on_event or (lambda event, monitor: None)
+        on_progress = on_progress or (lambda text, color: None)
+        # A stack that doesn't exist has nothing to wait for, and is what a deletion is waiting for.
+        if not self.describe_stack():
+            on_progress(f"Stack {self.stack_name} does not exist", "green" if desired_status == "DELETE_COMPLETE" else "red")
+            return desired_status == "DELETE_COMPLETE"
+        interval = self.min_interval
+        while True:
+            events = self.poll()
+            for event in events:
+                status = event['ResourceStatus']
+                if self.is_stack_event(event):
+                    # Ignore the stack events of the previous operation until the current one has started.
+                    if status in START_STATUSES:
+                        self.operation_started = True
+                    if self.operation_started and status in TERMINAL_STATUSES:
+                        succeeded = status == desired_status
+                        on_progress(f"Stack {self.stack_name} is {status}", "green" if succeeded else "red")
+                        return succeeded
+                    continue
+                # Keep the latest status of every resource and report the event.
+                self.resources[event['LogicalResourceId']] = status
+                on_event(event, self)
+                # Report failed resources as soon as they are recorded.
+                if status.endswith("_FAILED"):
+                    reason = event.get('ResourceStatusReason', "")
+                    on_progress(f"{event['LogicalResourceId']} {status}: {reason}", "red")
+                else:
+                    finished, total = self.progress()
+                    on_progress(f"Waiting for stack {self.stack_name} to reach status {desired_status}... "
+                                f"({finished}/{total} resources done, latest: {event['LogicalResourceId']} {status})", "blue")
+            # Poll again soon while resources are changing, and back off while nothing happens.
+            if events:
+                interval = self.min_interval
+            else:
+                interval = min(interval * self.backoff, self.max_interval)
+            self.sleep(interval)
@@ -0,0 +1,378 @@
+'''
+I created this module to store the functions that fetch the validation results from the Cloud Mania API.
+
+The validation Lambda writes the result of a photo to DynamoDB a few seconds after the photo is uploaded,
+and the API answers 404 until then. Instead of sleeping for a fixed time and asking once, a ResultPoller
+polls the API with exponential backoff and jitter until the result is available or a deadline is reached.
+All the requests share one keep-alive HTTP session with a connection pool, so polling doesn't open a new
+connection (and TLS handshake) for every request. The requests library is imported when the session is
+created rather than with this module, so the GUI can open its window without loading it.
+
+When many photos are waiting for their results (batch uploads and the CLI), the ResultPoller asks for all of
+them at once with the batch form of the API (POST /images), instead of making one request per photo.
+A photo uploaded under the name of an already validated one overwrites its object, but the API keeps returning
+the old result until the Lambda writes the new one. So the ResultPoller can be given the ETag S3 gave the
+upload, and only accepts the result the Lambda wrote for that ETag. Both come from S3, so the clock of this
+machine plays no part. The ETag is sent with the requests too, so the API doesn't answer from its cache with
+the result of the older upload.
+
+Functions in this module:
+- create_http_session: Creates a requests session with a keep-alive connection pool.
+- get_http_session: Returns the HTTP session shared by the whole app.
+- fetch_result: Makes one request for the validation result of an image.
+- get_failure_reasons: Returns the failure reasons of a validation result as a list.
+- fetch_results: Makes one batch request for the validation results of many images.
+
+Classes in this module:
+- ResultPoller: Polls the API for the results of many images from one thread, batching the requests.
+'''
+
+# Import the json module to read the failure reasons of the older results.
+import json
+# Import the random module to add jitter to the poll delays.
+import random
+# Import the threading module to create the shared HTTP session only once and to run the ResultPoller.
+import threading
+# Import the time module to schedule the polls and time the requests.
+import time
+# Import the Future class to hand the results of the ResultPoller to the waiting threads.
+from concurrent.futures import Future
+# Import the TimeoutError of the futures to stop waiting for a poller that doesn't answer.
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# Number of connections kept open to the API.
+HTTP_POOL_SIZE = 16
+# Seconds to wait for the API to answer a single request.
+HTTP_TIMEOUT_SECONDS = 10
+
+# Delay before the first poll, the longest delay between two polls, and the factor the delay grows by.
+INITIAL_POLL_DELAY_SECONDS = 0.5
+MAX_POLL_DELAY_SECONDS = 4.0
+POLL_BACKOFF_FACTOR = 1.6
+# Fraction of the delay that is randomized, so many clients polling at once don't stay in step.
+POLL_JITTER = 0.25
+# Seconds to wait for a validation result before giving up.
+RESULT_DEADLINE_SECONDS = 60.0
+
+# Status codes meaning the result isn't available yet, or that the request is worth retrying.
+RETRY_STATUS_CODES = {404, 429, 500, 502, 503, 504}
+
+# Maximum number of image names of a batch request, matching the limit of the API.
+BATCH_MAX_NAMES = 500
+# Seconds a poll may be brought forward, so the polls of photos uploaded close together share a request.
+BATCH_COALESCE_SECONDS = 0.25
+# Status codes of a batch request meaning the deployed API has no batch form (an older stack).
+BATCH_UNSUPPORTED_STATUS_CODES = {404, 405}
+# Seconds a ResultPoller waiter waits past the deadline of its image, for a request still running at the deadline.
+WAIT_MARGIN_SECONDS = 3 * HTTP_TIMEOUT_SECONDS
+
+# HTTP session shared by the whole app, created on first use.
+http_session = None
+# Lock protecting the creation of the shared HTTP session.
+http_session_lock = threading.Lock()
+
+class ResultTimeoutError(TimeoutError):
+    '''
+    Raised when the validation result of an image isn't available before the deadline.
+    '''
+
+def create_http_session(pool_size=HTTP_POOL_SIZE):
+    # Import the requests library only when the first session is created, so importing this module doesn't
+    # slow down the GUI start.
+    import requests
+    from requests.adapters import HTTPAdapter
+    # Create a session that keeps its connections open between requests.
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_http_session():
+    # Create the shared HTTP session the first time it is needed.
+    global http_session
+    with http_session_lock:
+        if http_session is None:
+            http_session = create_http_session()
+        return http_session
+
+def fetch_result(invoke_url, image_name, session=None, detail=False, etag=None):
+    # Make one GET request for the validation result of the image and return the response.
+    # With detail=True, the API returns the whole result, with the face details of every face.
+    # With an etag, the API doesn't answer from its cache with the result of another upload of the image.
+    session = session or get_http_session()
+    params = {'imageName': image_name, 'detail': 'true'} if detail else {'imageName': image_name}
+    if etag is not None:
+        params['etag'] = etag
+    return session.get(f'{invoke_url}/images', params=params, timeout=HTTP_TIMEOUT_SECONDS)
+
+def get_failure_reasons(response_json):
+    # The results written before the compact item layout store the failure reasons as a JSON string.
+    failure_reasons = response_json.get('FailureReasons')
+    if isinstance(failure_reasons, str):
+        return json.loads(failure_reasons)
+    return failure_reasons
+
+def fetch_results(invoke_url, image_names, session=None, detail=False, etags=None):
+    # Make one POST request for the validation results of the images and return the response.
+    # The etags ({image name: ETag}) work as the etag of fetch_result.
+    session = session or get_http_session()
+    body = {'imageNames': list(image_names), 'detail': detail}
+    if etags:
+        body['etags'] = etags
+    return session.post(f'{invoke_url}/images', json=body, timeout=HTTP_TIMEOUT_SECONDS)
+
+class ResultPoller:
+    '''
+    Polls the API for the validation results of many images from a single background thread.
+    Every image keeps its own schedule (exponential backoff with jitter, up to a deadline), and the
+    images due at the same time are looked up together: with a single GET when only one image is due, and
+    with the batch form of the API when more than one is. If the deployed API has no batch form, the poller
+    falls back to single requests for good.
+    An image submitted with the etag of its upload only takes a result with the same ETag: another ETag means
+    the result of a previous photo of the same name, so the image is polled again until the new result is
+    written. A result without an ETag (written by a stack deployed before the ETag was stored) is taken as it is.
+    Any unexpected error of a request (a 200 that isn't JSON, a broken connection, ...) is retried like a 404
+    until the deadline, so the polling thread never dies and leaves the waiters hanging.
+    '''
+
+    def __init__(self, session=None, deadline=RESULT_DEADLINE_SECONDS, initial_delay=INITIAL_POLL_DELAY_SECONDS,
+                 max_delay=MAX_POLL_DELAY_SECONDS, backoff=POLL_BACKOFF_FACTOR, jitter=POLL_JITTER,
+                 batch_size=BATCH_MAX_NAMES, coalesce=BATCH_COALESCE_SECONDS, clock=time.monotonic):
+        self.session = session
+        self.deadline = deadline
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.jitter = jitter
+        self.batch_size = batch_size
+        self.coalesce = coalesce
+        self.clock = clock
+        self.batch_supported = True
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.thread = None
+        self.closed = False
+        self.requests = 0
+        self.batch_requests = 0
+
+    def submit(self, invoke_url, image_name, etag=None):
+        # Start polling for the result of the image and return a Future of its result dictionary.
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("The result poller is closed.")
+            key = (invoke_url, image_name)
+            entry = self.pending.get(key)
+            if entry is None:
+                now = self.clock()
+                entry = {
+                    "future": Future(),
+                    "delay": self.initial_delay,
+                    "next_poll_at": now + self.jittered(self.initial_delay),
+                    "give_up_at": now + self.deadline,
+                    "last_error": "no response",
+                    "polls": 0,
+                    "request_seconds": None,
+                    "etag": etag
+                }
+                self.pending[key] = entry
+            # An image submitted again after a new upload needs the result of that upload.
+            elif etag is not None:
+                entry["etag"] = etag
+            # Start the polling thread the first time it is needed.
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="cloudmania-result-poller", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+            return entry["future"]
+
+    def wait(self, invoke_url, image_name, poll_stats=None, etag=None):
+        '''
+        Blocks until the result of the image is available and returns it as a dictionary.
+        A 404 means the validation Lambda hasn't written the result yet. 404, throttling, server errors and request
+        errors are retried until the deadline, then ResultTimeoutError is raised. Any other error response raises
+        requests.HTTPError straight away.
+        With an etag, the result must be the one of the upload with that ETag (see the class docstring).
+        If a poll_stats dictionary is given, it is updated with the number of requests made for the image
+        ("polls") and the seconds taken by the request that returned its result ("request_seconds").
+        '''
+        future = self.submit(invoke_url, image_name, etag)
+        try:
+            # The poller fails the image at its deadline, so only wait a little longer than that.
+            response_json = future.result(timeout=self.deadline + WAIT_MARGIN_SECONDS)
+        except FutureTimeoutError:
+            # A ResultTimeoutError of the poller is a TimeoutError too, so only handle the wait timing out.
+            if future.done():
+                raise
+            # Stop polling for the image, unless it has been submitted again since.
+            with self.condition:
+                entry = self.pending.get((invoke_url, image_name))
+                if entry is not None and entry["future"] is future:
+                    del self.pending[(invoke_url, image_name)]
+            raise ResultTimeoutError(f"No validation result for {image_name} after {self.deadline:.0f}s (poller not responding)")
+        if poll_stats is not None:
+            poll_stats.update(future.poll_stats)
+        return response_json
+
+    def jittered(self, delay):
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def run(self):
+        # Poll for the images that are due, then sleep until the next one is.
+        while True:
+            with self.condition:
+                while not self.closed and not self.pending:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                now = self.clock()
+                next_poll_at = min(entry["next_poll_at"] for entry in self.pending.values())
+                if next_poll_at > now:
+                    self.condition.wait(next_poll_at - now)
+                    continue
+                # Take the images that are due, and the ones almost due, so they share the requests.
+                due = {}
+                for invoke_url, image_name in self.pending:
+                    if self.pending[(invoke_url, image_name)]["next_poll_at"] <= now + self.coalesce:
+                        due.setdefault(invoke_url, []).append(image_name)
+            for invoke_url, image_names in due.items():
+                try:
+                    self.poll(invoke_url, image_names)
+                # Retry the images of a request that failed in an unexpected way, so the thread keeps polling.
+                except Exception as e:
+                    for image_name in image_names:
+                        self.retry(invoke_url, image_name, f"{type(e).__name__}: {e}")
+
+    def poll(self, invoke_url, image_names):
+        # Use one GET for a single image, and the batch form for more.
+        if len(image_names) == 1 or not self.batch_supported:
+            for image_name in image_names:
+                self.poll_single(invoke_url, image_name)
+            return
+        for start in range(0, len(image_names), self.batch_size):
+            self.poll_batch(invoke_url, image_names[start:start + self.batch_size])
+
+    def get_etags(self, invoke_url, image_names):
+        # Return the ETags of the uploads the images are waited for, by image name.
+        with self.condition:
+            entries = [(image_name, self.pending.get((invoke_url, image_name))) for image_name in image_names]
+            return {image_name: entry["etag"] for image_name, entry in entries if entry and entry["etag"] is not None}
+
+    def poll_single(self, invoke_url, image_name):
+        import requests
+        self.requests += 1
+        request_start = time.perf_counter()
+        try:
+            etag = self.get_etags(invoke_url, [image_name]).get(image_name)
+            response = fetch_result(invoke_url, image_name, self.session, etag=etag)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            self.retry(invoke_url, image_name, str(e))
+            return
+        finally:
+            self.record_request(invoke_url, [image_name], time.perf_counter() - request_start)
+        if response.status_code == 200:
+            self.resolve(invoke_url, image_name, response.json())
+        elif response.status_code in RETRY_STATUS_CODES:
+            self.retry(invoke_url, image_name, f"HTTP {response.status_code}")
+        else:
+            self.fail(invoke_url, image_name, requests.HTTPError(
+                f"Unexpected HTTP {response.status_code} for {image_name}", response=response))
+
+    def poll_batch(self, invoke_url, image_names):
+        import requests
+        self.requests += 1
+        self.batch_requests += 1
+        request_start = time.perf_counter()
+        try:
+            response = fetch_results(invoke_url, image_names, self.session, etags=self.get_etags(invoke_url, image_names))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            for image_name in image_names:
+                self.retry(invoke_url, image_name, str(e))
+            return
+        finally:
+            self.record_request(invoke_url, image_names, time.perf_counter() - request_start)
+        # An older stack has no POST /images route, so poll one image at a time from now on.
+        if response.status_code in BATCH_UNSUPPORTED_STATUS_CODES:
+            self.batch_supported = False
+            for image_name in image_names:
+                self.poll_single(invoke_url, image_name)
+            return
+        if response.status_code in RETRY_STATUS_CODES:
+            for image_name in image_names:
+                self.retry(invoke_url, image_name, f"HTTP {response.status_code}")
+            return
+        if response.status_code != 200:
+            for image_name in image_names:
+                self.fail(invoke_url, image_name, requests.HTTPError(
+                    f"Unexpected HTTP {response.status_code} for the batch of {image_name}", response=response))
+            return
+        # Every name has its own status code: 200 with its item, 404 until it is written, 503 if not looked up.
+        results = {result["ImageName"]: result for result in response.json().get("Results", [])}
+        for image_name in image_names:
+            result = results.get(image_name, {"StatusCode": 503})
+            if result["StatusCode"] == 200:
+                self.resolve(invoke_url, image_name, result["Item"])
+            elif result["StatusCode"] in RETRY_STATUS_CODES:
+                self.retry(invoke_url, image_name, f"HTTP {result['StatusCode']}")
+            else:
+                self.fail(invoke_url, image_name, requests.HTTPError(
+                    f"Unexpected HTTP {result['StatusCode']} for {image_name}"))
+
+    def record_request(self, invoke_url, image_names, seconds):
+        # Count the request for every image it asked for, and remember how long it took.
+        with self.condition:
+            for image_name in image_names:
+                entry = self.pending.get((invoke_url, image_name))
+                if entry is not None:
+                    entry["polls"] += 1
+                    entry["request_seconds"] = seconds
+
+    def resolve(self, invoke_url, image_name, response_json):
+        # The image may already be gone, if the poller was closed or the waiter gave up.
+        with self.condition:
+            entry = self.pending.get((invoke_url, image_name))
+            if entry is None:
+                return
+            # Keep polling if the result is the one of another upload, as it belongs to a previous photo of the same name.
+            result_etag = response_json.get("ETag")
+            stale = entry["etag"] is not None and result_etag is not None and result_etag != entry["etag"]
+            if not stale:
+                del self.pending[(invoke_url, image_name)]
+        if stale:
+            self.retry(invoke_url, image_name, "result of an older upload")
+            return
+        # Hand the poll statistics to wait() along with the result.
+        entry["future"].poll_stats = {"polls": entry["polls"], "request_seconds": entry["request_seconds"]}
+        entry["future"].set_result(response_json)
+
+    def fail(self, invoke_url, image_name, error):
+        with self.condition:
+            entry = self.pending.pop((invoke_url, image_name), None)
+        if entry is None:
+            return
+        entry["future"].set_exception(error)
+
+    def retry(self, invoke_url, image_name, last_error):
+        # Schedule the next poll of the image with backoff, or give up once its deadline has been reached.
+        with self.condition:
+            entry = self.pending.get((invoke_url, image_name))
+            if entry is None:
+                return
+            entry["last_error"] = last_error
+            now = self.clock()
+            if now < entry["give_up_at"]:
+                entry["next_poll_at"] = min(now + self.jittered(entry["delay"]), entry["give_up_at"])
+                entry["delay"] = min(entry["delay"] * self.backoff, self.max_delay)
+                return
+            del self.pending[(invoke_url, image_name)]
+        entry["future"].set_exception(ResultTimeoutError(
+            f"No validation result for {image_name} after {self.deadline:.0f}s ({last_error})"))
+
+    def close(self):
+        # Stop the polling thread and fail the images still waiting for their results.
+        with self.condition:
+            self.closed = True
+            pending, self.pending = self.pending, {}
+            self.condition.notify()
+        for (invoke_url, image_name), entry in pending.items():
+            entry["future"].set_exception(RuntimeError(f"Stopped waiting for the validation result of {image_name}."))
@@ -0,0 +1,88 @@
+'''
+I created this module to run the blocking AWS and HTTP calls of the app off the Tk main thread.
+
+Tkinter widgets may only be touched from the thread that runs root.mainloop(), so the work is split in two:
+- The boto3/requests calls run on a small thread pool.
+- Their results (and any GUI updates they want to make) are put on a queue that the Tk main thread
+  drains with root.after, so callbacks always run on the main thread.
+
+Functions in this module:
+- submit: Runs a function on the worker thread pool and queues its result for the main thread.
+- post: Queues a function to be called on the Tk main thread.
+- start: Starts draining the result queue from the Tk event loop.
+- shutdown: Stops the worker thread pool.
+'''
+
+# Import the queue module to hand results from the worker threads to the Tk main thread.
+import queue
+# Import the traceback module to report the callbacks that raise.
+import traceback
+# Import the ThreadPoolExecutor class to run the blocking calls in the background.
+from concurrent.futures import ThreadPoolExecutor
+
+# Maximum number of background threads running AWS and HTTP calls at the same time.
+MAX_WORKERS = 4
+
+# Fastest and slowest interval (in milliseconds) at which the Tk main thread drains the result queue.
+# The interval backs off while the queue stays empty, so an idle window wakes up only a few times a second.
+MIN_POLL_INTERVAL_MS = 20
+MAX_POLL_INTERVAL_MS = 250
+
+# Thread pool running the blocking calls.
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="cloudmania-worker")
+
+# Queue of (callback, args) tuples waiting to be called on the Tk main thread.
+results = queue.Queue()
+
+def submit(func, *args, on_success=None, on_error=None, **kwargs):
+    # Wrap the function so its result or exception is handed back to the Tk main thread.
+    def run():
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            # Hand the exception to the error callback if one was given.
+            if on_error is not None:
+                results.put((on_error, (e,)))
+            # Otherwise re-raise it so it is stored on the returned future.
+            else:
+                raise
+        else:
+            # Hand the result to the success callback if one was given.
+            if on_success is not None:
+                results.put((on_success, (result,)))
+        return None
+    # Run the wrapped function on the thread pool and return its future.
+    return executor.submit(run)
+
+def post(func, *args):
+    # Queue the function to be called on the Tk main thread. This is safe to call from any thread.
+    results.put((func, args))
+
+def drain():
+    # Call every queued callback and return how many were called.
+    drained = 0
+    while True:
+        try:
+            callback, args = results.get_nowait()
+        except queue.Empty:
+            return drained
+        # Report a callback that raises (e.g. a TclError from a closed window) like Tk does, and keep draining,
+        # so one failing callback doesn't stop the queue from being drained for good.
+        try:
+            callback(*args)
+        except Exception:
+            traceback.print_exc()
+        drained += 1
+
+def start(root, interval_ms=MIN_POLL_INTERVAL_MS):
+    # Drain the queue and poll again soon if there was work, or back off if the queue was empty.
+    if drain():
+        interval_ms = MIN_POLL_INTERVAL_MS
+    else:
+        interval_ms = min(interval_ms * 2, MAX_POLL_INTERVAL_MS)
+    # Schedule the next drain from the Tk event loop.
+    root.after(interval_ms, start, root, interval_ms)
+
+def shutdown():
+    # Stop accepting new work and let the running calls finish in the background.
+    executor.shutdown(wait=False, cancel_futures=True)
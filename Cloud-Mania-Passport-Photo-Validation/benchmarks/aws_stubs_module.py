@@ -0,0 +1,1032 @@
+'''
+I created this module to stand in for the AWS services used by the Lambda Functions and the app, so they can
+be run and benchmarked locally without an AWS account.
+
+Each stand-in implements only the calls made by the Lambda code and the app, keeps its data in memory, counts
+the calls made to it and can add a fixed latency to every call, so the effect of the number of calls on the
+throughput shows up in the benchmarks. Together they run the whole flow of a photo locally: the StubS3 upload
+fires a notification, the StubLambdaTrigger runs the validation handler on it, and the StubApiGateway answers
+the requests of the app with the request handler. The StubCloudFormation runs the stack operations of the app
+on a simulated clock, with the resources of the templates.
+
+Functions in this module:
+- make_face_detail: Returns a Rekognition FaceDetail with the given attribute values.
+- make_s3_event: Returns an S3 PUT notification event with one record per object key (and its ETag).
+- check_item: Raises TypeError for the values boto3 can't write to DynamoDB (floats).
+- project_item: Returns the attributes of an item named by a ProjectionExpression.
+- client_error: Returns the ClientError boto3 raises when an AWS call fails.
+- get_references: Returns the logical IDs a part of a template refers to (Ref, GetAtt, Sub).
+- parse_template: Returns the resources of a template body with their types, definitions and dependencies.
+
+Classes in this module:
+- StubRekognition: Rekognition client returning canned FaceDetails from detect_faces.
+- StubDynamoDB: DynamoDB service resource with Table and batch_get_item.
+- StubTable: DynamoDB Table resource with put_item, get_item and batch_writer.
+- StubBatchWriter: Batch writer of the StubTable, sending up to 25 items per call.
+- StubS3: S3 client holding the objects, versions and delete markers of buckets in memory.
+- StubPaginator: Paginator of the StubS3 listings.
+- StubLambda: Lambda client recording the asynchronous invocations.
+- StubLambdaTrigger: Runs a Lambda handler asynchronously for every S3 notification, like an S3 trigger.
+- StubApiGateway: HTTP session answering the requests of the app with the request handler Lambda Function.
+- StubHttpResponse: Response of the StubApiGateway, with the attributes of a requests response used by the app.
+- ReferenceLoader: YAML loader keeping the intrinsic function tags of the templates in their JSON form.
+- StubCloudFormation: CloudFormation client running the stack operations on a simulated clock.
+- StubContext: Lambda context object with a timeout.
+- StubCfnResponse: cfnresponse module recording the responses sent to CloudFormation.
+'''
+
+# Import the bisect module to keep the S3 keys sorted, like S3 lists them.
+import bisect
+# Import the copy module to return copies of the stored items, like DynamoDB does.
+import copy
+# Import the functools module to parse every template body only once.
+import functools
+# Import the hashlib module to give the S3 objects the MD5 ETag S3 gives them.
+import hashlib
+# Import the json module to read the payloads of the Lambda invocations and the API requests.
+import json
+# Import the re module to find the references of the !Sub strings of the templates.
+import re
+# Import the threading module, since the Lambda code calls the stand-ins from several threads.
+import threading
+# Import the time module to simulate the latency of the calls.
+import time
+# Import the types module to give the CloudFormation stand-in the exceptions attribute of boto3 clients.
+import types
+# Import the ThreadPoolExecutor class to run the Lambda Functions triggered by S3 concurrently.
+from concurrent.futures import ThreadPoolExecutor
+# Import the datetime module to timestamp the stack events.
+from datetime import datetime, timedelta, timezone
+# Import the urllib.parse module to URL-encode the keys of the S3 events and split the API URLs.
+from urllib.parse import quote_plus, urlsplit
+# Import the yaml library to read the templates of the stack operations.
+import yaml
+# Import the ClientError exception to fail the calls the way boto3 does.
+from botocore.exceptions import ClientError
+
+# Maximum number of items of a DynamoDB BatchWriteItem call.
+BATCH_WRITE_LIMIT = 25
+# Maximum number of keys of a DynamoDB BatchGetItem call.
+BATCH_GET_LIMIT = 100
+# Maximum number of keys of an S3 listing page and of a delete_objects call.
+S3_PAGE_SIZE = 1000
+# Maximum number of events of a describe_stack_events page.
+STACK_EVENTS_PAGE_SIZE = 100
+
+def make_face_detail(smile=False, sunglasses=False, eyes_open=True, mouth_open=False, confidence=99.0):
+    # The default values pass every threshold of the validation Lambda Function.
+    return {
+        "Smile": {"Value": smile, "Confidence": confidence},
+        "Sunglasses": {"Value": sunglasses, "Confidence": confidence},
+        "EyesOpen": {"Value": eyes_open, "Confidence": confidence},
+        "MouthOpen": {"Value": mouth_open, "Confidence": confidence},
+        "Confidence": confidence
+    }
+
+def make_s3_event(keys, bucket_name="cloudmania-passportimages", etags=None):
+    # S3 URL-encodes the object keys in its notification events, and gives their ETags without quotes.
+    etags = etags or {}
+    return {
+        "Records": [
+            {
+                "eventSource": "aws:s3",
+                "eventName": "ObjectCreated:Put",
+                "s3": {
+                    "bucket": {"name": bucket_name},
+                    "object": {"key": quote_plus(key), **({"eTag": etags[key]} if key in etags else {})}
+                }
+            }
+            for key in keys
+        ]
+    }
+
+def check_item(value):
+    # boto3 rejects floats (numbers must be Decimal), so catch the items it couldn't write.
+    if isinstance(value, float):
+        raise TypeError("Float types are not supported. Use Decimal types instead.")
+    if isinstance(value, dict):
+        for nested_value in value.values():
+            check_item(nested_value)
+    elif isinstance(value, (list, tuple, set)):
+        for nested_value in value:
+            check_item(nested_value)
+
+def project_item(item, ProjectionExpression=None, ExpressionAttributeNames=None):
+    # Keep only the top-level attributes named by the projection expression.
+    if item is None or ProjectionExpression is None:
+        return item
+    names = ExpressionAttributeNames or {}
+    attributes = [names.get(name.strip(), name.strip()) for name in ProjectionExpression.split(",")]
+    return {name: item[name] for name in attributes if name in item}
+
+def client_error(code, message, operation_name):
+    # Build the exception boto3 raises when an AWS call fails.
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation_name)
+
+class ReferenceLoader(yaml.SafeLoader):
+    '''
+    YAML loader turning the intrinsic function tags of the templates (!Ref, !GetAtt, !Sub, ...) into their JSON
+    form ({"Ref": ...}, {"Fn::GetAtt": ...}, ...), so the references between the resources can be followed.
+    '''
+
+def construct_intrinsic_function(loader, tag_suffix, node):
+    # Build the JSON form of the tagged value, e.g. !GetAtt "Role.Arn" -> {"Fn::GetAtt": "Role.Arn"}.
+    if isinstance(node, yaml.ScalarNode):
+        value = loader.construct_scalar(node)
+    elif isinstance(node, yaml.SequenceNode):
+        value = loader.construct_sequence(node, deep=True)
+    else:
+        value = loader.construct_mapping(node, deep=True)
+    return {tag_suffix if tag_suffix == "Ref" else f"Fn::{tag_suffix}": value}
+
+ReferenceLoader.add_multi_constructor("!", construct_intrinsic_function)
+
+# Pattern of the ${LogicalId} and ${LogicalId.Attribute} references of the !Sub strings.
+SUB_REFERENCE_PATTERN = re.compile(r"\$\{([A-Za-z0-9]+)(?:\.[A-Za-z0-9.]+)?\}")
+
+def get_references(value):
+    # Return the names referred to by Ref, GetAtt and Sub anywhere in the value (including the pseudo parameters).
+    references = set()
+    if isinstance(value, dict):
+        for name, nested_value in value.items():
+            if name == "Ref" and isinstance(nested_value, str):
+                references.add(nested_value)
+            elif name == "Fn::GetAtt":
+                references.add(nested_value.split(".")[0] if isinstance(nested_value, str) else nested_value[0])
+            elif name == "Fn::Sub":
+                sub_template = nested_value if isinstance(nested_value, str) else nested_value[0]
+                references.update(SUB_REFERENCE_PATTERN.findall(sub_template))
+                if not isinstance(nested_value, str):
+                    references |= get_references(nested_value[1])
+            else:
+                references |= get_references(nested_value)
+    elif isinstance(value, list):
+        for nested_value in value:
+            references |= get_references(nested_value)
+    return references
+
+@functools.lru_cache(maxsize=32)
+def parse_template(template_body):
+    # Return {logical ID: {"Type", "Definition", "DependsOn"}}, DependsOn holding the resources it waits for.
+    # The result is cached and shared, since parsing a template takes longer than the simulated API calls.
+    resources = yaml.load(template_body, Loader=ReferenceLoader).get("Resources", {})
+    parsed = {}
+    for logical_id, definition in resources.items():
+        depends_on = definition.get("DependsOn", [])
+        depends_on = {depends_on} if isinstance(depends_on, str) else set(depends_on)
+        depends_on |= get_references(definition.get("Properties", {}))
+        parsed[logical_id] = {
+            "Type": definition["Type"],
+            "Definition": definition,
+            "DependsOn": (depends_on & set(resources)) - {logical_id}
+        }
+    return parsed
+
+class StubRekognition:
+    '''
+    Rekognition client whose detect_faces returns the FaceDetails registered for the image, or a passing
+    face by default. The images listed in fail_names fail with an InvalidS3ObjectException.
+    '''
+
+    def __init__(self, latency=0.0, face_details=None, fail_names=()):
+        self.latency = latency
+        self.face_details = dict(face_details or {})
+        self.fail_names = set(fail_names)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def detect_faces(self, Image, Attributes=None):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        name = Image["S3Object"]["Name"]
+        if name in self.fail_names:
+            raise client_error("InvalidS3ObjectException", f"Unable to get object metadata from S3: {name}", "DetectFaces")
+        return {"FaceDetails": copy.deepcopy(self.face_details.get(name, [make_face_detail()]))}
+
+class StubDynamoDB:
+    '''
+    DynamoDB service resource holding StubTables by name. batch_get_item processes at most
+    max_keys_per_call keys per call and returns the others as UnprocessedKeys, the way DynamoDB does when
+    the table is throttled.
+    '''
+
+    def __init__(self, latency=0.0, max_keys_per_call=BATCH_GET_LIMIT):
+        self.latency = latency
+        self.max_keys_per_call = max_keys_per_call
+        self.tables = {}
+        self.lock = threading.Lock()
+
+    def Table(self, name):
+        with self.lock:
+            if name not in self.tables:
+                self.tables[name] = StubTable(latency=self.latency)
+            return self.tables[name]
+
+    def batch_get_item(self, RequestItems):
+        responses = {}
+        unprocessed_keys = {}
+        for table_name, request in RequestItems.items():
+            keys = request["Keys"]
+            projection = {name: value for name, value in request.items() if name != "Keys"}
+            if len(keys) > BATCH_GET_LIMIT:
+                raise client_error("ValidationException", "Too many items requested for the BatchGetItem call", "BatchGetItem")
+            table = self.Table(table_name)
+            table.call("BatchGetItem")
+            processed, unprocessed = keys[:self.max_keys_per_call], keys[self.max_keys_per_call:]
+            with table.lock:
+                items = [table.items.get(key[table.key_name]) for key in processed]
+            responses[table_name] = [copy.deepcopy(project_item(item, **projection)) for item in items if item is not None]
+            if unprocessed:
+                unprocessed_keys[table_name] = {"Keys": unprocessed, **projection}
+        return {"Responses": responses, "UnprocessedKeys": unprocessed_keys}
+
+class StubTable:
+    '''
+    DynamoDB Table resource keyed by the given key name. Every call (a BatchWriteItem call counts once,
+    whatever its number of items) waits for the latency and is counted in calls.
+    '''
+
+    def __init__(self, key_name="FileName", latency=0.0, fail_keys=()):
+        self.key_name = key_name
+        self.latency = latency
+        self.fail_keys = set(fail_keys)
+        self.items = {}
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def call(self, operation_name):
+        # Count the call and wait for its latency.
+        with self.lock:
+            self.calls[operation_name] = self.calls.get(operation_name, 0) + 1
+        time.sleep(self.latency)
+
+    def store(self, item, operation_name):
+        # Store a copy of the item, unless its key is set to fail.
+        check_item(item)
+        if item[self.key_name] in self.fail_keys:
+            raise client_error("ValidationException", f"Item {item[self.key_name]} can't be written", operation_name)
+        with self.lock:
+            self.items[item[self.key_name]] = copy.deepcopy(item)
+
+    def put_item(self, Item):
+        self.call("PutItem")
+        self.store(Item, "PutItem")
+        return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+    def get_item(self, Key, ProjectionExpression=None, ExpressionAttributeNames=None):
+        self.call("GetItem")
+        with self.lock:
+            item = project_item(self.items.get(Key[self.key_name]), ProjectionExpression, ExpressionAttributeNames)
+        return {"Item": copy.deepcopy(item)} if item is not None else {}
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return StubBatchWriter(self, overwrite_by_pkeys)
+
+class StubBatchWriter:
+    '''
+    Batch writer of a StubTable. Like the boto3 one, it buffers the items, sends them BATCH_WRITE_LIMIT at a
+    time and keeps only the last item of each key when overwrite_by_pkeys is given.
+    '''
+
+    def __init__(self, table, overwrite_by_pkeys=None):
+        self.table = table
+        self.overwrite_by_pkeys = overwrite_by_pkeys
+        self.buffer = []
+
+    def put_item(self, Item):
+        if self.overwrite_by_pkeys:
+            self.buffer = [item for item in self.buffer if item[self.table.key_name] != Item[self.table.key_name]]
+        self.buffer.append(Item)
+        if len(self.buffer) >= BATCH_WRITE_LIMIT:
+            self.flush()
+
+    def flush(self):
+        # Send the buffered items in one BatchWriteItem call.
+        items, self.buffer = self.buffer[:BATCH_WRITE_LIMIT], self.buffer[BATCH_WRITE_LIMIT:]
+        if not items:
+            return
+        self.table.call("BatchWriteItem")
+        for item in items:
+            self.table.store(item, "BatchWriteItem")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        while self.buffer:
+            self.flush()
+        return False
+
+class StubS3:
+    '''
+    S3 client keeping the objects of its buckets in memory, sorted by key like S3 lists them.
+    In a versioned bucket, every put adds a version and delete_object adds a delete marker; in a plain
+    bucket, every object has the single version 'null'. Every call waits for the latency of its operation
+    (latencies maps operation names to seconds) and is counted in calls. delete_objects reports every
+    flaky_every-th key it is asked to delete in its Errors the first time, so the retries get exercised.
+    upload_file and upload_fileobj store the photo with a single PutObject call, and every object put in a
+    bucket is reported to the callbacks registered with add_notification, like an S3 event notification.
+    The objects get the MD5 of their contents as their ETag, which head_object returns.
+    '''
+
+    def __init__(self, versioned=False, latencies=None, flaky_every=0):
+        self.versioned = versioned
+        self.latencies = dict(latencies or {})
+        self.flaky_every = flaky_every
+        self.buckets = {}
+        self.version_counter = 0
+        self.delete_requests = 0
+        self.failed_once = set()
+        self.notifications = {}
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def call(self, operation_name):
+        # Count the call and wait for its latency.
+        with self.lock:
+            self.calls[operation_name] = self.calls.get(operation_name, 0) + 1
+        time.sleep(self.latencies.get(operation_name, 0.0))
+
+    def add_notification(self, bucket_name, callback):
+        # Call callback(bucket name, key, ETag) for every object put in the bucket from now on.
+        self.notifications.setdefault(bucket_name, []).append(callback)
+
+    def bucket(self, name):
+        # Return the (sorted (key, version ID) list, {(key, version ID): version}) of the bucket.
+        return self.buckets.setdefault(name, ([], {}))
+
+    def add_version(self, bucket_name, key, size, delete_marker=False, etag=None):
+        entries, versions = self.bucket(bucket_name)
+        if self.versioned:
+            self.version_counter += 1
+            version_id = f"{self.version_counter:012d}"
+        else:
+            version_id = "null"
+        if (key, version_id) not in versions:
+            bisect.insort(entries, (key, version_id))
+        versions[(key, version_id)] = {"Size": size, "IsDeleteMarker": delete_marker, "ETag": etag}
+        return version_id
+
+    def remove_version(self, bucket_name, key, version_id):
+        entries, versions = self.bucket(bucket_name)
+        if versions.pop((key, version_id), None) is not None:
+            del entries[bisect.bisect_left(entries, (key, version_id))]
+
+    def latest_version(self, bucket_name, key):
+        # Return the latest version of the key (empty if there is none).
+        entries, versions = self.bucket(bucket_name)
+        index = bisect.bisect_left(entries, (key, chr(0x10ffff)))
+        if index and entries[index - 1][0] == key:
+            return versions[entries[index - 1]]
+        return {}
+
+    def latest_versions(self, bucket_name):
+        # Yield the (key, latest version) of every key, in key order.
+        entries, versions = self.bucket(bucket_name)
+        for index, (key, version_id) in enumerate(entries):
+            if index + 1 == len(entries) or entries[index + 1][0] != key:
+                yield key, versions[(key, version_id)]
+
+    def put_object(self, Bucket, Key, Body=b""):
+        self.call("PutObject")
+        # A single-part upload has the MD5 of its contents as its ETag.
+        etag = hashlib.md5(Body).hexdigest()
+        with self.lock:
+            version_id = self.add_version(Bucket, Key, len(Body), etag=etag)
+        # Notify the bucket's callbacks once the object is stored, like S3 does.
+        for callback in self.notifications.get(Bucket, ()):
+            callback(Bucket, Key, etag)
+        response = {"ETag": f'"{etag}"'}
+        if self.versioned:
+            response["VersionId"] = version_id
+        return response
+
+    def head_object(self, Bucket, Key):
+        self.call("HeadObject")
+        with self.lock:
+            version = self.latest_version(Bucket, Key)
+        if not version or version["IsDeleteMarker"]:
+            raise client_error("404", "Not Found", "HeadObject")
+        return {"ETag": f'"{version["ETag"]}"', "ContentLength": version["Size"]}
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        with open(Filename, 'rb') as upload_file:
+            self.upload_fileobj(upload_file, Bucket, Key, ExtraArgs, Callback, Config)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        # Photos are below the multipart threshold of the app, so they are stored with a single PutObject.
+        body = Fileobj.read()
+        self.put_object(Bucket=Bucket, Key=Key, Body=body)
+        if Callback is not None:
+            Callback(len(body))
+
+    def delete_object(self, Bucket, Key, VersionId=None):
+        self.call("DeleteObject")
+        with self.lock:
+            self.delete(Bucket, Key, VersionId)
+        return {}
+
+    def delete(self, bucket_name, key, version_id):
+        # Delete the given version, or add a delete marker (remove the object of a plain bucket) without one.
+        if version_id is not None:
+            self.remove_version(bucket_name, key, version_id)
+        elif self.versioned:
+            self.add_version(bucket_name, key, 0, delete_marker=True)
+        else:
+            self.remove_version(bucket_name, key, "null")
+
+    def delete_objects(self, Bucket, Delete):
+        self.call("DeleteObjects")
+        objects = Delete["Objects"]
+        if len(objects) > S3_PAGE_SIZE:
+            raise client_error("MalformedXML", "The XML you provided was not well-formed", "DeleteObjects")
+        deleted = []
+        errors = []
+        with self.lock:
+            for deleted_object in objects:
+                self.delete_requests += 1
+                version_key = (deleted_object["Key"], deleted_object.get("VersionId"))
+                # Fail every flaky_every-th key once.
+                if (self.flaky_every and self.delete_requests % self.flaky_every == 0
+                        and version_key not in self.failed_once):
+                    self.failed_once.add(version_key)
+                    errors.append({"Key": version_key[0], "VersionId": version_key[1], "Code": "InternalError",
+                                   "Message": "We encountered an internal error. Please try again."})
+                    continue
+                self.delete(Bucket, *version_key)
+                deleted.append(dict(deleted_object))
+        response = {"Errors": errors} if errors else {}
+        if not Delete.get("Quiet"):
+            response["Deleted"] = deleted
+        return response
+
+    def list_objects_v2(self, Bucket, Prefix="", ContinuationToken=None, MaxKeys=S3_PAGE_SIZE):
+        self.call("ListObjectsV2")
+        contents = []
+        with self.lock:
+            for key, version in self.latest_versions(Bucket):
+                if not key.startswith(Prefix) or version["IsDeleteMarker"]:
+                    continue
+                if ContinuationToken is not None and key <= ContinuationToken:
+                    continue
+                contents.append({"Key": key, "Size": version["Size"]})
+                if len(contents) == MaxKeys:
+                    break
+        response = {"KeyCount": len(contents), "IsTruncated": len(contents) == MaxKeys}
+        if contents:
+            response["Contents"] = contents
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = contents[-1]["Key"]
+        return response
+
+    def list_object_versions(self, Bucket, Prefix="", KeyMarker=None, VersionIdMarker=None, MaxKeys=S3_PAGE_SIZE):
+        self.call("ListObjectVersions")
+        listed = []
+        with self.lock:
+            entries, versions = self.bucket(Bucket)
+            start = bisect.bisect_right(entries, (KeyMarker, VersionIdMarker or "")) if KeyMarker is not None else 0
+            for key, version_id in entries[start:]:
+                if not key.startswith(Prefix):
+                    continue
+                listed.append((key, version_id, versions[(key, version_id)]))
+                if len(listed) == MaxKeys:
+                    break
+        response = {
+            "Versions": [
+                {"Key": key, "VersionId": version_id, "Size": version["Size"]}
+                for key, version_id, version in listed if not version["IsDeleteMarker"]
+            ],
+            "DeleteMarkers": [
+                {"Key": key, "VersionId": version_id}
+                for key, version_id, version in listed if version["IsDeleteMarker"]
+            ],
+            "IsTruncated": len(listed) == MaxKeys
+        }
+        if response["IsTruncated"]:
+            response["NextKeyMarker"], response["NextVersionIdMarker"] = listed[-1][0], listed[-1][1]
+        return response
+
+    def count_versions(self, bucket_name):
+        # Return the number of versions and delete markers left in the bucket.
+        with self.lock:
+            return len(self.bucket(bucket_name)[0])
+
+    def get_paginator(self, operation_name):
+        return StubPaginator(self, operation_name)
+
+class StubPaginator:
+    '''
+    Paginator of the list_objects_v2 and list_object_versions listings of a StubS3.
+    '''
+
+    def __init__(self, s3, operation_name):
+        self.s3 = s3
+        self.operation_name = operation_name
+
+    def paginate(self, **kwargs):
+        while True:
+            page = getattr(self.s3, self.operation_name)(**kwargs)
+            yield page
+            if not page["IsTruncated"]:
+                return
+            if self.operation_name == "list_objects_v2":
+                kwargs["ContinuationToken"] = page["NextContinuationToken"]
+            else:
+                kwargs["KeyMarker"] = page["NextKeyMarker"]
+                kwargs["VersionIdMarker"] = page["NextVersionIdMarker"]
+
+class StubLambda:
+    '''
+    Lambda client recording the asynchronous invocations, so the caller can run them itself.
+    '''
+
+    def __init__(self):
+        self.invocations = []
+
+    def invoke(self, FunctionName, InvocationType="RequestResponse", Payload=b"{}"):
+        self.invocations.append({"FunctionName": FunctionName, "InvocationType": InvocationType,
+                                 "Payload": json.loads(Payload)})
+        return {"StatusCode": 202}
+
+class StubLambdaTrigger:
+    '''
+    S3 trigger of a Lambda Function. notify (registered with StubS3.add_notification) sends the S3 event of the
+    object to the handler asynchronously, after the delivery delay of the notification, with at most concurrency
+    executions of the handler at the same time. The exceptions of the handler are counted in errors, since an
+    asynchronous invocation has no caller to raise them to.
+    '''
+
+    def __init__(self, handler, delay=0.0, concurrency=100, timeout=120.0, function_name="CloudManiaFunction"):
+        self.handler = handler
+        self.delay = delay
+        self.timeout = timeout
+        self.function_name = function_name
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="stub-lambda")
+        self.invocations = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def notify(self, bucket_name, key, etag=None):
+        # S3 sends one event per object.
+        self.executor.submit(self.invoke, make_s3_event([key], bucket_name, {key: etag} if etag else None))
+
+    def invoke(self, event):
+        time.sleep(self.delay)
+        with self.lock:
+            self.invocations += 1
+        try:
+            self.handler(event, StubContext(self.timeout, self.function_name))
+        except Exception:
+            with self.lock:
+                self.errors += 1
+
+    def close(self):
+        # Wait for the invocations still running.
+        self.executor.shutdown(wait=True)
+
+class StubContext:
+    '''
+    Lambda context object whose remaining time counts down from the timeout (in seconds) once it is created.
+    '''
+
+    def __init__(self, timeout=900.0, function_name="CloudManiaFunction"):
+        self.function_name = function_name
+        self.deadline = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+class StubCfnResponse:
+    '''
+    Stand-in for the cfnresponse module of the Lambda runtime, recording the responses instead of sending
+    them to the pre-signed URL of CloudFormation.
+    '''
+
+    SUCCESS = "SUCCESS"
+    FAILED = "FAILED"
+
+    def __init__(self):
+        self.responses = []
+
+    def send(self, event, context, responseStatus, responseData, physicalResourceId=None, noEcho=False, reason=None):
+        self.responses.append({"Status": responseStatus, "Data": responseData, "Reason": reason})
+
+class StubHttpResponse:
+    '''
+    Response of the StubApiGateway, with the attributes and methods of a requests response read by the app.
+    '''
+
+    def __init__(self, status_code, text, headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = dict(headers or {})
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        # Import requests only when a request fails, like the validation module does.
+        if self.status_code >= 400:
+            import requests
+            raise requests.HTTPError(f"{self.status_code} Error", response=self)
+
+class StubApiGateway:
+    '''
+    HTTP session standing in for the HTTP API of the stack. The GET and POST requests to {invoke URL}/images are
+    turned into the API Gateway events (payload format 2.0) of the request handler Lambda Function, and its
+    response is returned as a StubHttpResponse. Every request waits for the latency (the round trip to API
+    Gateway) and is counted in calls by route; the other paths get a 404, like the routes the API doesn't have.
+    The handler serves one request at a time, like a single warm Lambda container.
+    '''
+
+    def __init__(self, handler_module, latency=0.0):
+        self.handler_module = handler_module
+        self.latency = latency
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def get(self, url, params=None, timeout=None):
+        return self.request("GET", url, params=params)
+
+    def post(self, url, json=None, timeout=None):
+        return self.request("POST", url, body=json)
+
+    def request(self, method, url, params=None, body=None):
+        path = urlsplit(url).path
+        route = f"{method} {path}"
+        with self.lock:
+            self.calls[route] = self.calls.get(route, 0) + 1
+        time.sleep(self.latency)
+        if not path.endswith("/images"):
+            return StubHttpResponse(404, '{"message":"Not Found"}')
+        event = {
+            "version": "2.0",
+            "routeKey": f"{method} /images",
+            "rawPath": path,
+            "requestContext": {"http": {"method": method, "path": path}},
+            "isBase64Encoded": False
+        }
+        if params:
+            event["queryStringParameters"] = dict(params)
+        if body is not None:
+            event["body"] = json.dumps(body)
+        with self.lock:
+            response = self.handler_module.lambda_handler(event, None)
+        return StubHttpResponse(response["statusCode"], response["body"], response.get("headers"))
+
+class StubCloudFormation:
+    '''
+    CloudFormation client running the stack operations of the app in memory, on a simulated clock.
+    Every resource takes the simulated seconds of its type (RESOURCE_SECONDS) to be created, updated or deleted,
+    and starts once the resources it depends on are done (or, for a deletion, once the resources depending on it
+    are deleted), like CloudFormation does. Change sets take CHANGE_SET_SECONDS to be computed. time_scale is the
+    number of real seconds per simulated second, so a deployment of several minutes runs in a few seconds, and
+    the timestamps of the stacks and stack events are on the simulated clock.
+    hooks maps logical IDs to callables called with the request type ("Create", "Update" or "Delete") when
+    their resource is processed, like the Lambda Function behind a custom resource. A hook runs in real time,
+    and a hook raising an exception fails its resource and the stack operation.
+    operations lists the stack operations with their real start and end times, and calls counts the calls.
+    '''
+
+    # Simulated seconds a resource of each type takes to be created, updated or deleted.
+    RESOURCE_SECONDS = {
+        "AWS::IAM::Role": 15.0,
+        "AWS::Lambda::Function": 8.0,
+        "AWS::Lambda::Permission": 2.0,
+        "AWS::Lambda::EventInvokeConfig": 3.0,
+        "AWS::S3::Bucket": 5.0,
+        "AWS::DynamoDB::Table": 12.0,
+        "AWS::ApplicationAutoScaling::ScalableTarget": 3.0,
+        "AWS::ApplicationAutoScaling::ScalingPolicy": 2.0,
+        "AWS::SNS::Topic": 3.0,
+        "AWS::SNS::Subscription": 2.0,
+        "AWS::ApiGatewayV2::Api": 4.0,
+        "AWS::ApiGatewayV2::Stage": 3.0,
+        "AWS::ApiGatewayV2::Route": 2.0,
+        "AWS::ApiGatewayV2::Integration": 2.0
+    }
+    # Simulated seconds of the resource types not listed above.
+    DEFAULT_RESOURCE_SECONDS = 3.0
+    # Simulated seconds to compute a change set, and to start (and to finish) a stack operation.
+    CHANGE_SET_SECONDS = 5.0
+    STACK_OPERATION_SECONDS = 2.0
+
+    # Stack statuses from which a stack can be updated.
+    UPDATABLE_STATUSES = {"CREATE_COMPLETE", "UPDATE_COMPLETE", "UPDATE_ROLLBACK_COMPLETE"}
+    # Attributes of the stacks returned by describe_stacks.
+    STACK_ATTRIBUTES = ("StackId", "StackName", "StackStatus", "CreationTime", "LastUpdatedTime", "DeletionTime")
+
+    def __init__(self, time_scale=0.01, hooks=None, latency=0.0):
+        self.time_scale = time_scale
+        self.hooks = dict(hooks or {})
+        self.latency = latency
+        # Like a boto3 client, the exceptions it raises are available as cf.exceptions.ClientError.
+        self.exceptions = types.SimpleNamespace(ClientError=ClientError)
+        self.stacks = {}
+        self.stack_ids = {}
+        self.change_sets = {}
+        self.operations = []
+        self.threads = []
+        self.event_counter = 0
+        self.calls = {}
+        self.epoch = datetime.now(timezone.utc)
+        self.started = time.monotonic()
+        self.lock = threading.RLock()
+
+    def call(self, operation_name):
+        # Count the call and wait for its latency.
+        with self.lock:
+            self.calls[operation_name] = self.calls.get(operation_name, 0) + 1
+        time.sleep(self.latency)
+
+    def now(self):
+        # Return the time on the simulated clock.
+        return self.epoch + timedelta(seconds=(time.monotonic() - self.started) / self.time_scale)
+
+    def get_stack(self, stack_name, operation_name):
+        # Return the stack with the given ID (even deleted), or the live stack with the given name.
+        with self.lock:
+            stack = self.stacks.get(stack_name) or self.stacks.get(self.stack_ids.get(stack_name))
+        if stack is None:
+            raise client_error("ValidationError", f"Stack with id {stack_name} does not exist", operation_name)
+        return stack
+
+    def new_stack(self, stack_name, operation_name):
+        # Create an empty stack, waiting for its first operation.
+        if stack_name in self.stack_ids:
+            raise client_error("AlreadyExistsException", f"Stack [{stack_name}] already exists", operation_name)
+        stack_id = f"arn:aws:cloudformation:us-east-1:123456789012:stack/{stack_name}/{len(self.stacks) + 1:012d}"
+        stack = {"StackId": stack_id, "StackName": stack_name, "StackStatus": "REVIEW_IN_PROGRESS",
+                 "CreationTime": self.now(), "resources": {}, "events": []}
+        self.stacks[stack_id] = stack
+        self.stack_ids[stack_name] = stack_id
+        return stack
+
+    def add_event(self, stack, logical_id, resource_type, status, reason=None):
+        # Record a stack event, stamped with the simulated clock.
+        with self.lock:
+            self.event_counter += 1
+            is_stack = logical_id == stack["StackName"]
+            event = {
+                "EventId": f"{self.event_counter:08d}",
+                "StackId": stack["StackId"],
+                "StackName": stack["StackName"],
+                "LogicalResourceId": logical_id,
+                "PhysicalResourceId": stack["StackId"] if is_stack else f"{stack['StackName']}-{logical_id}",
+                "ResourceType": resource_type,
+                "ResourceStatus": status,
+                "Timestamp": self.now()
+            }
+            if reason:
+                event["ResourceStatusReason"] = reason
+            stack["events"].append(event)
+
+    def set_status(self, stack, status, reason=None):
+        # Change the status of the stack, which records a stack event.
+        with self.lock:
+            stack["StackStatus"] = status
+            self.add_event(stack, stack["StackName"], "AWS::CloudFormation::Stack", status, reason)
+
+    def get_changes(self, resources, new_resources):
+        # Return {logical ID: action} of the resources to add, modify and remove to go from resources to new_resources.
+        changes = {name: "Add" for name in new_resources if name not in resources}
+        changes.update((name, "Modify") for name in new_resources
+                       if name in resources and resources[name]["Definition"] != new_resources[name]["Definition"])
+        changes.update((name, "Remove") for name in resources if name not in new_resources)
+        return changes
+
+    def schedule(self, resources, names, reverse=False):
+        # Return [(start, end, logical ID)] in simulated seconds, every resource starting once the ones it waits for are done.
+        if reverse:
+            waits_for = {name: {other for other in names if name in resources[other]["DependsOn"]} for name in names}
+        else:
+            waits_for = {name: resources[name]["DependsOn"] & set(names) for name in names}
+        ends = {}
+        schedule = []
+        pending = list(names)
+        while pending:
+            ready = [name for name in pending if waits_for[name] <= set(ends)]
+            if not ready:
+                raise client_error("ValidationError", f"Circular dependency between resources: {sorted(pending)}",
+                                   "CreateStack")
+            for name in ready:
+                start = max((ends[other] for other in waits_for[name]), default=0.0)
+                ends[name] = start + self.RESOURCE_SECONDS.get(resources[name]["Type"], self.DEFAULT_RESOURCE_SECONDS)
+                schedule.append((start, ends[name], name))
+                pending.remove(name)
+        return sorted(schedule)
+
+    def start_operation(self, stack, operation_type, new_resources):
+        # Plan the operation ("CREATE", "UPDATE" or "DELETE") and run it on a thread, like CloudFormation runs it.
+        resources = stack["resources"]
+        if operation_type == "DELETE":
+            changes = {name: "Remove" for name in resources}
+        else:
+            changes = self.get_changes(resources, new_resources)
+        # The resources are added and modified first, then the removed ones are deleted in reverse order.
+        every_resource = {**resources, **new_resources}
+        phases = [
+            (self.schedule(every_resource, [name for name, action in changes.items() if action != "Remove"]), changes),
+            (self.schedule(resources, [name for name, action in changes.items() if action == "Remove"], reverse=True), changes)
+        ]
+        with self.lock:
+            now = self.now()
+            if operation_type == "UPDATE":
+                stack["LastUpdatedTime"] = now
+            elif operation_type == "DELETE":
+                stack["DeletionTime"] = now
+            self.set_status(stack, f"{operation_type}_IN_PROGRESS")
+            operation = {"StackName": stack["StackName"], "Type": operation_type, "Changes": len(changes),
+                         "started": time.monotonic(), "ended": None, "hook_seconds": 0.0}
+            self.operations.append(operation)
+        thread = threading.Thread(target=self.run_operation, args=(stack, operation, phases, every_resource, new_resources),
+                                  name="stub-cloudformation", daemon=True)
+        self.threads.append(thread)
+        thread.start()
+
+    def run_operation(self, stack, operation, phases, every_resource, new_resources):
+        operation_type = operation["Type"]
+        statuses = {"Add": "CREATE", "Modify": "UPDATE", "Remove": "DELETE"}
+        request_types = {"Add": "Create", "Modify": "Update", "Remove": "Delete"}
+        offset = self.STACK_OPERATION_SECONDS
+        failure = None
+        for index, (schedule, changes) in enumerate(phases):
+            # The removed resources of an update are deleted while the stack cleans up.
+            if index == 1 and schedule and operation_type == "UPDATE":
+                self.set_status(stack, "UPDATE_COMPLETE_CLEANUP_IN_PROGRESS")
+            steps = sorted([(start, 0, name) for start, end, name in schedule] +
+                           [(end, 1, name) for start, end, name in schedule])
+            for at, done, name in steps:
+                self.wait_until(operation, offset + at)
+                status = statuses[changes[name]]
+                resource_type = every_resource[name]["Type"]
+                if not done:
+                    self.add_event(stack, name, resource_type, f"{status}_IN_PROGRESS")
+                    continue
+                hook = self.hooks.get(name)
+                if hook is not None:
+                    hook_start = time.monotonic()
+                    try:
+                        hook(request_types[changes[name]])
+                    except Exception as e:
+                        failure = f"{name}: {e}"
+                    operation["hook_seconds"] += time.monotonic() - hook_start
+                if failure:
+                    self.add_event(stack, name, resource_type, f"{status}_FAILED", failure)
+                    break
+                self.add_event(stack, name, resource_type, f"{status}_COMPLETE")
+            if failure:
+                break
+            offset += max((end for start, end, name in schedule), default=0.0)
+        self.wait_until(operation, offset + self.STACK_OPERATION_SECONDS)
+        with self.lock:
+            if failure is None:
+                stack["resources"] = {} if operation_type == "DELETE" else new_resources
+                self.set_status(stack, f"{operation_type}_COMPLETE")
+                if operation_type == "DELETE":
+                    self.stack_ids.pop(stack["StackName"], None)
+            elif operation_type == "DELETE":
+                self.set_status(stack, "DELETE_FAILED", failure)
+            else:
+                # Roll back: a failed creation leaves nothing behind, a failed update the previous resources.
+                rollback = "ROLLBACK" if operation_type == "CREATE" else "UPDATE_ROLLBACK"
+                self.set_status(stack, f"{rollback}_IN_PROGRESS", failure)
+                self.set_status(stack, f"{rollback}_COMPLETE")
+            operation["ended"] = time.monotonic()
+
+    def wait_until(self, operation, simulated_seconds):
+        # Sleep until the simulated time of the operation, shifted by the real time its hooks took.
+        deadline = operation["started"] + simulated_seconds * self.time_scale + operation["hook_seconds"]
+        time.sleep(max(0.0, deadline - time.monotonic()))
+
+    def wait_for_operations(self):
+        # Wait for the stack operations still running.
+        for thread in list(self.threads):
+            thread.join()
+
+    def check_updatable(self, stack, operation_name):
+        if stack["StackStatus"] not in self.UPDATABLE_STATUSES:
+            raise client_error("ValidationError", f"Stack:{stack['StackId']} is in {stack['StackStatus']} state "
+                               f"and can not be updated.", operation_name)
+
+    def create_stack(self, StackName, TemplateBody, Capabilities=None):
+        self.call("CreateStack")
+        resources = parse_template(TemplateBody)
+        with self.lock:
+            stack = self.new_stack(StackName, "CreateStack")
+            self.start_operation(stack, "CREATE", resources)
+        return {"StackId": stack["StackId"]}
+
+    def update_stack(self, StackName, TemplateBody, Capabilities=None):
+        self.call("UpdateStack")
+        resources = parse_template(TemplateBody)
+        with self.lock:
+            stack = self.get_stack(StackName, "UpdateStack")
+            self.check_updatable(stack, "UpdateStack")
+            if not self.get_changes(stack["resources"], resources):
+                raise client_error("ValidationError", "No updates are to be performed.", "UpdateStack")
+            self.start_operation(stack, "UPDATE", resources)
+        return {"StackId": stack["StackId"]}
+
+    def delete_stack(self, StackName):
+        self.call("DeleteStack")
+        with self.lock:
+            # Deleting a stack that doesn't exist, or is already being deleted, succeeds without doing anything.
+            stack_id = self.stack_ids.get(StackName)
+            if stack_id is None or self.stacks[stack_id]["StackStatus"] == "DELETE_IN_PROGRESS":
+                return {}
+            self.start_operation(self.stacks[stack_id], "DELETE", {})
+        return {}
+
+    def create_change_set(self, StackName, ChangeSetName, ChangeSetType="UPDATE", TemplateBody=None, Capabilities=None):
+        self.call("CreateChangeSet")
+        resources = parse_template(TemplateBody)
+        with self.lock:
+            if ChangeSetType == "CREATE":
+                stack = self.new_stack(StackName, "CreateChangeSet")
+            else:
+                stack = self.get_stack(StackName, "CreateChangeSet")
+            self.change_sets[(stack["StackId"], ChangeSetName)] = {
+                "ChangeSetName": ChangeSetName,
+                "Type": ChangeSetType,
+                "resources": resources,
+                "changes": self.get_changes(stack["resources"], resources),
+                "CreationTime": self.now(),
+                "ready_at": time.monotonic() + self.CHANGE_SET_SECONDS * self.time_scale
+            }
+        return {"Id": f"{stack['StackId']}/{ChangeSetName}", "StackId": stack["StackId"]}
+
+    def get_change_set(self, StackName, ChangeSetName, operation_name):
+        stack = self.get_stack(StackName, operation_name)
+        with self.lock:
+            change_set = self.change_sets.get((stack["StackId"], ChangeSetName))
+        if change_set is None:
+            raise client_error("ChangeSetNotFound", f"ChangeSet [{ChangeSetName}] does not exist", operation_name)
+        return stack, change_set
+
+    def describe_change_set(self, StackName, ChangeSetName):
+        self.call("DescribeChangeSet")
+        stack, change_set = self.get_change_set(StackName, ChangeSetName, "DescribeChangeSet")
+        response = {"ChangeSetName": ChangeSetName, "StackId": stack["StackId"], "StackName": stack["StackName"],
+                    "CreationTime": change_set["CreationTime"]}
+        if time.monotonic() < change_set["ready_at"]:
+            response["Status"] = "CREATE_IN_PROGRESS"
+        elif not change_set["changes"]:
+            response["Status"] = "FAILED"
+            response["StatusReason"] = ("The submitted information didn't contain changes. "
+                                        "Submit different information to create a change set.")
+        else:
+            response["Status"] = "CREATE_COMPLETE"
+            response["Changes"] = [
+                {"Type": "Resource", "ResourceChange": {
+                    "Action": action, "LogicalResourceId": name,
+                    "ResourceType": (change_set["resources"].get(name) or stack["resources"][name])["Type"]
+                }}
+                for name, action in change_set["changes"].items()
+            ]
+        return response
+
+    def execute_change_set(self, StackName, ChangeSetName):
+        self.call("ExecuteChangeSet")
+        stack, change_set = self.get_change_set(StackName, ChangeSetName, "ExecuteChangeSet")
+        with self.lock:
+            if time.monotonic() < change_set["ready_at"] or not change_set["changes"]:
+                raise client_error("InvalidChangeSetStatus", f"ChangeSet [{ChangeSetName}] cannot be executed "
+                                   f"in its current status", "ExecuteChangeSet")
+            if change_set["Type"] == "UPDATE":
+                self.check_updatable(stack, "ExecuteChangeSet")
+            del self.change_sets[(stack["StackId"], ChangeSetName)]
+            self.start_operation(stack, change_set["Type"], change_set["resources"])
+        return {}
+
+    def delete_change_set(self, StackName, ChangeSetName):
+        self.call("DeleteChangeSet")
+        stack, change_set = self.get_change_set(StackName, ChangeSetName, "DeleteChangeSet")
+        with self.lock:
+            del self.change_sets[(stack["StackId"], ChangeSetName)]
+        return {}
+
+    def describe_stacks(self, StackName):
+        self.call("DescribeStacks")
+        stack = self.get_stack(StackName, "DescribeStacks")
+        with self.lock:
+            return {"Stacks": [{name: stack[name] for name in self.STACK_ATTRIBUTES if name in stack}]}
+
+    def describe_stack_events(self, StackName, NextToken=None):
+        self.call("DescribeStackEvents")
+        stack = self.get_stack(StackName, "DescribeStackEvents")
+        # The events are returned newest first, one page at a time. The token is the ID of the last event of the
+        # previous page, so the pages don't shift when new events are recorded in between.
+        with self.lock:
+            events = list(reversed(stack["events"]))
+        event_ids = [event["EventId"] for event in events]
+        start = event_ids.index(NextToken) + 1 if NextToken else 0
+        page = events[start:start + STACK_EVENTS_PAGE_SIZE]
+        response = {"StackEvents": [dict(event) for event in page]}
+        if start + STACK_EVENTS_PAGE_SIZE < len(events):
+            response["NextToken"] = page[-1]["EventId"]
+        return response
+
+# Shared stand-in registered as the cfnresponse module by template_lambda_module.
+cfnresponse = StubCfnResponse()
@@ -0,0 +1,130 @@
+'''
+This is the benchmark of the bucket purge of the S3 deletion Lambda Function (CloudManiaS3ObjectDeletionFunction).
+It fills the local S3 stand-in of aws_stubs_module with buckets of increasing sizes and empties them:
+    - With the serial purge the function used before (one list_objects_v2 page, then one delete_objects call,
+      in turn), which leaves the older versions and the delete markers of a versioned bucket behind.
+    - With the handler of the final template, which deletes every version and delete marker with concurrent
+      delete_objects calls while the next pages are being listed, and retries the keys S3 reports in Errors.
+With --timeout, the handler runs with a short Lambda timeout, so it carries on in new invocations.
+
+Example:
+    python bench_bucket_purge.py --sizes 1000 10000 50000 --versioned --output results.json
+'''
+
+# Importing the argparse module to parse the command line arguments.
+import argparse
+# Importing the json module to write the results.
+import json
+# Importing the logging module to silence the logs of the handler.
+import logging
+# Importing the time module to time the purges.
+import time
+# Importing the AWS stubs module to stand in for S3, Lambda and cfnresponse.
+import aws_stubs_module as stubs
+# Importing the template Lambda module to load the handler from the template.
+import template_lambda_module as template_lambda
+
+# Logical ID of the S3 deletion Lambda Function in the final template.
+DELETION_FUNCTION = "CloudManiaS3ObjectDeletionFunction"
+# Name of the bucket emptied by the function.
+BUCKET_NAME = "cloudmania-passportimages"
+
+def parse_args(argv=None):
+    # Define the command line arguments.
+    parser = argparse.ArgumentParser(description="Benchmark the S3 bucket purge with a local S3 stand-in.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="Numbers of objects of the buckets.")
+    parser.add_argument("--versioned", action="store_true",
+                        help="Give a third of the objects an older version and another third a delete marker.")
+    parser.add_argument("--list-latency", type=float, default=0.05, help="Latency (in seconds) of each listing call.")
+    parser.add_argument("--delete-latency", type=float, default=0.2, help="Latency (in seconds) of each delete_objects call.")
+    parser.add_argument("--flaky-every", type=int, default=997, help="Report every n-th key in Errors once (0 to disable).")
+    parser.add_argument("--concurrency", type=int, default=8, help="Value of MAX_CONCURRENT_DELETES.")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Lambda timeout (in seconds) of each invocation of the handler (defaults to unlimited).")
+    parser.add_argument("--output", default=None, help="JSON file the results are written to.")
+    return parser.parse_args(argv)
+
+def fill_bucket(size, args):
+    # Create a stand-in bucket holding size objects.
+    s3 = stubs.StubS3(versioned=args.versioned, flaky_every=args.flaky_every)
+    for index in range(size):
+        key = f"passport-photo-{index:07d}.jpg"
+        s3.put_object(Bucket=BUCKET_NAME, Key=key)
+        if args.versioned and index % 3 == 1:
+            s3.put_object(Bucket=BUCKET_NAME, Key=key)
+        if args.versioned and index % 3 == 2:
+            s3.delete_object(Bucket=BUCKET_NAME, Key=key)
+    # Only count the calls and add the latencies from now on.
+    s3.calls = {}
+    s3.latencies = {"ListObjectsV2": args.list_latency, "ListObjectVersions": args.list_latency,
+                    "DeleteObjects": args.delete_latency}
+    return s3
+
+def serial_purge(s3):
+    # The purge of the function before the purge engine: one page at a time, without versions nor retries.
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=''):
+        if 'Contents' in page:
+            objects = [{'Key': x['Key']} for x in page['Contents']]
+            s3.delete_objects(Bucket=BUCKET_NAME, Delete={'Objects': objects})
+
+def handler_purge(handler_module, s3, args, request_type="Delete"):
+    # Run the handler like CloudFormation does, then run the invocations it started to carry on, if any.
+    lambda_client = stubs.StubLambda()
+    handler_module.client = s3
+    handler_module.lambda_client = lambda_client
+    handler_module.MAX_CONCURRENT_DELETES = args.concurrency
+    stubs.cfnresponse.responses.clear()
+    event = {"RequestType": request_type, "ResponseURL": "http://localhost", "StackId": "bench", "RequestId": "bench",
+             "LogicalResourceId": "CloudManiaS3DeletionCustomResource"}
+    invocations = 0
+    while event is not None:
+        invocations += 1
+        timeout = args.timeout if args.timeout is not None else 900.0
+        handler_module.lambda_handler(event, stubs.StubContext(timeout, DELETION_FUNCTION))
+        event = lambda_client.invocations.pop()["Payload"] if lambda_client.invocations else None
+    return invocations, stubs.cfnresponse.responses[-1]["Status"] if stubs.cfnresponse.responses else None
+
+def main(argv=None):
+    args = parse_args(argv)
+    handler_module = template_lambda.load_lambda(DELETION_FUNCTION)
+    # Keep the logs of every call out of the benchmark output.
+    logging.getLogger().setLevel(logging.WARNING)
+    handler_module.logger.setLevel(logging.WARNING)
+    # Leave enough time to the handler to list a few pages before its time reserve, when it has a timeout.
+    if args.timeout is not None:
+        handler_module.TIME_RESERVE_MILLIS = int(args.timeout * 500)
+
+    results = []
+    for size in args.sizes:
+        result = {"size": size}
+        for name in ("serial", "handler"):
+            s3 = fill_bucket(size, args)
+            versions = s3.count_versions(BUCKET_NAME)
+            start_time = time.perf_counter()
+            if name == "serial":
+                serial_purge(s3)
+            else:
+                result["invocations"], result["cfn_response"] = handler_purge(handler_module, s3, args)
+            seconds = time.perf_counter() - start_time
+            result[name] = {
+                "seconds": round(seconds, 3),
+                "versions_before": versions,
+                "versions_left": s3.count_versions(BUCKET_NAME),
+                "versions_per_second": round((versions - s3.count_versions(BUCKET_NAME)) / seconds, 1),
+                "calls": s3.calls
+            }
+        results.append(result)
+        print(
+            f"{size:>7} objects ({result['handler']['versions_before']} versions): "
+            f"serial {result['serial']['seconds']:.2f}s, {result['serial']['versions_left']} left  |  "
+            f"handler {result['handler']['seconds']:.2f}s, {result['handler']['versions_left']} left, "
+            f"{result['invocations']} invocations, CloudFormation response {result['cfn_response']}"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({"benchmark": "bucket_purge", "arguments": vars(args), "results": results}, output_file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+'''
+This is the end-to-end benchmark of the upload -> validate -> fetch flow of a photo.
+It runs the ValidationPipeline of the app (Cloud-Mania-App/pipeline_module.py) against the local stand-ins of
+aws_stubs_module, wired together like the stack of the final template:
+    - The photos are uploaded to the StubS3, whose event notification runs the validation Lambda Function of
+      the template (CloudManiaPhotoValidationProcessor) asynchronously, after a delivery delay.
+    - The validation handler detects the faces with the StubRekognition and writes the results to the
+      StubDynamoDB table.
+    - The ResultPoller of the pipeline polls the StubApiGateway, which answers with the request handler Lambda
+      Function of the template (CloudManiaImageRequestHandler) reading the same table.
+It runs once per number of photos, and reports the throughput, the p50/p95 of every phase of a photo (see
+metrics_module), the calls made to every stand-in and the step latencies the handlers print as EMF log lines.
+Every fail_every-th photo has a smiling face, so the FAIL results are checked too.
+
+Example:
+    python bench_end_to_end.py --photos 50 200 1000 --upload-latency 0.05 --rekognition-latency 0.2 --output results.json
+'''
+
+# Importing the argparse module to parse the command line arguments.
+import argparse
+# Importing the contextlib module to capture the metric lines the handlers print.
+import contextlib
+# Importing the io module to hold the captured metric lines.
+import io
+# Importing the json module to parse the metric lines and write the results.
+import json
+# Importing the logging module to silence the logs of the handlers.
+import logging
+# Importing the os module to build the paths of the photos and of the app.
+import os
+# Importing the random module to seed the jitter of the poll delays.
+import random
+# Importing the statistics module to summarize the step latencies reported by the handlers.
+import statistics
+# Importing the sys module to import the modules of the app.
+import sys
+# Importing the tempfile module to write the photos to a temporary folder.
+import tempfile
+# Importing the time module to time the runs.
+import time
+# Importing the AWS stubs module to stand in for S3, Rekognition, DynamoDB and API Gateway.
+import aws_stubs_module as stubs
+# Importing the template Lambda module to load the handlers from the template.
+import template_lambda_module as template_lambda
+
+# Directory of the app, whose pipeline is benchmarked.
+APP_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Cloud-Mania-App")
+sys.path.insert(0, APP_DIRECTORY)
+# Importing the pipeline and validation modules of the app.
+import pipeline_module as pipeline
+import validation_module as validation
+
+# Logical IDs of the Lambda Functions in the final template.
+VALIDATION_FUNCTION = "CloudManiaPhotoValidationProcessor"
+REQUEST_FUNCTION = "CloudManiaImageRequestHandler"
+# Name of the bucket the photos are uploaded to.
+BUCKET_NAME = "cloudmania-passportimages"
+# Invoke URL of the stand-in API.
+INVOKE_URL = "https://stub.execute-api.us-east-1.amazonaws.com"
+
+def parse_args(argv=None):
+    # Define the command line arguments.
+    parser = argparse.ArgumentParser(description="Benchmark the upload -> validate -> fetch flow against local AWS stand-ins.")
+    parser.add_argument("--template", default=template_lambda.FINAL_TEMPLATE, help="Template to load the handlers from.")
+    parser.add_argument("--photos", type=int, nargs="+", default=[50, 200, 1000], help="Numbers of photos of the runs.")
+    parser.add_argument("--photo-kb", type=int, default=200, help="Size (in KB) of every photo.")
+    parser.add_argument("--fail-every", type=int, default=5, help="Give every n-th photo a smiling face (0 to disable).")
+    parser.add_argument("--upload-latency", type=float, default=0.05, help="Latency (in seconds) of each upload.")
+    parser.add_argument("--notification-delay", type=float, default=0.2,
+                        help="Delay (in seconds) between an upload and the start of its validation Lambda.")
+    parser.add_argument("--rekognition-latency", type=float, default=0.2, help="Latency (in seconds) of each DetectFaces call.")
+    parser.add_argument("--dynamodb-latency", type=float, default=0.01, help="Latency (in seconds) of each DynamoDB call.")
+    parser.add_argument("--api-latency", type=float, default=0.03, help="Latency (in seconds) of each API request.")
+    parser.add_argument("--lambda-concurrency", type=int, default=100,
+                        help="Maximum number of validation Lambda executions at the same time.")
+    parser.add_argument("--upload-workers", type=int, default=pipeline.MAX_UPLOAD_WORKERS, help="Photos uploaded at the same time.")
+    parser.add_argument("--validation-workers", type=int, default=pipeline.MAX_VALIDATION_WORKERS,
+                        help="Validation results waited for at the same time.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the jitter of the poll delays, so two runs poll on the same schedule.")
+    parser.add_argument("--output", default=None, help="JSON file the results are written to.")
+    return parser.parse_args(argv)
+
+def write_photos(folder, count, size):
+    # Write count photos of size bytes. The pipeline uploads them as they are, so their contents don't matter.
+    paths = []
+    for index in range(count):
+        path = os.path.join(folder, f"passport photo {index:06d}.jpg")
+        with open(path, 'wb') as photo_file:
+            photo_file.write(os.urandom(size))
+        paths.append(path)
+    return paths
+
+def summarize_metrics(output):
+    # Return the median of every metric of the EMF lines printed by the handlers, by function.
+    values = {}
+    for line in output.splitlines():
+        if not line.startswith('{"_aws"'):
+            continue
+        record = json.loads(line)
+        function_values = values.setdefault(record["FunctionName"], {})
+        for metric in record["_aws"]["CloudWatchMetrics"][0]["Metrics"]:
+            # The validation handler prints lists of values, the request handler single values.
+            value = record[metric["Name"]]
+            function_values.setdefault(metric["Name"], []).extend(value if isinstance(value, list) else [value])
+    return {
+        function_name: {name: round(statistics.median(metric_values), 3) for name, metric_values in function_values.items()}
+        for function_name, function_values in values.items()
+    }
+
+def run_pipeline(validation_module, request_module, paths, args):
+    # Wire fresh stand-ins to the handlers, so every run starts from an empty bucket, table and result cache.
+    smiling = {os.path.basename(path) for index, path in enumerate(paths) if args.fail_every and index % args.fail_every == 0}
+    rekognition = stubs.StubRekognition(
+        latency=args.rekognition_latency,
+        face_details={name: [stubs.make_face_detail(smile=True)] for name in smiling}
+    )
+    dynamodb = stubs.StubDynamoDB(latency=args.dynamodb_latency)
+    table = dynamodb.Table(validation_module.DYNAMODB_TABLE)
+    validation_module.rekognition_client = rekognition
+    validation_module.validation_table = table
+    request_module.dynamodb_client = dynamodb
+    request_module.validation_table = table
+    request_module.result_cache.clear()
+
+    s3 = stubs.StubS3(latencies={"PutObject": args.upload_latency})
+    trigger = stubs.StubLambdaTrigger(validation_module.lambda_handler, delay=args.notification_delay,
+                                      concurrency=args.lambda_concurrency, function_name=VALIDATION_FUNCTION)
+    s3.add_notification(BUCKET_NAME, trigger.notify)
+    api = stubs.StubApiGateway(request_module, latency=args.api_latency)
+
+    validation_pipeline = pipeline.ValidationPipeline(
+        s3, BUCKET_NAME, lambda: INVOKE_URL,
+        upload_workers=args.upload_workers, validation_workers=args.validation_workers
+    )
+    # Poll the stand-in API instead of the real one.
+    validation_pipeline.result_poller = validation.ResultPoller(session=api)
+
+    random.seed(args.seed)
+    output = io.StringIO()
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        results = list(validation_pipeline.run(paths))
+        seconds = time.perf_counter() - start_time
+        validation_pipeline.shutdown()
+        trigger.close()
+    stats = validation_pipeline.stats()
+
+    # Every photo must have finished with the result of its face.
+    errors = [result["error"] for result in results if result["error"]]
+    assert not errors, f"{len(errors)} photos failed, e.g. {errors[0]}"
+    assert stats["failed"] == len(smiling), f"{stats['failed']} photos failed the validation, expected {len(smiling)}"
+    assert trigger.errors == 0, f"{trigger.errors} validation Lambda executions failed"
+    return {
+        "photos": len(paths),
+        "seconds": round(seconds, 3),
+        "photos_per_second": round(len(paths) / seconds, 2),
+        "megabytes_per_second": round(stats["uploaded_bytes"] / (1024 * 1024) / seconds, 2),
+        "passed": stats["passed"],
+        "failed": stats["failed"],
+        "errors": stats["errors"],
+        "latency": validation_pipeline.latency_summary(),
+        "calls": {
+            "s3": s3.calls,
+            "validation_lambda": trigger.invocations,
+            "rekognition": rekognition.calls,
+            "dynamodb": table.calls,
+            "api": api.calls,
+            "poller_requests": validation_pipeline.result_poller.requests,
+            "poller_batch_requests": validation_pipeline.result_poller.batch_requests
+        },
+        "lambda_milliseconds": summarize_metrics(output.getvalue())
+    }
+
+def main(argv=None):
+    args = parse_args(argv)
+    validation_module = template_lambda.load_lambda(VALIDATION_FUNCTION, args.template)
+    request_module = template_lambda.load_lambda(REQUEST_FUNCTION, args.template)
+    # Keep the logs of every invocation out of the benchmark output.
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger(VALIDATION_FUNCTION).setLevel(logging.WARNING)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="cloudmania-bench-") as folder:
+        paths = write_photos(folder, max(args.photos), args.photo_kb * 1024)
+        for count in args.photos:
+            result = run_pipeline(validation_module, request_module, paths[:count], args)
+            results.append(result)
+            total = result["latency"]["total"]
+            print(
+                f"{count:>6} photos in {result['seconds']:.2f}s ({result['photos_per_second']:.1f} photos/s), "
+                f"{result['passed']} PASS, {result['failed']} FAIL  |  latency p50 {total['p50']:.2f}s, "
+                f"p95 {total['p95']:.2f}s  |  {result['calls']['poller_requests']} API requests "
+                f"({result['calls']['poller_batch_requests']} batches)"
+            )
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({"benchmark": "end_to_end", "arguments": vars(args), "results": results}, output_file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+'''
+This is the benchmark of the stack deploy and teardown orchestration of the app.
+It runs the deployment code of the app (Cloud-Mania-App/cloudformation_module.py) and its stack event monitor
+(Cloud-Mania-App/stack_monitor_module.py) against the StubCloudFormation of aws_stubs_module, which runs the
+stack operations with the resources of the templates on a simulated clock (see --time-scale):
+    - Deploys a new stack with every deploy mode, then deploys it again in a single pass, which must find
+      nothing to change.
+    - Tears down a stack whose bucket holds an increasing number of objects. The custom resource runs the S3
+      deletion Lambda Function of the final template to purge the bucket (like bench_bucket_purge.py), and the
+      bucket fails to delete if anything is left in it, like S3 does.
+The simulated seconds are the wall-clock seconds divided by the time scale, so they compare with the deploy
+times of the real stack. Their orchestration part is the time the app spent on top of the stack operations
+themselves: waiting for the change sets and noticing the end of every operation between two polls.
+The purge runs in real time, at the latencies of the S3 stand-in, so it is reported in real seconds.
+
+Example:
+    python bench_stack_lifecycle.py --modes single-pass step-by-step --objects 0 1000 10000 --output results.json
+'''
+
+# Importing the argparse module to parse the command line arguments.
+import argparse
+# Importing the json module to write the results.
+import json
+# Importing the logging module to silence the logs of the handler.
+import logging
+# Importing the os module to build the path of the app.
+import os
+# Importing the sys module to import the modules of the app.
+import sys
+# Importing the tempfile module to write the deploy timing reports to a temporary folder.
+import tempfile
+# Importing the time module to time the teardowns.
+import time
+# Importing the AWS stubs module to stand in for CloudFormation and S3.
+import aws_stubs_module as stubs
+# Importing the bucket purge benchmark to fill the bucket and run the S3 deletion Lambda Function.
+import bench_bucket_purge as purge_bench
+# Importing the template Lambda module to load the handler from the template.
+import template_lambda_module as template_lambda
+
+# Directory of the app, whose deployment code is benchmarked.
+APP_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Cloud-Mania-App")
+sys.path.insert(0, APP_DIRECTORY)
+# Importing the CloudFormation and stack monitor modules of the app.
+import cloudformation_module as cfn
+import stack_monitor_module as stack_monitor
+
+# Seconds the app waits between two checks of a change set, on the real clock.
+CHANGE_SET_POLL_SECONDS = cfn.CHANGE_SET_POLL_SECONDS
+# Name of the benchmarked stacks.
+STACK_NAME = "cloudmania-bench"
+# Logical IDs of the bucket and of the custom resource purging it.
+BUCKET_RESOURCE = "CloudManiaImagesBucket"
+CUSTOM_RESOURCE = "CloudManiaS3DeletionCustomResource"
+
+def parse_args(argv=None):
+    # Define the command line arguments.
+    parser = argparse.ArgumentParser(description="Benchmark the stack deploy and teardown orchestration with a local CloudFormation stand-in.")
+    parser.add_argument("--modes", nargs="+", choices=cfn.DEPLOY_MODES, default=list(cfn.DEPLOY_MODES), help="Deploy modes to run.")
+    parser.add_argument("--objects", type=int, nargs="+", default=[0, 1000, 10000],
+                        help="Numbers of objects in the bucket when the stack is torn down.")
+    parser.add_argument("--time-scale", type=float, default=0.01,
+                        help="Real seconds per simulated second of CloudFormation (and of the poll intervals).")
+    parser.add_argument("--versioned", action="store_true",
+                        help="Give a third of the objects an older version and another third a delete marker.")
+    parser.add_argument("--list-latency", type=float, default=0.05, help="Latency (in seconds) of each listing call.")
+    parser.add_argument("--delete-latency", type=float, default=0.2, help="Latency (in seconds) of each delete_objects call.")
+    parser.add_argument("--flaky-every", type=int, default=997, help="Report every n-th key in Errors once (0 to disable).")
+    parser.add_argument("--concurrency", type=int, default=8, help="Value of MAX_CONCURRENT_DELETES.")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Lambda timeout (in seconds) of each invocation of the purge (defaults to unlimited).")
+    parser.add_argument("--output", default=None, help="JSON file the results are written to.")
+    return parser.parse_args(argv)
+
+class Orchestrator:
+    '''
+    Deploys and deletes the stack with the code of the app, on a StubCloudFormation whose custom resource
+    purges the given StubS3 with the S3 deletion Lambda Function.
+    '''
+
+    def __init__(self, handler_module, s3, args, report_path):
+        self.handler_module = handler_module
+        self.s3 = s3
+        self.args = args
+        self.report_path = report_path
+        self.purges = []
+        self.monitor_calls = 0
+        self.cf = stubs.StubCloudFormation(time_scale=args.time_scale, hooks={
+            CUSTOM_RESOURCE: self.purge_bucket,
+            BUCKET_RESOURCE: self.delete_bucket
+        })
+
+    def purge_bucket(self, request_type):
+        # Run the S3 deletion Lambda Function like CloudFormation runs it for the custom resource.
+        invocations, status = purge_bench.handler_purge(self.handler_module, self.s3, self.args, request_type)
+        self.purges.append({"request_type": request_type, "invocations": invocations, "cfn_response": status})
+        if status != stubs.StubCfnResponse.SUCCESS:
+            raise RuntimeError(f"Received response status [{status}] from custom resource")
+
+    def delete_bucket(self, request_type):
+        # S3 refuses to delete a bucket that still holds objects, versions or delete markers.
+        if request_type == "Delete" and self.s3.count_versions(purge_bench.BUCKET_NAME):
+            raise RuntimeError("The bucket you tried to delete is not empty")
+
+    def wait_for_status(self, stack_name, desired_status, started_after=None):
+        # Follow the stack events like the app does, with the poll intervals on the simulated clock.
+        monitor = stack_monitor.StackEventMonitor(self.cf, stack_name, sleep=lambda seconds: time.sleep(seconds * self.args.time_scale),
+                                                  started_after=started_after)
+        try:
+            return monitor.wait(desired_status)
+        finally:
+            self.monitor_calls += monitor.api_calls
+
+    def deploy(self, mode):
+        return cfn.deploy_stack(self.cf, STACK_NAME, template_lambda.TEMPLATES_DIRECTORY, mode, self.wait_for_status,
+                                lambda text, color: None, self.report_path)
+
+    def delete(self):
+        # Delete the stack like the app does (see delete_infra).
+        self.cf.delete_stack(StackName=STACK_NAME)
+        return self.wait_for_status(STACK_NAME, "DELETE_COMPLETE")
+
+    def operation_seconds(self, start=0):
+        # Simulated seconds of the stack operations from the given one on, without the time of their hooks.
+        return sum((operation["ended"] - operation["started"] - operation["hook_seconds"]) / self.args.time_scale
+                   for operation in self.cf.operations[start:] if operation["ended"] is not None)
+
+def run_deploy(handler_module, mode, args, report_path):
+    # Deploy a new stack with the mode, then deploy it again, which must find nothing to change.
+    orchestrator = Orchestrator(handler_module, stubs.StubS3(), args, report_path)
+    report = orchestrator.deploy(mode)
+    assert report["result"] == "SUCCESS", f"The {mode} deployment ended with {report['result']}"
+    simulated_seconds = report["total_seconds"] / args.time_scale
+    operation_seconds = orchestrator.operation_seconds()
+    result = {
+        "mode": mode,
+        "seconds": report["total_seconds"],
+        "simulated_seconds": round(simulated_seconds, 1),
+        "stack_operation_seconds": round(operation_seconds, 1),
+        "orchestration_seconds": round(simulated_seconds - operation_seconds, 1),
+        "stack_operations": len(orchestrator.cf.operations),
+        "steps": [dict(step, simulated_seconds=round(step["seconds"] / args.time_scale, 1)) for step in report["steps"]],
+        "cloudformation_calls": dict(orchestrator.cf.calls),
+        "monitor_calls": orchestrator.monitor_calls
+    }
+    # Deploy again: the change set finds no changes, and the stack is left alone.
+    orchestrator.cf.calls = {}
+    report = orchestrator.deploy(cfn.DEPLOY_MODE_SINGLE_PASS)
+    assert report["result"] == "NO_CHANGES", f"The second deployment ended with {report['result']}"
+    result["redeploy"] = {
+        "result": report["result"],
+        "seconds": report["total_seconds"],
+        "simulated_seconds": round(report["total_seconds"] / args.time_scale, 1),
+        "cloudformation_calls": orchestrator.cf.calls
+    }
+    return result
+
+def run_teardown(handler_module, size, args, report_path):
+    # Deploy a stack, fill its bucket with size objects and tear the stack down.
+    s3 = purge_bench.fill_bucket(size, args)
+    orchestrator = Orchestrator(handler_module, s3, args, report_path)
+    assert orchestrator.deploy(cfn.DEPLOY_MODE_SINGLE_PASS)["result"] == "SUCCESS", "The deployment failed"
+    versions = s3.count_versions(purge_bench.BUCKET_NAME)
+    operations = len(orchestrator.cf.operations)
+    orchestrator.cf.calls = {}
+    orchestrator.monitor_calls = 0
+    start_time = time.perf_counter()
+    deleted = orchestrator.delete()
+    seconds = time.perf_counter() - start_time
+    purge_seconds = orchestrator.cf.operations[-1]["hook_seconds"]
+    delete_purges = [purge for purge in orchestrator.purges if purge["request_type"] == "Delete"]
+    return {
+        "objects": size,
+        "result": "DELETE_COMPLETE" if deleted else "DELETE_FAILED",
+        "versions_before": versions,
+        "versions_left": s3.count_versions(purge_bench.BUCKET_NAME),
+        "seconds": round(seconds, 3),
+        "purge_seconds": round(purge_seconds, 3),
+        "simulated_seconds": round((seconds - purge_seconds) / args.time_scale, 1),
+        "stack_operation_seconds": round(orchestrator.operation_seconds(operations), 1),
+        "purge_invocations": delete_purges[-1]["invocations"] if delete_purges else 0,
+        "s3_calls": s3.calls,
+        "cloudformation_calls": orchestrator.cf.calls,
+        "monitor_calls": orchestrator.monitor_calls
+    }
+
+def main(argv=None):
+    args = parse_args(argv)
+    handler_module = template_lambda.load_lambda(purge_bench.DELETION_FUNCTION)
+    # Keep the logs of every call out of the benchmark output.
+    logging.getLogger().setLevel(logging.WARNING)
+    handler_module.logger.setLevel(logging.WARNING)
+    # Leave enough time to the handler to list a few pages before its time reserve, when it has a timeout.
+    if args.timeout is not None:
+        handler_module.TIME_RESERVE_MILLIS = int(args.timeout * 500)
+    # Wait for the change sets on the simulated clock too.
+    cfn.CHANGE_SET_POLL_SECONDS = CHANGE_SET_POLL_SECONDS * args.time_scale
+
+    deploys = []
+    teardowns = []
+    with tempfile.TemporaryDirectory(prefix="cloudmania-bench-") as folder:
+        # Keep the timing reports of the benchmark out of the report file of the app.
+        report_path = os.path.join(folder, "deploy-timings.jsonl")
+        for mode in args.modes:
+            result = run_deploy(handler_module, mode, args, report_path)
+            deploys.append(result)
+            print(
+                f"deploy {mode:>12}: {result['simulated_seconds']:.0f}s simulated ({result['seconds']:.2f}s real), "
+                f"of which {result['orchestration_seconds']:.0f}s orchestration, {result['stack_operations']} stack "
+                f"operations, {result['monitor_calls']} monitor calls  |  redeploy {result['redeploy']['result']} "
+                f"in {result['redeploy']['simulated_seconds']:.0f}s simulated"
+            )
+        for size in args.objects:
+            result = run_teardown(handler_module, size, args, report_path)
+            teardowns.append(result)
+            print(
+                f"teardown {size:>7} objects ({result['versions_before']} versions): {result['result']}, "
+                f"{result['versions_left']} left, {result['simulated_seconds']:.0f}s simulated + purge "
+                f"{result['purge_seconds']:.2f}s real ({result['purge_invocations']} invocations), "
+                f"{result['monitor_calls']} monitor calls"
+            )
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({"benchmark": "stack_lifecycle", "arguments": vars(args),
+                       "results": {"deploy": deploys, "teardown": teardowns}}, output_file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+'''
+This is the startup benchmark of the GUI app (Cloud-Mania-App/CloudManiaApp.py).
+Every run starts a fresh Python process, so nothing is already imported or cached, which:
+    - Imports CloudManiaApp and configures the AWS clients, like main() does.
+    - Builds the window and paints it once (root.update()), without entering the event loop.
+    - Reports the import time, the time to the first paint (from the launch of the process), the import
+      memory (peak of the Python allocations while importing, and the maximum resident set size), and which
+      of the heavy libraries (boto3, requests, PIL) were loaded by then.
+The "eager" mode imports boto3, requests and PIL and creates the S3, CloudFormation and API Gateway clients
+before importing the app, the way the app started before the clients were created lazily, for comparison.
+Without a display (no DISPLAY on Linux), the window can't be built, so the paint time is reported as null.
+
+Example:
+    python bench_startup.py --runs 5 --modes lazy eager --output results.json
+'''
+
+# Importing the argparse module to parse the command line arguments.
+import argparse
+# Importing the json module to read the reports of the runs and write the results.
+import json
+# Importing the os module to build the paths and the environment of the runs.
+import os
+# Importing the statistics module to summarize the runs.
+import statistics
+# Importing the subprocess module to start every run in a fresh process.
+import subprocess
+# Importing the sys module to find the Python interpreter and the loaded modules.
+import sys
+# Importing the time module to time the runs.
+import time
+
+# Directory of the GUI app.
+APP_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Cloud-Mania-App")
+# Heavy libraries whose import is reported.
+HEAVY_MODULES = ("boto3", "botocore", "requests", "PIL")
+# Services whose clients the eager mode creates before importing the app.
+EAGER_SERVICES = ("s3", "cloudformation", "apigatewayv2")
+
+def parse_args(argv=None):
+    # Define the command line arguments.
+    parser = argparse.ArgumentParser(description="Benchmark the startup time and import memory of the GUI app.")
+    parser.add_argument("--runs", type=int, default=5, help="Number of timed runs of every mode.")
+    parser.add_argument("--modes", nargs="+", choices=["lazy", "eager"], default=["lazy", "eager"],
+                        help="Startup modes to run.")
+    parser.add_argument("--output", default=None, help="JSON file the results are written to.")
+    # Used by the runs themselves: run one startup in this process and print its report.
+    parser.add_argument("--child", choices=["lazy", "eager"], default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--trace-memory", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def get_max_rss_megabytes():
+    # Return the maximum resident set size of this process, if the platform reports it.
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return round(max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def run_child(mode, trace_memory):
+    # Run one startup in this process and print its report as JSON.
+    if trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+    start_time = time.perf_counter()
+    sys.path.insert(0, APP_DIRECTORY)
+    if mode == "eager":
+        # Import the heavy libraries and create the clients up front, like the app did before.
+        import boto3
+        import requests
+        import PIL.ImageTk
+        for service_name in EAGER_SERVICES:
+            boto3.client(service_name)
+    import CloudManiaApp as app
+    import_seconds = time.perf_counter() - start_time
+    report = {"mode": mode, "import_seconds": round(import_seconds, 4)}
+    if trace_memory:
+        report["import_peak_megabytes"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+        tracemalloc.stop()
+
+    # Start the app like main() does, up to the first paint of the window.
+    app.configure_clients()
+    try:
+        app.build_gui()
+        app.root.update()
+        report["painted_at"] = time.time()
+        report["paint_seconds"] = round(time.perf_counter() - start_time, 4)
+        app.root.destroy()
+    # There is no display to open the window on.
+    except app.tk.TclError as e:
+        report["painted_at"] = None
+        report["paint_seconds"] = None
+        report["paint_error"] = str(e)
+    report["ready_at"] = time.time()
+    report["max_rss_megabytes"] = get_max_rss_megabytes()
+    report["loaded_modules"] = {name: name in sys.modules for name in HEAVY_MODULES}
+    report["module_count"] = len(sys.modules)
+    print(json.dumps(report))
+
+def run_startup(mode, trace_memory=False):
+    # Start one run in a fresh process and return its report.
+    env = dict(os.environ)
+    # Keep the .env file of the developer out of the runs, and give boto3 a region to create clients with.
+    env["AWS_ENV_PATH"] = os.devnull
+    env.setdefault("AWS_REGION", "us-east-1")
+    env.setdefault("AWS_DEFAULT_REGION", env["AWS_REGION"])
+    command = [sys.executable, os.path.abspath(__file__), "--child", mode]
+    if trace_memory:
+        command.append("--trace-memory")
+    launched_at = time.time()
+    completed = subprocess.run(command, env=env, cwd=APP_DIRECTORY, capture_output=True, text=True, check=True)
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    # Time from the launch of the process, including the start of the interpreter.
+    report["process_paint_seconds"] = (
+        round(report["painted_at"] - launched_at, 4) if report["painted_at"] is not None else None
+    )
+    report["process_ready_seconds"] = round(report["ready_at"] - launched_at, 4)
+    return report
+
+def median(reports, name):
+    values = [report[name] for report in reports if report.get(name) is not None]
+    return round(statistics.median(values), 4) if values else None
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        run_child(args.child, args.trace_memory)
+        return
+
+    results = []
+    for mode in args.modes:
+        reports = [run_startup(mode) for _ in range(args.runs)]
+        # Trace the allocations in a separate run, since tracing slows the imports down.
+        memory_report = run_startup(mode, trace_memory=True)
+        result = {
+            "mode": mode,
+            "runs": args.runs,
+            "import_seconds": median(reports, "import_seconds"),
+            "paint_seconds": median(reports, "paint_seconds"),
+            "process_paint_seconds": median(reports, "process_paint_seconds"),
+            "process_ready_seconds": median(reports, "process_ready_seconds"),
+            "import_peak_megabytes": memory_report["import_peak_megabytes"],
+            "max_rss_megabytes": median(reports, "max_rss_megabytes"),
+            "loaded_modules": reports[-1]["loaded_modules"],
+            "module_count": reports[-1]["module_count"],
+            "paint_error": reports[-1].get("paint_error"),
+            "reports": reports
+        }
+        results.append(result)
+        loaded = ", ".join(name for name, loaded in result["loaded_modules"].items() if loaded) or "none"
+        paint = f"{result['process_paint_seconds']:.3f}s" if result["process_paint_seconds"] is not None else "n/a (no display)"
+        print(
+            f"{mode:>5}: import {result['import_seconds']:.3f}s, first paint {paint}, "
+            f"ready {result['process_ready_seconds']:.3f}s  |  import peak {result['import_peak_megabytes']} MB, "
+            f"max RSS {result['max_rss_megabytes']} MB, {result['module_count']} modules, heavy modules loaded: {loaded}"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({"benchmark": "startup", "arguments": vars(args), "results": results}, output_file, indent=2)
+
+if __name__ == "__main__":
+    main()
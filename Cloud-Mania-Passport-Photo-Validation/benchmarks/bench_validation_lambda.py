@@ -0,0 +1,117 @@
+'''
+This is the throughput benchmark of the validation Lambda Function (CloudManiaPhotoValidationProcessor).
+It runs the handler of the final template locally against the stubbed Rekognition and DynamoDB of
+aws_stubs_module, with one S3 event holding many records:
+    - Once per concurrency level, so the sequential handler (concurrency 1) can be compared to the
+      concurrent ones.
+    - With some images failing in Rekognition, to check they are reported per record.
+The step latencies the handler prints as EMF log lines (detect_faces, evaluate_face, write_results_to_dynamo)
+are captured and summarized too.
+
+Example:
+    python bench_validation_lambda.py --records 200 --latency 0.15 --concurrency 1 4 8 16 --output results.json
+'''
+
+# Importing the argparse module to parse the command line arguments.
+import argparse
+# Importing the contextlib module to capture the metric lines the handler prints.
+import contextlib
+# Importing the io module to hold the captured metric lines.
+import io
+# Importing the json module to parse the handler responses and metric lines, and write the results.
+import json
+# Importing the logging module to silence the logs of the handler.
+import logging
+# Importing the statistics module to summarize the step latencies reported by the handler.
+import statistics
+# Importing the time module to time the handler.
+import time
+# Importing the AWS stubs module to stand in for Rekognition and DynamoDB.
+import aws_stubs_module as stubs
+# Importing the template Lambda module to load the handler from the template.
+import template_lambda_module as template_lambda
+
+# Logical ID of the validation Lambda Function in the templates.
+VALIDATION_FUNCTION = "CloudManiaPhotoValidationProcessor"
+
+def parse_args(argv=None):
+    # Define the command line arguments.
+    parser = argparse.ArgumentParser(description="Benchmark the validation Lambda Function with stubbed AWS services.")
+    parser.add_argument("--template", default=template_lambda.FINAL_TEMPLATE, help="Template to load the handler from.")
+    parser.add_argument("--records", type=int, default=100, help="Number of records of the S3 event.")
+    parser.add_argument("--failures", type=int, default=2, help="Number of records failing in Rekognition.")
+    parser.add_argument("--latency", type=float, default=0.15, help="Latency (in seconds) of each DetectFaces call.")
+    parser.add_argument("--dynamodb-latency", type=float, default=0.01, help="Latency (in seconds) of each DynamoDB call.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16],
+                        help="Values of MAX_CONCURRENT_DETECTIONS to run the handler with.")
+    parser.add_argument("--output", default=None, help="JSON file the results are written to.")
+    return parser.parse_args(argv)
+
+def run_handler(handler_module, keys, concurrency, args):
+    # Swap the AWS clients of the handler for fresh stand-ins, so every run starts from an empty table.
+    rekognition = stubs.StubRekognition(latency=args.latency, fail_names=keys[:args.failures])
+    table = stubs.StubTable(latency=args.dynamodb_latency)
+    handler_module.rekognition_client = rekognition
+    handler_module.validation_table = table
+    handler_module.MAX_CONCURRENT_DETECTIONS = concurrency
+
+    output = io.StringIO()
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        response = handler_module.lambda_handler(stubs.make_s3_event(keys), None)
+    seconds = time.perf_counter() - start_time
+
+    records = json.loads(response["body"])
+    errors = [record for record in records if "Error" in record]
+    # Every record must be reported and written, the records with an error as ERROR items.
+    assert len(records) == len(keys), f"{len(records)} records reported for {len(keys)} keys"
+    assert len(table.items) == len(keys), f"{len(table.items)} items written"
+    error_items = [item for item in table.items.values() if item["ValidationResult"] == "ERROR"]
+    assert len(error_items) == len(errors), f"{len(error_items)} ERROR items written for {len(errors)} errors"
+    return {
+        "concurrency": concurrency,
+        "records": len(keys),
+        "errors": len(errors),
+        "seconds": round(seconds, 4),
+        "records_per_second": round(len(keys) / seconds, 2),
+        "rekognition_calls": rekognition.calls,
+        "dynamodb_calls": table.calls,
+        "step_milliseconds": summarize_metrics(output.getvalue())
+    }
+
+def summarize_metrics(output):
+    # Gather the values of every metric of the EMF lines printed by the handler, and return their medians.
+    values = {}
+    for line in output.splitlines():
+        if not line.startswith('{"_aws"'):
+            continue
+        record = json.loads(line)
+        for metric in record["_aws"]["CloudWatchMetrics"][0]["Metrics"]:
+            values.setdefault(metric["Name"], []).extend(record[metric["Name"]])
+    return {name: round(statistics.median(metric_values), 3) for name, metric_values in values.items()}
+
+def main(argv=None):
+    args = parse_args(argv)
+    handler_module = template_lambda.load_lambda(VALIDATION_FUNCTION, args.template)
+    # Keep the tracebacks of the failing records out of the benchmark output.
+    logging.getLogger(VALIDATION_FUNCTION).setLevel(logging.CRITICAL)
+    # Use names with spaces too, since S3 URL-encodes them in its events.
+    keys = [f"passport photo {index}.jpg" for index in range(args.records)]
+
+    results = []
+    for concurrency in args.concurrency:
+        result = run_handler(handler_module, keys, concurrency, args)
+        results.append(result)
+        print(
+            f"concurrency {result['concurrency']:>3}: {result['records']} records in {result['seconds']:.2f}s "
+            f"({result['records_per_second']:.1f} records/s), {result['errors']} errors, "
+            f"{result['rekognition_calls']} DetectFaces calls, DynamoDB calls: {result['dynamodb_calls']}, "
+            f"median step latencies (ms): {result['step_milliseconds']}"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({"benchmark": "validation_lambda", "arguments": vars(args), "results": results}, output_file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+'''
+This is the runner of the benchmark suite of the Cloud Mania Passport Photo Validation App.
+It runs the benchmarks of this folder one after the other, with the arguments of a preset, and saves all their
+results in one JSON file, along with the environment of the run (git commit, Python version, platform):
+    - end_to_end: upload -> validate -> fetch through the pipeline of the app and the Lambda Functions of the
+      final template, at increasing numbers of photos (bench_end_to_end.py).
+    - validation_lambda: throughput of the validation Lambda Function by concurrency (bench_validation_lambda.py).
+    - bucket_purge: purge of the bucket at increasing sizes (bench_bucket_purge.py).
+    - stack_lifecycle: stack deploy and teardown orchestration (bench_stack_lifecycle.py).
+    - startup: startup time and import memory of the GUI app (bench_startup.py).
+With --compare, every metric of the run is compared with the same metric of a previous results file, and the
+metrics that changed by more than the threshold are reported as better or worse (the throughputs are better
+higher, everything else lower). The comparison is saved in the results file too.
+
+Example:
+    python run_benchmarks.py --preset quick --output results/new.json --compare results/baseline.json
+    python run_benchmarks.py --current results/new.json --compare results/baseline.json
+'''
+
+# Importing the argparse module to parse the command line arguments.
+import argparse
+# Importing the json module to read and write the results files.
+import json
+# Importing the os module to build the paths of the results.
+import os
+# Importing the platform module to record the environment of the run.
+import platform
+# Importing the subprocess module to get the git commit of the run.
+import subprocess
+# Importing the sys module to exit with the status of the comparison.
+import sys
+# Importing the tempfile module to collect the results of every benchmark.
+import tempfile
+# Importing the time module to time the benchmarks.
+import time
+# Importing the datetime module to timestamp the run.
+from datetime import datetime, timezone
+# Importing the benchmarks of the suite.
+import bench_bucket_purge
+import bench_end_to_end
+import bench_stack_lifecycle
+import bench_startup
+import bench_validation_lambda
+
+# Benchmarks of the suite, in the order they run.
+BENCHMARKS = {
+    "end_to_end": bench_end_to_end,
+    "validation_lambda": bench_validation_lambda,
+    "bucket_purge": bench_bucket_purge,
+    "stack_lifecycle": bench_stack_lifecycle,
+    "startup": bench_startup
+}
+
+# Arguments of every benchmark. "quick" takes about a minute, "full" several minutes.
+PRESETS = {
+    "quick": {
+        "end_to_end": ["--photos", "20", "100"],
+        "validation_lambda": ["--records", "50", "--concurrency", "1", "8"],
+        "bucket_purge": ["--sizes", "1000", "5000", "--versioned"],
+        "stack_lifecycle": ["--objects", "0", "1000"],
+        "startup": ["--runs", "2"]
+    },
+    "full": {
+        "end_to_end": ["--photos", "50", "200", "1000"],
+        "validation_lambda": ["--records", "200", "--concurrency", "1", "4", "8", "16"],
+        "bucket_purge": ["--sizes", "1000", "10000", "50000", "--versioned"],
+        "stack_lifecycle": ["--objects", "0", "1000", "10000", "--versioned"],
+        "startup": ["--runs", "5"]
+    }
+}
+
+# Keys that describe a run rather than measure it, left out of the comparisons.
+IGNORED_KEYS = {"arguments", "reports"}
+# Keys naming the entries of the result lists, so the same entries are compared between two runs.
+ENTRY_KEYS = ("mode", "name", "concurrency", "size", "photos", "objects")
+# Suffixes of the metrics that are better higher (every other metric is better lower).
+HIGHER_IS_BETTER = ("per_second",)
+# Default change (in percent) below which a metric is considered unchanged.
+DEFAULT_THRESHOLD_PERCENT = 10.0
+
+def parse_args(argv=None):
+    # Define the command line arguments.
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and compare its results with a previous run.")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick", help="Arguments of the benchmarks.")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=None, help="Benchmarks to run (defaults to all).")
+    parser.add_argument("--output", default="benchmark-results.json", help="JSON file the results are written to.")
+    parser.add_argument("--compare", default=None, help="Results file of a previous run to compare with.")
+    parser.add_argument("--current", default=None,
+                        help="Results file to compare with --compare instead of running the benchmarks.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD_PERCENT,
+                        help="Change (in percent) below which a metric is considered unchanged.")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="Exit with status 1 if a metric got worse by more than the threshold.")
+    return parser.parse_args(argv)
+
+def get_git_commit():
+    # Return the commit of the working tree, and whether it has uncommitted changes, if git is available.
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=directory, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain"], cwd=directory, capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+def get_environment():
+    # Describe the run, so two results files can be told apart.
+    commit, dirty = get_git_commit()
+    return {
+        "created_at": datetime.now(timezone.utc).replace(microsecond=0).isoformat(),
+        "git_commit": commit,
+        "git_dirty": dirty,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+
+def run_benchmark(name, argv):
+    # Run the benchmark with its own command line, and return the results it wrote.
+    with tempfile.TemporaryDirectory(prefix="cloudmania-bench-") as folder:
+        output_path = os.path.join(folder, f"{name}.json")
+        start_time = time.perf_counter()
+        BENCHMARKS[name].main(argv + ["--output", output_path])
+        seconds = time.perf_counter() - start_time
+        with open(output_path, 'r') as output_file:
+            results = json.load(output_file)
+    results["run_seconds"] = round(seconds, 3)
+    return results
+
+def flatten_metrics(value, prefix=""):
+    # Return {path: number} for every number of the results, e.g. "end_to_end.results[photos=100].seconds".
+    metrics = {}
+    if isinstance(value, dict):
+        for key, nested_value in value.items():
+            if key in IGNORED_KEYS or key in ENTRY_KEYS:
+                continue
+            metrics.update(flatten_metrics(nested_value, f"{prefix}.{key}" if prefix else key))
+    elif isinstance(value, list):
+        for index, nested_value in enumerate(value):
+            # Name the entry after its mode, size, ... rather than its position, which may change between runs.
+            label = next((f"{key}={nested_value[key]}" for key in ENTRY_KEYS
+                          if isinstance(nested_value, dict) and key in nested_value), str(index))
+            metrics.update(flatten_metrics(nested_value, f"{prefix}[{label}]"))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        metrics[prefix] = value
+    return metrics
+
+def compare_results(current, baseline, threshold=DEFAULT_THRESHOLD_PERCENT):
+    '''
+    Compares every metric of the current results with the same metric of the baseline results.
+    Returns the metrics that changed by at least threshold percent, with their verdict ("better" or "worse"),
+    the number of unchanged metrics, and the metrics only found in one of the two results.
+    '''
+    current_metrics = flatten_metrics(current["benchmarks"])
+    baseline_metrics = flatten_metrics(baseline["benchmarks"])
+    changes = []
+    unchanged = 0
+    for name in sorted(current_metrics.keys() & baseline_metrics.keys()):
+        before, after = baseline_metrics[name], current_metrics[name]
+        if before == after:
+            unchanged += 1
+            continue
+        # A metric that was zero has no relative change, so it always counts as changed.
+        change_percent = (after - before) / abs(before) * 100 if before else None
+        if change_percent is not None and abs(change_percent) < threshold:
+            unchanged += 1
+            continue
+        increased = after > before
+        better = increased if name.endswith(HIGHER_IS_BETTER) else not increased
+        changes.append({
+            "metric": name,
+            "baseline": before,
+            "current": after,
+            "change_percent": round(change_percent, 1) if change_percent is not None else None,
+            "verdict": "better" if better else "worse"
+        })
+    # Report the largest changes first.
+    changes.sort(key=lambda change: -abs(change["change_percent"]) if change["change_percent"] is not None else float("-inf"))
+    return {
+        "baseline": baseline.get("environment"),
+        "threshold_percent": threshold,
+        "changes": changes,
+        "unchanged": unchanged,
+        "only_in_baseline": sorted(baseline_metrics.keys() - current_metrics.keys()),
+        "only_in_current": sorted(current_metrics.keys() - baseline_metrics.keys())
+    }
+
+def print_comparison(comparison):
+    baseline = comparison["baseline"] or {}
+    print(f"\nCompared with {baseline.get('git_commit') or 'unknown commit'} ({baseline.get('created_at', 'unknown date')}), "
+          f"threshold {comparison['threshold_percent']:.0f}%:")
+    for change in comparison["changes"]:
+        percent = f"{change['change_percent']:+.1f}%" if change["change_percent"] is not None else "new"
+        print(f"  {change['verdict']:>6}  {change['metric']}: {change['baseline']} -> {change['current']} ({percent})")
+    worse = sum(1 for change in comparison["changes"] if change["verdict"] == "worse")
+    print(f"{len(comparison['changes'])} metrics changed ({worse} worse), {comparison['unchanged']} unchanged, "
+          f"{len(comparison['only_in_baseline'])} only in the baseline, {len(comparison['only_in_current'])} only in this run")
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.current:
+        # Compare two existing results files without running anything.
+        with open(args.current, 'r') as current_file:
+            suite = json.load(current_file)
+    else:
+        suite = {"suite": "cloudmania", "preset": args.preset, "environment": get_environment(), "benchmarks": {}}
+        for name in args.only or list(BENCHMARKS):
+            print(f"== {name}")
+            suite["benchmarks"][name] = run_benchmark(name, PRESETS[args.preset][name])
+
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        suite["comparison"] = compare_results(suite, baseline, args.threshold)
+        print_comparison(suite["comparison"])
+
+    if not args.current:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as output_file:
+            json.dump(suite, output_file, indent=2)
+        print(f"Results written to {args.output}")
+
+    # Let a CI job fail when a metric got worse.
+    if args.fail_on_regression and any(change["verdict"] == "worse" for change in suite.get("comparison", {}).get("changes", [])):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+'''
+I created this module to run the Lambda Functions of the CloudFormation templates locally.
+
+The code of every Lambda Function lives inline in its template (Code.ZipFile), so there is no separate file
+to import. load_lambda reads the code out of a template and executes it as a Python module, with the
+environment variables of the function set, so the handler can be called directly and its AWS clients can be
+swapped for the stand-ins of aws_stubs_module before it is called. No AWS call is made while loading.
+
+Functions in this module:
+- load_template: Returns a CloudFormation template as a dictionary, ignoring the intrinsic function tags.
+- get_lambda_code: Returns the inline code and the environment variables of a Lambda Function of a template.
+- load_lambda: Returns the code of a Lambda Function of a template executed as a module.
+'''
+
+# Import the os module to set the environment variables of the Lambda Functions.
+import os
+# Import the sys module to register the modules only available in the Lambda runtime.
+import sys
+# Import the types module to create the modules the Lambda code is executed in.
+import types
+# Import the yaml library to read the templates.
+import yaml
+# Import the AWS stubs module to stand in for the cfnresponse module.
+import aws_stubs_module as stubs
+
+# Directory of the CloudFormation templates.
+TEMPLATES_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "AWS-CF-Templates-Cloud-Mania-Passport-Photo-Screening"
+)
+# Final template, holding every Lambda Function of the application.
+FINAL_TEMPLATE = os.path.join(TEMPLATES_DIRECTORY, "07-cloud-mania-add-s3-deletion-function.yaml")
+# Region the AWS clients of the Lambda code are created in, when none is configured.
+DEFAULT_REGION = "us-east-1"
+
+class TemplateLoader(yaml.SafeLoader):
+    '''
+    YAML loader that accepts the CloudFormation intrinsic function tags (!Ref, !GetAtt, !Sub, ...).
+    '''
+
+# Load the tagged values as None, since only the inline code and the environment variables are needed.
+TemplateLoader.add_multi_constructor("!", lambda loader, tag_suffix, node: None)
+
+def load_template(template_path=FINAL_TEMPLATE):
+    # Read the template with the loader accepting the intrinsic function tags.
+    with open(template_path, 'r') as template_file:
+        return yaml.load(template_file, Loader=TemplateLoader)
+
+def get_lambda_code(logical_id, template_path=FINAL_TEMPLATE):
+    # Return the (code, environment variables) of the Lambda Function with the given logical ID.
+    properties = load_template(template_path)["Resources"][logical_id]["Properties"]
+    environment = properties.get("Environment", {}).get("Variables", {})
+    return properties["Code"]["ZipFile"], {name: str(value) for name, value in environment.items()}
+
+def load_lambda(logical_id, template_path=FINAL_TEMPLATE, environment=None):
+    '''
+    Returns the code of the Lambda Function executed as a module named after its logical ID.
+    The environment variables of the function (updated with the given ones) are set before the code runs.
+    '''
+    code, variables = get_lambda_code(logical_id, template_path)
+    variables.update(environment or {})
+    os.environ.update(variables)
+    # boto3 needs a region to create the clients of the Lambda code, even though they are never called.
+    os.environ.setdefault("AWS_DEFAULT_REGION", os.environ.get("AWS_REGION", DEFAULT_REGION))
+    # cfnresponse is only available in the Lambda runtime, so use the stand-in recording the responses.
+    sys.modules.setdefault("cfnresponse", stubs.cfnresponse)
+    module = types.ModuleType(logical_id)
+    module.__file__ = f"{template_path}#{logical_id}"
+    exec(compile(code, module.__file__, "exec"), module.__dict__)
+    return module